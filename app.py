@@ -1,6 +1,10 @@
+import os
+import time
+import datetime
+import threading
 import traceback
-from flask import render_template, request, redirect, url_for
-import logging.config
+from flask import render_template, request, redirect, url_for, jsonify, g
+import logging
 import pandas as pd
 import numpy as np
 
@@ -8,7 +12,17 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
 import config
-from src.predict import run_predict
+from src import metrics
+from src.log_config import configure_logging
+from src.predict import run_predict, run_predict_batch
+from src.model_registry import ArtifactError, get_artifacts
+from src.model_pool import ModelPool
+from src.prediction_cache import PredictionCache, run_predict_cached
+from src.write_behind import WriteBehindQueue
+from src.shadow import ShadowScorer
+from src.recent_listings import RecentListings
+from src.warmup import warm_up_model
+from src.listing_schema import ListingError
 from src.create_db import Listings
 
 
@@ -20,13 +34,107 @@ app.config.from_pyfile("config.py")
 
 # Define LOGGING_CONFIG in flask_config.py - path to config file for setting
 # up the logger (e.g. config/logging/local.conf)
-logging.config.fileConfig(app.config["LOGGING_CONFIG"])
+configure_logging(app.config["LOGGING_CONFIG"])
 logger = logging.getLogger(app.config["APP_NAME"])
 logger.debug("Test log")
 
 # Initialize the database
 db = SQLAlchemy(app)
 
+# Cache of predictions for recently submitted listings, emptied whenever the model artifacts change
+prediction_cache = PredictionCache(app.config["PREDICTION_CACHE_SIZE"])
+
+# Queue of new listings written to the database in batches by a background thread
+listings_writer = WriteBehindQueue(
+    lambda: db.get_engine(app),
+    Listings.__table__,
+    batch_size=app.config["WRITE_BEHIND_BATCH_SIZE"],
+    flush_seconds=app.config["WRITE_BEHIND_FLUSH_SECONDS"],
+    max_queue=app.config["WRITE_BEHIND_MAX_QUEUE"],
+)
+
+# Most recent listings shown on the page, kept in memory so that rendering does not query the database
+recent_listings = RecentListings(
+    lambda: db.get_engine(app), Listings.__table__, app.config["MAX_ROWS_SHOW"]
+)
+
+# Models of other cities and pull dates, loaded when a request first selects them
+model_pool = ModelPool(
+    app.config["MODEL_CONFIGS"],
+    config_dir=app.config["MODEL_CONFIG_DIR"],
+    max_bytes=app.config["MODEL_MEMORY_BUDGET"],
+    scan_seconds=app.config["MODEL_CONFIG_SCAN_SECONDS"],
+)
+
+# Scores /add listings with a candidate model in the background, to compare it with the served model
+shadow_scorer = None
+if app.config["SHADOW_CONFIG"]:
+    shadow_scorer = ShadowScorer(
+        lambda: get_artifacts(app.config["SHADOW_CONFIG"]),
+        workers=app.config["SHADOW_WORKERS"],
+        max_pending=app.config["SHADOW_MAX_PENDING"],
+        max_records=app.config["SHADOW_MAX_RECORDS"],
+    )
+
+# Set once `warm_up` has finished, reported by `/ready`
+ready = threading.Event()
+
+# Latency of the first request this process serves is logged, to compare with and without warm-up
+_first_request = threading.Lock()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Record the latency and status of every request for `/metrics`"""
+
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    if "request_start" in g:
+        elapsed = time.perf_counter() - g.request_start
+        metrics.observe("request_seconds", elapsed, endpoint=endpoint)
+        if _first_request.acquire(blocking=False):
+            logger.info(
+                "First request ({} {}) took {:.1f} ms.".format(
+                    request.method, endpoint, elapsed * 1000
+                )
+            )
+    metrics.inc(
+        "requests_total",
+        endpoint=endpoint,
+        method=request.method,
+        status=response.status_code,
+    )
+    return response
+
+
+def select_artifacts(city=None, version=None):
+    """Return the artifacts of the model a request selects with its `city` and `version` parameters
+
+    The default model (`CITY` at `PULL_DATE_STR`) is served from the process-wide registry, so that it is
+    preloaded and never evicted. Any other model is served from the model pool.
+
+    Args:
+        city (str, optional): city the model was trained for. Defaults to None (`CITY`).
+        version (str, optional): pull date of the training data. Defaults to None (the default model for `CITY`,
+            or the latest version for another city).
+
+    Returns:
+        :obj:`dict`: loaded model artifacts
+
+    Raises:
+        KeyError: if there is no model for the city and version
+        :class:`src.model_registry.ArtifactError`: if the model's artifacts cannot be loaded
+    """
+
+    city = city or app.config["CITY"]
+    if city == app.config["CITY"] and version in (None, app.config["PULL_DATE_STR"]):
+        return get_artifacts(app.config["YAML_CONFIG"])
+    return model_pool.get(city, version)
+
 
 @app.route("/")
 def index():
@@ -48,106 +156,302 @@ def add_entry():
     Returns: predicted number of reviews per month
     """
 
-    # Create the input dataframe
-    X = pd.DataFrame(
-        {
-            "host_since_years": float(request.form["host_since_years"]),
-            "host_response_time": request.form["host_response_time"],
-            "host_response_rate": float(request.form["host_response_rate"]),
-            "host_is_superhost": int(request.form["host_is_superhost"]),
-            "host_listings_count": int(request.form["host_listings_count"]),
-            "host_has_profile_pic": int(request.form["host_has_profile_pic"]),
-            "host_identity_verified": int(request.form["host_identity_verified"]),
-            "is_location_exact": int(request.form["is_location_exact"]),
-            "property_type_cat": request.form["property_type_cat"],
-            "room_type": request.form["room_type"],
-            "accommodates_cat": int(request.form["accommodates_cat"]),
-            "bathrooms_cat": int(request.form["bathrooms_cat"]),
-            "bedrooms_cat": int(request.form["bedrooms_cat"]),
-            "beds_cat": int(request.form["beds_cat"]),
-            "bed_type_cat": request.form["bed_type_cat"],
-            "amenities_count": int(request.form["amenities_count"]),
-            "price": float(request.form["price"]),
-            "security_deposit": float(request.form["security_deposit"]),
-            "cleaning_fee": float(request.form["cleaning_fee"]),
-            "guests_included_cat": int(request.form["guests_included_cat"]),
-            "extra_people_cat": int(request.form["extra_people_cat"]),
-            "neighbourhood_group": request.form["neighbourhood_group"],
-            "min_nights_cat": int(request.form["min_nights_cat"]),
-            "max_nights_cat": int(request.form["max_nights_cat"]),
-            "instant_bookable": int(request.form["instant_bookable"]),
-            "cancellation_policy": request.form["cancellation_policy"],
-            "require_guest_profile_picture": int(
-                request.form["require_guest_profile_picture"]
-            ),
-            "require_guest_phone_verification": int(
-                request.form["require_guest_phone_verification"]
-            ),
-        },
-        index=np.arange(0, 1),
-    )
+    try:
+        artifacts = select_artifacts(
+            request.values.get("city"), request.values.get("version")
+        )
+    except KeyError as e:
+        logger.warning("Rejected listing for unknown model: {}".format(e))
+        metrics.inc("errors_total", stage="add_model")
+        return render_template("error.html", result="Result not available"), 404
+    except ArtifactError as e:
+        logger.error("Unable to load the model, error page returned: {}".format(e))
+        metrics.inc("errors_total", stage="add_load")
+        return render_template("error.html", result="Result not available"), 503
+    except:
+        logger.error("Unable to load the model, error page returned.")
+        metrics.inc("errors_total", stage="add_load")
+        return render_template("error.html", result="Result not available"), 500
+
+    # Decode the form once, into both the model input and the database row
+    try:
+        listing = artifacts["schema"].decode(request.form)
+    except ListingError as e:
+        logger.warning("Rejected invalid listing: {}".format(e))
+        metrics.inc("errors_total", stage="add_decode")
+        return (
+            render_template("error.html", result="Invalid listing: {}".format(e)),
+            400,
+        )
+    X = artifacts["schema"].frame([listing])
 
     # Generate prediction result
     logger.info("Generating prediction.")
+    primary = artifacts is get_artifacts(app.config["YAML_CONFIG"])
+    timings = {}
     try:
-        result, perc = run_predict(X, modelconfig=config.YAML_CONFIG)
+        if primary:
+            result, perc = run_predict_cached(
+                X, artifacts, prediction_cache, timings=timings
+            )
+        else:
+            result, perc = run_predict(X, artifacts=artifacts)
     except:
         logger.error("Unable to generate a prediction, error page returned.")
+        metrics.inc("errors_total", stage="add_predict")
         return render_template("error.html", result="Result not available")
 
+    # Compare the default model with the candidate, after the response is computed and without waiting on it.
+    # Only the model call is timed, and a cached prediction has none, so its latency is left out of the comparison
+    if shadow_scorer is not None and primary and result is not None:
+        shadow_scorer.submit(X, result, timings.get("predict"))
+
     # Write user input to database
     try:
-        listing = Listings(
-            host_since_years=float(request.form["host_since_years"]),
-            host_response_time=request.form["host_response_time"],
-            host_response_rate=float(request.form["host_response_rate"]),
-            host_is_superhost=int(request.form["host_is_superhost"]),
-            host_listings_count=int(request.form["host_listings_count"]),
-            host_has_profile_pic=int(request.form["host_has_profile_pic"]),
-            host_identity_verified=int(request.form["host_identity_verified"]),
-            is_location_exact=int(request.form["is_location_exact"]),
-            property_type_cat=request.form["property_type_cat"],
-            room_type=request.form["room_type"],
-            accommodates_cat=int(request.form["accommodates_cat"]),
-            bathrooms_cat=int(request.form["bathrooms_cat"]),
-            bedrooms_cat=int(request.form["bedrooms_cat"]),
-            beds_cat=int(request.form["beds_cat"]),
-            bed_type_cat=request.form["bed_type_cat"],
-            amenities_count=int(request.form["amenities_count"]),
-            price=float(request.form["price"]),
-            security_deposit=float(request.form["security_deposit"]),
-            cleaning_fee=float(request.form["cleaning_fee"]),
-            guests_included_cat=int(request.form["guests_included_cat"]),
-            extra_people_cat=int(request.form["extra_people_cat"]),
-            neighbourhood_group=request.form["neighbourhood_group"],
-            min_nights_cat=int(request.form["min_nights_cat"]),
-            max_nights_cat=int(request.form["max_nights_cat"]),
-            instant_bookable=int(request.form["instant_bookable"]),
-            cancellation_policy=request.form["cancellation_policy"],
-            require_guest_profile_picture=int(
-                request.form["require_guest_profile_picture"]
-            ),
-            require_guest_phone_verification=int(
-                request.form["require_guest_phone_verification"]
-            ),
-            reviews_per_month=result,
-        )
-        db.session.add(listing)
-        db.session.commit()
-        logger.info("New listing added.")
-
-        # Query table results and expose info from last few user queries
-        query = db.session.query(Listings).limit(app.config["MAX_ROWS_SHOW"]).all()
+        listing["reviews_per_month"] = result
+        listing["created_at"] = datetime.datetime.utcnow()
+        with metrics.timer("db_write"):
+            if app.config["WRITE_BEHIND"] and listings_writer.put(listing):
+                logger.info("New listing queued.")
+            else:
+                db.session.add(Listings(**listing))
+                db.session.commit()
+                logger.info("New listing added.")
+        recent_listings.append(listing)
 
+        # Expose info from last few user queries
         return render_template(
-            "index.html", inputs=query, result=result, percentile=perc, scroll="result"
+            "index.html",
+            inputs=recent_listings.rows(),
+            result=result,
+            percentile=perc,
+            scroll="result",
         )
 
     except:
         traceback.print_exc()
         logger.warning("Not able to display prediction, error page returned")
+        metrics.inc("errors_total", stage="add_db_write")
         return render_template("error.html", result="Result not available")
 
 
+@app.route("/predict/batch", methods=["POST"])
+def predict_batch():
+    """View that scores a JSON array of listings in one vectorized pass
+
+    Expects a JSON body that is either an array of listings or an object with a `listings` array. Each listing
+    is an object with the same fields as the `/add` form. The model is selected by `city` and `version`, given
+    either as query parameters or in the JSON object.
+
+    Returns: JSON with `predictions` and `percentiles`, in the order of the input listings
+    """
+
+    body = request.get_json(silent=True)
+    listings = body.get("listings") if isinstance(body, dict) else body
+    if not isinstance(listings, list) or len(listings) == 0:
+        return jsonify(error="Expected a non-empty JSON array of listings."), 400
+
+    params = body if isinstance(body, dict) else request.args
+    try:
+        artifacts = select_artifacts(
+            params.get("city", request.args.get("city")),
+            params.get("version", request.args.get("version")),
+        )
+    except KeyError as e:
+        logger.warning("Rejected batch for unknown model: {}".format(e))
+        metrics.inc("errors_total", stage="batch_model")
+        return jsonify(error=str(e.args[0])), 404
+    except ArtifactError as e:
+        logger.error("Unable to load the model for batch: {}".format(e))
+        metrics.inc("errors_total", stage="batch_load")
+        return jsonify(error="Model not available"), 503
+    schema = artifacts["schema"]
+    try:
+        rows = [schema.decode(listing) for listing in listings]
+    except ListingError as e:
+        logger.warning("Rejected batch with invalid listing: {}".format(e))
+        metrics.inc("errors_total", stage="batch_decode")
+        return jsonify(error="Invalid listing: {}".format(e)), 400
+
+    logger.info("Generating predictions for {} listings.".format(len(rows)))
+    try:
+        preds, percs = run_predict_batch(schema.frame(rows), artifacts=artifacts)
+    except:
+        traceback.print_exc()
+        preds = None
+    if preds is None:
+        logger.error("Unable to generate predictions for batch.")
+        metrics.inc("errors_total", stage="batch_predict")
+        return jsonify(error="Result not available"), 500
+    preds = preds.tolist()
+    percs = percs.tolist() if percs is not None else [None] * len(preds)
+
+    # Write all listings to the database in a single bulk insert
+    try:
+        created_at = datetime.datetime.utcnow()
+        for row, pred in zip(rows, preds):
+            row["reviews_per_month"] = pred
+            row["created_at"] = created_at
+        with metrics.timer("db_write_batch"):
+            db.session.bulk_insert_mappings(Listings, rows)
+            db.session.commit()
+        logger.info("{} new listings added.".format(len(rows)))
+        for row in rows[-app.config["MAX_ROWS_SHOW"] :]:
+            recent_listings.append(row)
+    except:
+        traceback.print_exc()
+        db.session.rollback()
+        logger.warning("Not able to write batch of listings to the database.")
+        metrics.inc("errors_total", stage="batch_db_write")
+
+    return jsonify(predictions=preds, percentiles=percs)
+
+
+@app.route("/ready", methods=["GET"])
+def readiness():
+    """View that reports whether the app has finished warming up and can serve predictions at full speed
+
+    Returns: JSON with `ready`, with status 200 once warm-up has finished (or if it is disabled) and 503 before
+    """
+
+    if ready.is_set() or not app.config["WARMUP"]:
+        return jsonify(ready=True)
+    return jsonify(ready=False), 503
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """View that reports the size and hit/miss counters of the prediction cache
+
+    Returns: JSON with the prediction cache statistics
+    """
+
+    return jsonify(prediction_cache.stats())
+
+
+@app.route("/models/stats", methods=["GET"])
+def model_stats():
+    """View that reports the models resident in the model pool, their estimated sizes, and load/evict counters
+
+    Returns: JSON with the model pool statistics
+    """
+
+    return jsonify(model_pool.stats())
+
+
+@app.route("/shadow/stats", methods=["GET"])
+def shadow_stats():
+    """View that summarizes how the candidate model's predictions diverge from the served model's
+
+    Returns: JSON with the shadow scoring statistics, or status 404 if shadow scoring is disabled
+    """
+
+    if shadow_scorer is None:
+        return jsonify(error="Shadow scoring is disabled."), 404
+    return jsonify(shadow_scorer.stats())
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_text():
+    """View that exposes request counts, error counts, and per-stage latencies for Prometheus
+
+    Returns: metrics in the Prometheus text exposition format
+    """
+
+    return app.response_class(
+        metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def create_app(preload=False, **overrides):
+    """Configure the Flask application and optionally load everything it serves from before any request
+
+    With `preload`, the model artifacts (trained model object, encoder, scalers, percentile index, and
+    flattened trees) are loaded into the process-wide registry. A pre-forking server that calls this in its
+    master process (see `config/gunicorn.conf.py`) shares those objects copy-on-write with every worker
+    instead of loading one copy per worker.
+
+    Args:
+        preload (bool, optional): whether to load the model artifacts now. Defaults to False (first request).
+        **overrides: Flask configurations to set, e.g. `YAML_CONFIG`
+
+    Returns:
+        :class:`flask.Flask`: the configured application
+    """
+
+    app.config.update(overrides)
+    if preload:
+        logger.info(
+            "Preloading model artifacts from {}.".format(app.config["YAML_CONFIG"])
+        )
+        if app.config["WARMUP"]:
+            warm_up()
+        else:
+            get_artifacts(app.config["YAML_CONFIG"])
+    return app
+
+
+def warm_up():
+    """Initialize everything the first `/add` would otherwise pay for, then mark the app ready
+
+    Loads the model artifacts, scores synthetic listings built from the encoder's categories through every
+    prediction path, opens the first database connection while seeding the recent listings, and renders the page
+    template once. Failures are logged and do not stop the app from serving.
+
+    Returns:
+        float: seconds spent warming up
+    """
+
+    start = time.perf_counter()
+    try:
+        with metrics.timer("warmup"):
+            artifacts = get_artifacts(app.config["YAML_CONFIG"])
+            n_listings = warm_up_model(artifacts)
+            with app.app_context():
+                recent_listings.seed()
+            with app.test_request_context("/add", method="POST"):
+                render_template(
+                    "index.html",
+                    inputs=recent_listings.rows(),
+                    result=0.0,
+                    percentile=0.0,
+                    scroll="result",
+                )
+    except Exception:
+        traceback.print_exc()
+        logger.error("Warm-up did not finish, the first requests may be slow.")
+        metrics.inc("errors_total", stage="warmup")
+        n_listings = 0
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "Warmed up with {} synthetic listings in {:.1f} ms.".format(
+            n_listings, elapsed * 1000
+        )
+    )
+    ready.set()
+    return elapsed
+
+
+def reset_after_fork():
+    """Drop state that must not be shared with a forked worker process
+
+    Database connections opened by the master are discarded so that each worker opens its own, before serving
+    its first request if warm-up is enabled. The write-behind queue restarts its thread in the worker by itself.
+    """
+
+    with app.app_context():
+        db.engine.dispose()
+        if app.config["WARMUP"]:
+            try:
+                db.engine.connect().close()
+            except Exception as e:
+                logger.error("Could not connect to the database after fork.")
+                logger.error(e)
+
+
 if __name__ == "__main__":
+    # With the debug reloader, only the child process that serves requests warms up
+    if not app.config["DEBUG"] or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        create_app(preload=True)
     app.run(debug=app.config["DEBUG"], port=app.config["PORT"], host=app.config["HOST"])
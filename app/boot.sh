@@ -1,4 +1,10 @@
 #!/usr/bin/env bash
 
 python3 run.py create_db -t
-python3 app.py
\ No newline at end of file
+
+# APP_MODE=production serves with gunicorn, preloading the model in the master before forking the workers
+if [ "${APP_MODE}" = "production" ]; then
+    exec gunicorn -c config/gunicorn.conf.py wsgi:application
+else
+    python3 app.py
+fi
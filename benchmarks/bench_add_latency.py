@@ -0,0 +1,56 @@
+"""Compare `/add` latency with cold (re-read from disk) and warm (cached) model artifacts.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench_add_latency [--modelconfig config/modelconfig.yml] [--n 50]
+
+Without `--modelconfig`, the full tuned ensemble is trained on synthetic data first.
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from benchmarks.common import build_artifacts, listing_forms, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold vs. warm /add latency")
+    parser.add_argument("--modelconfig", default=None, help="Existing modelconfig with trained artifacts")
+    parser.add_argument("--n", type=int, default=50, help="Requests per scenario")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="airbnbchi-bench-")
+    modelconfig = args.modelconfig or build_artifacts(tmp_dir)
+
+    # Point the app at a throwaway SQLite database before it is imported
+    os.environ["SQLALCHEMY_DATABASE_URI"] = "sqlite:///{}".format(
+        os.path.join(tmp_dir, "bench.db")
+    )
+    from app import app
+    from src.create_db import create_db
+    from src.model_registry import invalidate_artifacts
+
+    create_db(os.environ["SQLALCHEMY_DATABASE_URI"])
+    app.config["YAML_CONFIG"] = modelconfig
+    client = app.test_client()
+    forms = listing_forms(args.n)
+
+    results = {}
+    for scenario in ["cold", "warm"]:
+        latencies = []
+        for form in forms:
+            if scenario == "cold":
+                invalidate_artifacts()
+            start = time.perf_counter()
+            response = client.post("/add", data=form)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+        results[scenario] = latencies
+
+    for scenario, latencies in results.items():
+        print("{:5s} /add  {}".format(scenario, summarize(latencies)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Load time and memory of the model artifacts: unpickled model, flattened model read into memory, and memory-mapped.
+
+Run from the root of the repository (Linux only, since memory is read from /proc):
+
+    python -m benchmarks.bench_artifact_load [--modelconfig config/modelconfig.yml] [--repeat 5]
+
+Each load runs in a fresh interpreter. Private memory is the growth in anonymous RSS, which no other process can
+share. Shared memory is the growth in file-backed RSS, i.e. pages of the artifact file that every process mapping
+the same file reads from the page cache. The memory-mapped load only faults in the pages that scoring touches, so
+it is measured after one prediction.
+"""
+import sys
+import json
+import argparse
+import subprocess
+import numpy as np
+import yaml
+
+from benchmarks.common import build_artifacts
+
+# Loads measured in a child interpreter, printing a JSON line with the load time and memory growth
+_CHILD = """
+import json, sys, time, pickle
+import numpy as np
+
+def memory_kb():
+    memory = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                memory[line.split(":")[0]] = int(line.split()[1])
+    return memory
+
+scenario, path, n_features = sys.argv[1], sys.argv[2], int(sys.argv[3])
+from src.tree_engine import FlatTreeEnsemble
+X = np.random.RandomState(423).rand(1, n_features)
+
+before = memory_kb()
+start = time.perf_counter()
+if scenario == "pickle":
+    with open(path, "rb") as f:
+        model = pickle.load(f)
+elif scenario == "npz":
+    model = FlatTreeEnsemble.load(path)
+else:
+    model = FlatTreeEnsemble.load(path, mmap_mode="r")
+load_seconds = time.perf_counter() - start
+model.predict(X)
+after = memory_kb()
+
+print(json.dumps({
+    "load_seconds": load_seconds,
+    "private_kb": after["RssAnon"] - before["RssAnon"],
+    "shared_kb": after["RssFile"] - before["RssFile"],
+}))
+"""
+
+
+def measure(scenario, path, n_features):
+    output = subprocess.run(
+        [sys.executable, "-c", _CHILD, scenario, path, str(n_features)],
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model artifact load time and memory")
+    parser.add_argument("--modelconfig", default=None, help="Existing modelconfig with trained artifacts")
+    parser.add_argument("--repeat", type=int, default=5, help="Loads per format")
+    args = parser.parse_args()
+
+    modelconfig = args.modelconfig or build_artifacts()
+    with open(modelconfig, "r") as f:
+        model_files = yaml.load(f, Loader=yaml.FullLoader)["model_files"]
+
+    from src.tree_engine import FlatTreeEnsemble
+
+    flat_file = model_files["MODEL_FILENAME_FLAT"]
+    n_features = len(FlatTreeEnsemble.load(flat_file).feature_names)
+
+    scenarios = {
+        "pickle (model.pkl)": ("pickle", model_files["MODEL_FILENAME_TMO"]),
+        "npz read (model-flat.npz)": ("npz", flat_file),
+        "npz mmap (model-flat.npz)": ("mmap", flat_file),
+    }
+    for name, (scenario, path) in scenarios.items():
+        results = [measure(scenario, path, n_features) for _ in range(args.repeat)]
+        print(
+            "{:27s} load {:9.3f} ms  private {:9.1f} MB  shared {:9.1f} MB".format(
+                name,
+                np.median([r["load_seconds"] for r in results]) * 1000,
+                np.median([r["private_kb"] for r in results]) / 1024,
+                np.median([r["shared_kb"] for r in results]) / 1024,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Import time of each `run.py` subcommand, measured with `python -X importtime`.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench_import_time [--repeat 5]
+
+Each measurement starts a new interpreter that imports `run.py` and then the module of one subcommand, which is
+everything the subcommand imports before it starts working. `test/test_run.py` checks the same imports so that
+heavy packages do not creep back into subcommands that do not need them.
+"""
+import sys
+import argparse
+import subprocess
+import numpy as np
+
+# Packages whose import dominates startup time
+HEAVY_PACKAGES = ["pandas", "sklearn", "scipy", "xgboost"]
+
+_CHILD = "import run; run.load_subcommand({!r})"
+
+
+def import_profile(subcommand):
+    """Import `run.py` and the module of a subcommand in a fresh interpreter
+
+    Args:
+        subcommand (str): name of the subcommand, a key of `run.SUBCOMMANDS`
+
+    Returns:
+        total (float): seconds spent importing, summed over imports not nested in other imports
+        packages (:obj:`dict`): cumulative import time in seconds of every top-level package imported, keyed by
+            package name
+    """
+
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD.format(subcommand)],
+        check=True,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    ).stderr
+
+    # Lines look like "import time:       123 |       4567 |   package.module", with nested imports indented further
+    total = 0.0
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        seconds = int(cumulative) / 1e6
+        if not name[1:].startswith(" "):
+            total += seconds
+        package = name.strip().split(".")[0]
+        packages[package] = max(packages.get(package, 0.0), seconds)
+    return total, packages
+
+
+def main():
+    import run
+
+    parser = argparse.ArgumentParser(description="Benchmark import time of each run.py subcommand")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per subcommand")
+    args = parser.parse_args()
+
+    for subcommand in run.SUBCOMMANDS:
+        profiles = [import_profile(subcommand) for _ in range(args.repeat)]
+        total = np.median([p[0] for p in profiles])
+        heavy = [p for p in HEAVY_PACKAGES if p in profiles[0][1]]
+        print(
+            "{:10s} import {:8.1f} ms  heavy packages: {}".format(
+                subcommand, total * 1000, ", ".join(heavy) or "none"
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
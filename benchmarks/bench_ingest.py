@@ -0,0 +1,130 @@
+"""Time and peak memory of ingesting a gzipped listings snapshot: buffered and parsed vs. streamed raw bytes.
+
+Run from the root of the repository (Linux only, since memory is read from /proc):
+
+    python -m benchmarks.bench_ingest [--sizes 50,200] [--chunk-size 1048576]
+
+For each size (in MB of uncompressed CSV), a synthetic snapshot is built by repeating the rows of
+`test/test_listings-raw.csv`, gzipped, and served over HTTP from a local server. Each ingest runs in a fresh
+interpreter. `buffered` is `import_data_from_source`, which holds the whole download in memory and parses the CSV
+into a dataframe before writing it back out. `streaming` is `stream_data_from_source`. Peak growth is the peak RSS
+of the interpreter minus its RSS once the ingest module is imported.
+"""
+import os
+import sys
+import gzip
+import json
+import shutil
+import argparse
+import tempfile
+import threading
+import functools
+import subprocess
+import http.server
+
+# Ingest measured in a child interpreter, printing a JSON line with the time and memory
+_CHILD = """
+import json, sys, time
+
+def memory_kb():
+    memory = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                memory[line.split(":")[0]] = int(line.split()[1])
+    return memory
+
+mode, url, output, chunk_size = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+import src.ingest_data as ingest_data
+
+before = memory_kb()
+start = time.perf_counter()
+if mode == "buffered":
+    ingest_data.import_data_from_source(url, "listings.csv.gz", sys.argv[5], output)
+else:
+    ingest_data.stream_data_from_source(url, output, chunk_size)
+seconds = time.perf_counter() - start
+after = memory_kb()
+
+print(json.dumps({"seconds": seconds, "peak_kb": after["VmHWM"], "growth_kb": after["VmHWM"] - before["VmRSS"]}))
+"""
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def write_snapshot(path, mb, source="test/test_listings-raw.csv"):
+    """Write a gzipped CSV of at least `mb` MB by repeating the data rows of `source`, returning its size in bytes"""
+
+    with open(source, "rb") as f:
+        header = f.readline()
+        rows = f.read()
+    if not rows.endswith(b"\n"):
+        rows += b"\n"
+    with gzip.open(path, "wb", compresslevel=1) as f:
+        f.write(header)
+        written = len(header)
+        while written < mb * 1e6:
+            f.write(rows)
+            written += len(rows)
+    return written
+
+
+def measure(mode, url, work_dir, chunk_size):
+    output = os.path.join(work_dir, "listings-{}.csv".format(mode))
+    result = subprocess.run(
+        [sys.executable, "-c", _CHILD, mode, url, output, str(chunk_size), work_dir],
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    ).stdout
+    os.remove(output)
+    return json.loads(result.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark buffered vs. streaming ingest")
+    parser.add_argument("--sizes", default="50,200", help="Comma separated uncompressed snapshot sizes in MB")
+    parser.add_argument("--chunk-size", type=int, default=1024 * 1024, help="Bytes read per chunk when streaming")
+    args = parser.parse_args()
+
+    serve_dir = tempfile.mkdtemp()
+    work_dir = tempfile.mkdtemp()
+    handler = functools.partial(QuietHandler, directory=serve_dir)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        print(
+            "{:>8s} {:>8s} {:>10s} {:>9s} {:>12s} {:>14s}".format(
+                "CSV MB", "gz MB", "mode", "seconds", "peak RSS MB", "peak growth MB"
+            )
+        )
+        for mb in [int(size) for size in args.sizes.split(",")]:
+            name = "listings-{}.csv.gz".format(mb)
+            csv_bytes = write_snapshot(os.path.join(serve_dir, name), mb)
+            gz_bytes = os.path.getsize(os.path.join(serve_dir, name))
+            url = "http://127.0.0.1:{}/{}".format(server.server_address[1], name)
+            for mode in ["buffered", "streaming"]:
+                result = measure(mode, url, work_dir, args.chunk_size)
+                print(
+                    "{:8.0f} {:8.1f} {:>10s} {:9.2f} {:12.1f} {:14.1f}".format(
+                        csv_bytes / 1e6,
+                        gz_bytes / 1e6,
+                        mode,
+                        result["seconds"],
+                        result["peak_kb"] / 1024,
+                        result["growth_kb"] / 1024,
+                    )
+                )
+    finally:
+        server.shutdown()
+        shutil.rmtree(serve_dir)
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Throughput of concurrent multi-source ingest with 1, 2, 4, and 8 workers.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench_ingest_sources [--sources 8] [--mb 20] [--mbps 10]
+
+Each source is a synthetic gzipped snapshot of `--mb` MB of uncompressed CSV (see `bench_ingest`), served by a
+local HTTP server that sends each response at most `--mbps` MB/s of compressed bytes, to stand in for the
+bandwidth of a single connection to the remote source. Sources are written to local partitions in a temporary
+directory, without a manifest, so every run downloads everything.
+"""
+import os
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import functools
+import http.server
+
+from benchmarks.bench_ingest import write_snapshot
+
+# Worker counts compared
+WORKERS = [1, 2, 4, 8]
+
+
+class ThrottledHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves files at most `mbps` MB/s per response"""
+
+    mbps = 10.0
+
+    def copyfile(self, source, outputfile):
+        chunk_size = 64 * 1024
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            time.sleep(len(chunk) / (self.mbps * 1e6))
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent multi-source ingest")
+    parser.add_argument("--sources", type=int, default=8, help="Number of sources")
+    parser.add_argument("--mb", type=int, default=20, help="Uncompressed size of each source in MB")
+    parser.add_argument("--mbps", type=float, default=10.0, help="Bandwidth of each response in MB/s")
+    args = parser.parse_args()
+
+    from src.ingest_data import ingest_sources
+
+    logging.disable(logging.WARNING)
+
+    serve_dir = tempfile.mkdtemp()
+    work_dir = tempfile.mkdtemp()
+    handler = functools.partial(
+        type("Handler", (ThrottledHandler,), {"mbps": args.mbps}), directory=serve_dir
+    )
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        sources = []
+        for i in range(args.sources):
+            name = "listings-{}.csv.gz".format(i)
+            write_snapshot(os.path.join(serve_dir, name), args.mb)
+            sources.append(
+                {
+                    "city": "city{}".format(i),
+                    "pull_date": "2019-11-21",
+                    "url": "http://127.0.0.1:{}/{}".format(server.server_address[1], name),
+                }
+            )
+        gz_mb = sum(os.path.getsize(os.path.join(serve_dir, f)) for f in os.listdir(serve_dir)) / 1e6
+
+        print("{} sources, {:.1f} MB compressed in total".format(args.sources, gz_mb))
+        print("{:>8s} {:>9s} {:>14s} {:>9s}".format("workers", "seconds", "sources/s", "CSV MB/s"))
+        for workers in WORKERS:
+            template = os.path.join(
+                work_dir, str(workers), "city={city}", "pull_date={pull_date}", "listings-raw.csv"
+            )
+            start = time.perf_counter()
+            results = ingest_sources(sources, None, template, workers=workers)
+            seconds = time.perf_counter() - start
+            assert all(r["status"] == "stored" for r in results)
+            print(
+                "{:8d} {:9.2f} {:14.2f} {:9.1f}".format(
+                    workers,
+                    seconds,
+                    len(sources) / seconds,
+                    sum(r["bytes"] for r in results) / 1e6 / seconds,
+                )
+            )
+            shutil.rmtree(os.path.join(work_dir, str(workers)))
+    finally:
+        server.shutdown()
+        shutil.rmtree(serve_dir)
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Size, latency, and accuracy of lite models over a grid of compression settings, to choose `lite_model_settings`.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench_lite_model [--modelconfig config/modelconfig.yml] [--n 500]
+
+Accuracy is measured on synthetic listings drawn with a different seed than the training data. Each row is a
+flattened model with at most `max_rounds` boosting rounds per boosted model and trees cut at `max_depth`, with
+float32 thresholds and values. The first row is the full flattened model.
+"""
+import time
+import math
+import logging
+import argparse
+import numpy as np
+
+from benchmarks.common import build_artifacts, synthesize_features
+
+# Compression settings compared against the full model
+MAX_ROUNDS = [None, 300, 150, 50]
+MAX_DEPTHS = [None, 12, 8, 5]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compression settings of the lite model")
+    parser.add_argument("--modelconfig", default=None, help="Existing modelconfig with trained artifacts")
+    parser.add_argument("--n", type=int, default=500, help="Single-listing predictions per model")
+    args = parser.parse_args()
+
+    modelconfig = args.modelconfig or build_artifacts()
+
+    from sklearn.metrics import r2_score
+    from src.model_registry import get_artifacts
+    from src.predict import prepare_input
+    from src.tree_engine import FlatTreeEnsemble
+
+    logging.disable(logging.WARNING)
+
+    artifacts = get_artifacts(modelconfig)
+    df = synthesize_features(5000, seed=7).dropna().reset_index(drop=True)
+    y = np.log(df.pop("reviews_per_month").values)
+    X = prepare_input(df, artifacts)
+
+    full = FlatTreeEnsemble.from_model(artifacts["model"])
+    full_pred = full.predict(X)
+    full_r2 = r2_score(y, full_pred)
+    full_rmse = math.sqrt(np.mean((full_pred - y) ** 2))
+
+    print(
+        "{:>10s} {:>9s} {:>6s} {:>10s} {:>10s} {:>10s} {:>10s} {:>12s}".format(
+            "max_rounds", "max_depth", "trees", "MB", "p50 ms", "R2 delta", "RMSE delta", "max |diff|"
+        )
+    )
+    for max_rounds in MAX_ROUNDS:
+        for max_depth in MAX_DEPTHS:
+            if max_rounds is None and max_depth is None:
+                model = full
+            else:
+                model = FlatTreeEnsemble.from_model(
+                    artifacts["model"], max_rounds=max_rounds, max_depth=max_depth, dtype="float32"
+                )
+            pred = model.predict(X)
+
+            latencies = []
+            for i in range(args.n):
+                row = X.iloc[[i % X.shape[0]]]
+                start = time.perf_counter()
+                model.predict(row)
+                latencies.append(time.perf_counter() - start)
+
+            print(
+                "{:>10s} {:>9s} {:6d} {:10.2f} {:10.3f} {:10.4f} {:10.4f} {:12.4f}".format(
+                    str(max_rounds or "all"),
+                    str(max_depth or "full"),
+                    model.n_trees,
+                    model.nbytes / 1e6,
+                    np.percentile(latencies, 50) * 1000,
+                    r2_score(y, pred) - full_r2,
+                    math.sqrt(np.mean((pred - y) ** 2)) - full_rmse,
+                    np.abs(pred - full_pred).max(),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
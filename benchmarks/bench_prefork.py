@@ -0,0 +1,189 @@
+"""Per-worker memory and throughput of the gunicorn production mode as the number of workers grows.
+
+Run from the root of the repository (Linux only, since memory is read from /proc):
+
+    python -m benchmarks.bench_prefork [--modelconfig config/modelconfig.yml] [--workers 1 2 4 8] [--seconds 10]
+
+For each worker count, gunicorn is started with `config/gunicorn.conf.py`, loaded with concurrent `/add` requests
+for `--seconds`, and the RSS and PSS of each worker are read from /proc. RSS counts shared pages in full in every
+process, PSS splits them between the processes sharing them, so with the model preloaded in the master the PSS of a
+worker is well below its RSS. Pass `--no-preload` to compare against every worker loading its own copy.
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.parse
+import urllib.request
+
+from benchmarks.common import build_artifacts, listing_forms
+
+
+def read_memory_kb(pid):
+    """Read the resident (RSS) and proportional (PSS) set size of a process
+
+    Args:
+        pid (int): process id
+
+    Returns:
+        tuple: (rss, pss) in kB. PSS is None if the kernel does not provide `smaps_rollup`.
+    """
+
+    rss = pss = None
+    with open("/proc/{}/status".format(pid), "r") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1])
+    try:
+        with open("/proc/{}/smaps_rollup".format(pid), "r") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return rss, pss
+
+
+def child_pids(pid):
+    """Return the ids of the direct children of a process, i.e. the gunicorn workers of a master"""
+
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(entry), "r") as f:
+                # The command name in field 2 may contain spaces, the parent id is the second field after it
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (FileNotFoundError, ProcessLookupError, IndexError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, proc, timeout=120):
+    start = time.time()
+    while time.time() - start < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError("gunicorn exited with code {}".format(proc.returncode))
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError("gunicorn did not start within {} seconds".format(timeout))
+
+
+def load(url, forms, seconds, concurrency):
+    """Post `/add` forms from `concurrency` threads for `seconds` seconds
+
+    Returns:
+        tuple: (completed requests, failed requests)
+    """
+
+    payloads = [urllib.parse.urlencode(form).encode() for form in forms]
+    counts = [[0, 0] for _ in range(concurrency)]
+    deadline = time.perf_counter() + seconds
+
+    def run(i):
+        j = i
+        while time.perf_counter() < deadline:
+            try:
+                with urllib.request.urlopen(url, data=payloads[j % len(payloads)], timeout=30) as response:
+                    response.read()
+                counts[i][0] += 1
+            except OSError:
+                counts[i][1] += 1
+            j += concurrency
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(c[0] for c in counts), sum(c[1] for c in counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-worker memory and throughput under gunicorn")
+    parser.add_argument("--modelconfig", default=None, help="Existing modelconfig with trained artifacts")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Worker counts to run")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of the load at each worker count")
+    parser.add_argument("--concurrency", type=int, default=None, help="Client threads. Defaults to 2 per worker.")
+    parser.add_argument("--no-preload", action="store_true", help="Load the model in every worker instead of the master")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="airbnbchi-bench-")
+    modelconfig = args.modelconfig or build_artifacts(tmp_dir)
+    database_uri = "sqlite:///{}".format(os.path.join(tmp_dir, "bench.db"))
+
+    from src.create_db import create_db
+
+    create_db(database_uri)
+    forms = listing_forms(500)
+
+    print("preload_app = {}".format(not args.no_preload))
+    print(
+        "{:>7s} {:>14s} {:>14s} {:>14s} {:>12s} {:>8s}".format(
+            "workers", "RSS/worker MB", "PSS/worker MB", "total PSS MB", "requests/s", "errors"
+        )
+    )
+    for n_workers in args.workers:
+        port = free_port()
+        env = dict(
+            os.environ,
+            PORT=str(port),
+            WEB_CONCURRENCY=str(n_workers),
+            GUNICORN_PRELOAD="false" if args.no_preload else "true",
+            YAML_CONFIG=modelconfig,
+            SQLALCHEMY_DATABASE_URI=database_uri,
+        )
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "config/gunicorn.conf.py", "wsgi:application"],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            base_url = "http://127.0.0.1:{}".format(port)
+            wait_until_up(base_url + "/cache/stats", proc)
+            concurrency = args.concurrency or 2 * n_workers
+
+            # Warm every worker up before measuring, so that lazily loaded artifacts are included in RSS
+            load(base_url + "/add", forms, 2.0, concurrency)
+            completed, failed = load(base_url + "/add", forms, args.seconds, concurrency)
+
+            workers = child_pids(proc.pid)
+            memory = [read_memory_kb(pid) for pid in workers]
+            master_pss = read_memory_kb(proc.pid)[1]
+            rss = sum(m[0] for m in memory) / len(memory) / 1024
+            if all(m[1] is not None for m in memory) and master_pss is not None:
+                pss = sum(m[1] for m in memory) / len(memory) / 1024
+                total = (sum(m[1] for m in memory) + master_pss) / 1024
+                pss, total = "{:14.1f}".format(pss), "{:14.1f}".format(total)
+            else:
+                pss = total = "{:>14s}".format("n/a")
+            print(
+                "{:7d} {:14.1f} {} {} {:12.1f} {:8d}".format(
+                    len(workers), rss, pss, total, completed / args.seconds, failed
+                )
+            )
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(30)
+
+
+if __name__ == "__main__":
+    main()
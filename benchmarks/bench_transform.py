@@ -0,0 +1,50 @@
+"""Per-request cost of transforming one listing: dataframe `transform_input` path vs. compiled fast path.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench_transform [--modelconfig config/modelconfig.yml] [--n 2000]
+"""
+import time
+import logging
+import argparse
+import pandas as pd
+
+from benchmarks.common import build_artifacts, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-row input transforms")
+    parser.add_argument("--modelconfig", default=None, help="Existing modelconfig with trained artifacts")
+    parser.add_argument("--n", type=int, default=2000, help="Transforms per path")
+    args = parser.parse_args()
+
+    modelconfig = args.modelconfig or build_artifacts()
+
+    from src.model_registry import get_artifacts
+    from src.predict import prepare_input
+
+    # Per-call debug/warning logs would dominate the measurement
+    logging.disable(logging.WARNING)
+
+    artifacts = get_artifacts(modelconfig)
+    transform = artifacts["transform"]
+    df = pd.read_csv("test/test_features.csv").drop(columns="reviews_per_month").dropna()
+    frames = [df.iloc[[i % df.shape[0]]].reset_index(drop=True) for i in range(args.n)]
+    rows = [frame.iloc[0].to_dict() for frame in frames]
+
+    paths = {
+        "transform_input (dataframe)": lambda i: prepare_input(frames[i].copy(), artifacts),
+        "transform_frame (compiled)": lambda i: transform.transform_frame(frames[i]),
+        "transform_row (compiled)": lambda i: transform.transform_row(rows[i]),
+    }
+    for name, func in paths.items():
+        latencies = []
+        for i in range(args.n):
+            start = time.perf_counter()
+            func(i)
+            latencies.append(time.perf_counter() - start)
+        print("{:28s} {}".format(name, summarize(latencies)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Latency and throughput of scoring transformed listings: sklearn `VotingRegressor.predict` vs. flattened trees.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench_tree_engine [--modelconfig config/modelconfig.yml] [--n 500]
+"""
+import time
+import logging
+import argparse
+import numpy as np
+
+from benchmarks.common import build_artifacts, synthesize_features, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the flattened tree engine")
+    parser.add_argument("--modelconfig", default=None, help="Existing modelconfig with trained artifacts")
+    parser.add_argument("--n", type=int, default=500, help="Single-listing predictions per engine")
+    args = parser.parse_args()
+
+    modelconfig = args.modelconfig or build_artifacts()
+
+    from src.model_registry import get_artifacts
+    from src.predict import prepare_input
+    from src.tree_engine import FlatTreeEnsemble
+
+    logging.disable(logging.WARNING)
+
+    artifacts = get_artifacts(modelconfig)
+    model = artifacts["model"]
+    flat = FlatTreeEnsemble.from_model(model)
+    print(
+        "Flattened {} trees, max depth {}, {:.1f} MB".format(
+            flat.n_trees, flat.max_depth, flat.nbytes / 1e6
+        )
+    )
+
+    df = synthesize_features(10000, seed=7).drop(columns="reviews_per_month").dropna()
+    X = prepare_input(df.reset_index(drop=True), artifacts)
+    diff = np.abs(flat.predict(X) - model.predict(X)).max()
+    print("Max absolute difference over {} listings: {:.2e}".format(X.shape[0], diff))
+
+    engines = {"sklearn": model, "flat": flat}
+    for name, engine in engines.items():
+        latencies = []
+        for i in range(args.n):
+            row = X.iloc[[i % X.shape[0]]]
+            start = time.perf_counter()
+            engine.predict(row)
+            latencies.append(time.perf_counter() - start)
+        print("1 listing   {:8s} {}".format(name, summarize(latencies)))
+
+    for batch_size in [8, 32, 128, 512, X.shape[0]]:
+        batch = X.iloc[:batch_size]
+        for name, engine in engines.items():
+            start = time.perf_counter()
+            engine.predict(batch)
+            elapsed = time.perf_counter() - start
+            print(
+                "{:5d} listings {:8s} {:10.0f} rows/sec".format(
+                    batch.shape[0], name, batch.shape[0] / elapsed
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
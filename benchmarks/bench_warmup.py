@@ -0,0 +1,79 @@
+"""Latency of the first `/add` served by a fresh process, with and without the startup warm-up.
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench_warmup [--modelconfig config/modelconfig.yml] [--repeat 5]
+
+Each run starts a new interpreter, imports the app, optionally warms it up, and then times its first and second
+`/add` requests.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+from benchmarks.common import build_artifacts, listing_forms
+
+# App startup measured in a child interpreter, printing a JSON line with the warm-up and request latencies
+_CHILD = """
+import json, sys, time
+warm, modelconfig, forms = sys.argv[1] == "warm", sys.argv[2], json.loads(sys.argv[3])
+import app as webapp
+
+webapp.app.config["YAML_CONFIG"] = modelconfig
+warmup_seconds = webapp.warm_up() if warm else 0.0
+client = webapp.app.test_client()
+latencies = []
+for form in forms:
+    start = time.perf_counter()
+    assert client.post("/add", data=form).status_code == 200
+    latencies.append(time.perf_counter() - start)
+print(json.dumps({"warmup_seconds": warmup_seconds, "first": latencies[0], "second": latencies[1]}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark first-request latency with and without warm-up")
+    parser.add_argument("--modelconfig", default=None, help="Existing modelconfig with trained artifacts")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per scenario")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="airbnbchi-bench-")
+    modelconfig = args.modelconfig or build_artifacts(tmp_dir)
+    env = dict(
+        os.environ,
+        SQLALCHEMY_DATABASE_URI="sqlite:///{}".format(os.path.join(tmp_dir, "bench.db")),
+    )
+
+    from src.create_db import create_db
+
+    create_db(env["SQLALCHEMY_DATABASE_URI"])
+    forms = json.dumps(listing_forms(2))
+
+    for scenario in ["cold", "warm"]:
+        results = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", _CHILD, scenario, modelconfig, forms],
+                check=True,
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        print(
+            "{:5s} warm-up {:9.1f} ms  first /add {:9.1f} ms  second /add {:9.1f} ms".format(
+                scenario,
+                np.median([r["warmup_seconds"] for r in results]) * 1000,
+                np.median([r["first"] for r in results]) * 1000,
+                np.median([r["second"] for r in results]) * 1000,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import os
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import yaml
+
+import config
+from src.train_model import run_train_model
+
+# Form fields that `app.add_entry` casts with `int`
+INT_FIELDS = [
+    "host_is_superhost",
+    "host_listings_count",
+    "host_has_profile_pic",
+    "host_identity_verified",
+    "is_location_exact",
+    "accommodates_cat",
+    "bathrooms_cat",
+    "bedrooms_cat",
+    "beds_cat",
+    "amenities_count",
+    "guests_included_cat",
+    "extra_people_cat",
+    "min_nights_cat",
+    "max_nights_cat",
+    "instant_bookable",
+    "require_guest_profile_picture",
+    "require_guest_phone_verification",
+]
+
+# Numeric features that get multiplicative noise when synthesizing a larger dataset
+NOISY_FIELDS = [
+    "host_since_years",
+    "host_listings_count",
+    "amenities_count",
+    "price",
+    "security_deposit",
+    "cleaning_fee",
+    "reviews_per_month",
+]
+
+
+def synthesize_features(n_rows, seed=423, source="test/test_features.csv"):
+    """Bootstrap the test features data up to `n_rows` rows, jittering numeric columns so trees grow to realistic size
+
+    Args:
+        n_rows (int): number of rows to generate
+        seed (int, optional): random seed. Defaults to 423.
+        source (str, optional): features file to resample. Defaults to "test/test_features.csv".
+
+    Returns:
+        :class:`pandas.DataFrame`: synthetic features data
+    """
+
+    rng = np.random.RandomState(seed)
+    df = pd.read_csv(source)
+    df = df.iloc[rng.randint(0, df.shape[0], n_rows)].reset_index(drop=True)
+    for col in NOISY_FIELDS:
+        df[col] = df[col] * rng.lognormal(0, 0.25, n_rows)
+    df["host_listings_count"] = df["host_listings_count"].round().astype(int)
+    df["amenities_count"] = df["amenities_count"].round().astype(int)
+    return df
+
+
+def build_artifacts(out_dir=None, n_rows=2000):
+    """Train the full tuned ensemble from `modelconfig.yml` on synthetic data and write its artifacts
+
+    Args:
+        out_dir (str, optional): folder to write the features, artifacts, and config to. Defaults to None (a new temp folder).
+        n_rows (int, optional): number of rows of synthetic training data. Defaults to 2000.
+
+    Returns:
+        str: location of the YAML config file pointing at the written artifacts
+    """
+
+    if out_dir is None:
+        out_dir = tempfile.mkdtemp(prefix="airbnbchi-bench-")
+    os.makedirs(out_dir, exist_ok=True)
+
+    features_file = os.path.join(out_dir, "features.csv")
+    synthesize_features(n_rows).to_csv(features_file, index=False)
+
+    with open(config.YAML_CONFIG, "r") as f:
+        modelconfig = yaml.load(f, Loader=yaml.FullLoader)
+    modelconfig["data_files"]["DATA_FILENAME_FEATURES"] = features_file
+    for key, filename in modelconfig["model_files"].items():
+        modelconfig["model_files"][key] = os.path.join(out_dir, filename.split("/")[-1])
+
+    config_file = os.path.join(out_dir, "modelconfig.yml")
+    with open(config_file, "w") as f:
+        yaml.dump(modelconfig, f)
+
+    args = argparse.Namespace(
+        config=config_file,
+        input=features_file,
+        output=None,
+        use_existing_params=True,
+        upload=False,
+        s3_bucket_name=None,
+    )
+    run_train_model(args)
+
+    return config_file
+
+
+def listing_forms(n, seed=423):
+    """Build `/add` form payloads from listings in the test features data
+
+    Args:
+        n (int): number of payloads
+        seed (int, optional): random seed. Defaults to 423.
+
+    Returns:
+        :obj:`list` of :obj:`dict`: form fields as strings, the way a browser submits them
+    """
+
+    df = pd.read_csv("test/test_features.csv").drop(columns="reviews_per_month")
+    df = df.dropna().sample(n, replace=True, random_state=seed)
+    forms = []
+    for _, row in df.iterrows():
+        form = {}
+        for col, value in row.items():
+            form[col] = str(int(value)) if col in INT_FIELDS else str(value)
+        forms.append(form)
+    return forms
+
+
+def summarize(latencies):
+    """Summarize a list of latencies in seconds as milliseconds
+
+    Returns:
+        str: mean / p50 / p95 / p99 summary
+    """
+
+    ms = np.array(latencies) * 1000
+    return "mean {:9.3f} ms  p50 {:9.3f} ms  p95 {:9.3f} ms  p99 {:9.3f} ms".format(
+        ms.mean(), np.percentile(ms, 50), np.percentile(ms, 95), np.percentile(ms, 99)
+    )
@@ -6,8 +6,10 @@ import datetime
 # Getting the parent directory of this file. That will function as the project home.
 HOME = pathlib.Path(sys.path[0])
 
-# YAML filepath
-YAML_CONFIG = HOME / "config" / "modelconfig.yml"
+# YAML filepath, can be overridden with the YAML_CONFIG environment variable
+YAML_CONFIG = pathlib.Path(
+    os.environ.get("YAML_CONFIG", HOME / "config" / "modelconfig.yml")
+)
 
 # Date indicating version of the file to be pulled
 YEAR = 2019
@@ -15,11 +17,14 @@ MONTH = 11
 DAY = 21
 PULL_DATE_STR = datetime.datetime(YEAR, MONTH, DAY).strftime("%Y-%m-%d")
 
-# Source data URL
-URL_LISTINGS = (
-    "http://data.insideairbnb.com/united-states/il/chicago/"
-    + PULL_DATE_STR
-    + "/data/listings.csv.gz"
+# City of the model served by default, and its state
+CITY = "chicago"
+STATE = "il"
+
+# Source data URL, for any state, city, and pull date, and for the default ones
+URL_LISTINGS_TEMPLATE = "http://data.insideairbnb.com/united-states/{state}/{city}/{pull_date}/data/listings.csv.gz"
+URL_LISTINGS = URL_LISTINGS_TEMPLATE.format(
+    state=STATE, city=CITY, pull_date=PULL_DATE_STR
 )
 
 # Local filepaths
@@ -64,3 +69,17 @@ HOST = "0.0.0.0"
 SQLALCHEMY_TRACK_MODIFICATIONS = True
 SQLALCHEMY_ECHO = False  # If true, SQL for queries made will be printed
 MAX_ROWS_SHOW = 10
+PREDICTION_CACHE_SIZE = 4096  # Most recent single-listing predictions kept in memory, 0 to disable
+WRITE_BEHIND = True  # If true, /add queues new listings and a background thread inserts them in batches
+WRITE_BEHIND_BATCH_SIZE = 500  # Most listings written per insert
+WRITE_BEHIND_FLUSH_SECONDS = 1.0  # Longest time a queued listing waits before being written
+WRITE_BEHIND_MAX_QUEUE = 10000  # Most queued listings before /add falls back to writing synchronously
+MODEL_CONFIG_DIR = HOME / "config" / "models"  # Modelconfigs of other models, as <city>/<version>.yml
+MODEL_CONFIG_SCAN_SECONDS = 60.0  # Longest time the models found in MODEL_CONFIG_DIR are reused before listing it again
+MODEL_CONFIGS = {}  # Other modelconfig locations keyed by (city, version), in addition to MODEL_CONFIG_DIR
+MODEL_MEMORY_BUDGET = 2 * 1024 ** 3  # Bytes of other models kept loaded before the least recently used is evicted
+SHADOW_CONFIG = os.environ.get("SHADOW_CONFIG")  # Modelconfig of a candidate model scored alongside /add, None to disable
+SHADOW_WORKERS = 1  # Threads scoring listings with the candidate model
+SHADOW_MAX_PENDING = 1000  # Most listings waiting to be shadow scored before more are dropped
+SHADOW_MAX_RECORDS = 10000  # Most recent primary vs. candidate comparisons kept for /shadow/stats
+WARMUP = True  # If true, preloading the app also scores synthetic listings and connects to the database before serving
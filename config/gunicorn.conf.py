@@ -0,0 +1,33 @@
+# Gunicorn configurations for serving the Flask app in production mode (see app/boot.sh)
+#
+#   gunicorn -c config/gunicorn.conf.py wsgi:application
+#
+# The app and model artifacts are loaded once in the master process and shared copy-on-write with the
+# forked workers. Settings can be overridden with environment variables or gunicorn command line flags.
+import gc
+import os
+import multiprocessing
+
+bind = "0.0.0.0:{}".format(os.environ.get("PORT", "5000"))
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+
+# Import wsgi.py (and load the model artifacts) in the master before forking. GUNICORN_PRELOAD=false loads
+# them separately in every worker instead, e.g. to compare memory use
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() != "false"
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the garbage collector's generations. Otherwise the first
+    # collection in each worker writes to the header of every preloaded object and un-shares its page.
+    # gc.freeze is available from Python 3.7
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+        server.log.info("Froze {} preloaded objects.".format(gc.get_freeze_count()))
+
+
+def post_fork(server, worker):
+    from app import reset_after_fork
+
+    reset_after_fork()
@@ -1,17 +1,38 @@
 import argparse
+import importlib
 import logging
-import logging.config
 
 import config
-from src.ingest_data import run_ingest_data
-from src.clean_data import run_clean_data
-from src.generate_features import run_generate_features
-from src.create_db import run_create_db
-from src.train_model import run_train_model
+from src.log_config import configure_logging
 
-logging.config.fileConfig(config.LOGGING_CONFIG, disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
+# Function that runs each subcommand, as "module:function". A module is only imported when its subcommand runs, so
+# that e.g. `create_db` does not pay for importing pandas, scikit-learn, and XGBoost
+SUBCOMMANDS = {
+    "create_db": "src.create_db:run_create_db",
+    "ingest": "src.ingest_data:run_ingest_data",
+    "clean": "src.clean_data:run_clean_data",
+    "features": "src.generate_features:run_generate_features",
+    "train": "src.train_model:run_train_model",
+    "score": "src.score:run_score",
+}
+
+
+def load_subcommand(name):
+    """Import the module of a subcommand and return the function that runs it
+
+    Args:
+        name (str): name of the subcommand, a key of `SUBCOMMANDS`
+
+    Returns:
+        callable: function that takes the parsed arguments of the subcommand
+    """
+
+    module_name, func_name = SUBCOMMANDS[name].split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
 if __name__ == "__main__":
 
     # Add parsers for all functions in the pipeline and creating the database
@@ -42,7 +63,7 @@ if __name__ == "__main__":
         default=config.SQLALCHEMY_DATABASE_URI,
         help="Engine string to create the SQL database.",
     )
-    sb_create_db.set_defaults(func=run_create_db)
+    sb_create_db.set_defaults(command="create_db")
 
     # Sub-parser for ingesting data from source
     sb_ingest = subparsers.add_parser(
@@ -57,7 +78,7 @@ if __name__ == "__main__":
     sb_ingest.add_argument(
         "--url", "-u", default=config.URL_LISTINGS, help="URL of source data"
     )
-    sb_ingest.set_defaults(func=run_ingest_data)
+    sb_ingest.set_defaults(command="ingest")
     sb_ingest.add_argument(
         "--s3_bucket_name",
         default=config.S3_BUCKET,
@@ -68,6 +89,27 @@ if __name__ == "__main__":
         default=config.DATA_PATH,
         help="Location of the data folder on local where the raw file will be downloaded. Must be a file path.",
     )
+    sb_ingest.add_argument(
+        "--sources",
+        default=None,
+        help="YAML file of (city, pull_date) sources to ingest concurrently instead of --url, e.g. config/ingest_sources.yml.",
+    )
+    sb_ingest.add_argument(
+        "--url_template",
+        default=config.URL_LISTINGS_TEMPLATE,
+        help="URL of a source in --sources, with {state}, {city}, and {pull_date} fields.",
+    )
+    sb_ingest.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Most sources in --sources fetched at once. Defaults to WORKERS in the config file.",
+    )
+    sb_ingest.add_argument(
+        "--output_dir",
+        default=None,
+        help="Local directory to write the raw data of --sources to instead of the S3 bucket.",
+    )
 
     # Sub-parser for cleaning data
     sb_clean = subparsers.add_parser(
@@ -103,7 +145,7 @@ if __name__ == "__main__":
         type=bool,
         help="Specifies whether to retain raw data file on the local filesystem.",
     )
-    sb_clean.set_defaults(func=run_clean_data)
+    sb_clean.set_defaults(command="clean")
 
     # Sub-parser for generating features
     sb_features = subparsers.add_parser(
@@ -134,7 +176,7 @@ if __name__ == "__main__":
         default=config.PULL_DATE_STR,
         help="As of date denoting the version of the dataset that was pulled from source.",
     )
-    sb_features.set_defaults(func=run_generate_features)
+    sb_features.set_defaults(command="features")
 
     # Sub-parser for training model
     sb_train = subparsers.add_parser(
@@ -177,7 +219,48 @@ if __name__ == "__main__":
         default=config.S3_BUCKET,
         help="Name of the S3 bucket to upload model artifacts to.",
     )
-    sb_train.set_defaults(func=run_train_model)
+    sb_train.set_defaults(command="train")
+
+    # Sub-parser for bulk scoring listings
+    sb_score = subparsers.add_parser(
+        "score",
+        description="Scores a CSV file of listings with the trained model and writes predictions to CSV.",
+    )
+    sb_score.add_argument(
+        "--config",
+        "-c",
+        default=config.YAML_CONFIG,
+        help="Location of YAML file containing configurations for running model pipeline.",
+    )
+    sb_score.add_argument(
+        "--input",
+        "-i",
+        required=True,
+        help="File name of the listings CSV file to score. Must be a file name.",
+    )
+    sb_score.add_argument(
+        "--output",
+        "-o",
+        required=True,
+        help="File name to save the scored listings CSV file. Must be a file name.",
+    )
+    sb_score.add_argument(
+        "--chunksize",
+        default=10000,
+        type=int,
+        help="Number of listings read and scored at a time. Bounds memory use regardless of input size.",
+    )
+    sb_score.add_argument(
+        "--n_jobs",
+        "-n",
+        default=None,
+        type=int,
+        help="Number of worker processes to score chunks with. Defaults to the number of CPUs.",
+    )
+    sb_score.set_defaults(command="score")
 
     args = parser.parse_args()
-    args.func(args)
+    if "command" not in args:
+        parser.error("a subcommand is required")
+    configure_logging()
+    load_subcommand(args.command)(args)
@@ -5,15 +5,12 @@ import pandas as pd
 import re
 import boto3
 import logging
-import logging.config
-import yaml
 
 from botocore.exceptions import ClientError
 
-import config
-from src.helpers import read_from_s3
+from src.storage import open_storage
+from src.model_config import load_config
 
-logging.config.fileConfig(config.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
 
@@ -32,13 +29,13 @@ def run_clean_data(args):
     logger.info("Reading in configs from modelconfig.yml.")
     try:
         # Load configs from yml file
-        with open(args.config, "r") as f:
-            config = yaml.load(f, Loader=yaml.FullLoader)
-            s3_objects = config["s3_objects"]
-            data_files = config["data_files"]
-            listing_dtypes = config["clean_data"]["LISTING_DTYPES"]
-            drop_cols = config["clean_data"]["DROP_COLS"]
-            target_col = config["TARGET_COL"]
+        config = load_config(args.config)
+        s3_objects = config.s3_objects
+        data_files = config.data_files
+        listing_dtypes = config.listing_dtypes
+        drop_cols = config.drop_cols
+        target_col = config.target_col
+        storage = open_storage(config, args.s3_bucket_name)
     except KeyError:
         logger.error(
             "Encountered error when assigning variable from configurations file."
@@ -48,17 +45,33 @@ def run_clean_data(args):
         logger.error("Encountered error in reading in the configurations file.")
         sys.exit(1)
 
-    # If input raw data file not specified, download from S3
-    if args.input is None:
-        logger.info("Fetching raw data from S3 bucket {}.".format(args.s3_bucket_name))
-        read_from_s3(
-            s3_objects["S3_OBJECT_DATA_RAW"],
-            args.s3_bucket_name,
-            data_files["DATA_FILENAME_RAW"],
-        )
-        raw_file = data_files["DATA_FILENAME_RAW"]
-    else:
-        raw_file = args.input
+    # If input raw data file not specified, fetch it from storage. Unless it is kept, it is parsed as it is read,
+    # from the local copy if the raw data was ingested on this machine.
+    stream_raw = args.input is None and args.keep_raw == False
+    try:
+        if stream_raw:
+            logger.info(
+                "Reading raw data from {}.".format(
+                    storage.uri(s3_objects["S3_OBJECT_DATA_RAW"])
+                )
+            )
+            raw_file = storage.open(s3_objects["S3_OBJECT_DATA_RAW"])
+        elif args.input is None:
+            logger.info(
+                "Fetching raw data from {}.".format(
+                    storage.uri(s3_objects["S3_OBJECT_DATA_RAW"])
+                )
+            )
+            storage.get_file(
+                s3_objects["S3_OBJECT_DATA_RAW"], data_files["DATA_FILENAME_RAW"]
+            )
+            raw_file = data_files["DATA_FILENAME_RAW"]
+        else:
+            raw_file = args.input
+    except IOError as e:
+        logger.error("Encountered error in fetching the raw data.")
+        logger.error(e)
+        sys.exit(1)
 
     # Read in raw data and neighbourhood mapping file from CSV
     logger.info("Reading in raw data and neighbourhoods CSV files.")
@@ -72,6 +85,9 @@ def run_clean_data(args):
     except (FileNotFoundError, IOError):
         logger.error("Encountered error in reading in the raw data CSV file.")
         sys.exit(1)
+    finally:
+        if stream_raw:
+            raw_file.close()
     try:
         df_neighbourhood = pd.read_csv(data_files["DATA_FILENAME_NEIGHBORHOOD"])
     except (FileNotFoundError, IOError):
@@ -98,10 +114,8 @@ def run_clean_data(args):
         df.to_csv(args.output, index=False)
         logger.info("Exported cleaned data file to {}".format(args.output))
 
-    # Remove raw data from local if specified
-    if args.input is None and args.keep_raw == False:
-        logger.info("Removing raw data file {}".format(raw_file))
-        os.remove(raw_file)
+    if args.input is None:
+        storage.report("clean")
 
 
 def map_neighbourhoods(df, df_neighbourhood):
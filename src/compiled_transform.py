@@ -0,0 +1,172 @@
+import threading
+import logging
+import numpy as np
+import pandas as pd
+
+from src.tree_engine import FlatTreeEnsemble
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledTransform:
+    """Single-row equivalent of :func:`src.predict.transform_input` that writes straight into a float vector
+
+    The encoder categories and scaler parameters are resolved once into a fixed column-index layout, so
+    transforming a listing is a loop over its fields instead of building, joining, and reindexing dataframes.
+    The output matches :func:`src.predict.transform_input` exactly, in the same column order.
+
+    Args:
+        enc (:class:`sklearn.preprocessing.OneHotEncoder`): encoder to transform categorical variables
+        scalers (:obj:`list`: [:class:`sklearn.preprocessing.StandardScaler`, :class:`sklearn.preprocessing.MinMAxScaler`]):
+            scaler objects to transform numeric variables
+        input_cols (:obj:`list`): names of the input features, in the order of the input dataframe
+        cols_std (:obj:`list`): list of columns to standardize
+        cols_minmax (:obj:`list`): list of columns to standardize using minmax scaler
+        cols_enc (:obj:`list`): list of columns to one-hot encode
+    """
+
+    def __init__(self, enc, scalers, input_cols, cols_std, cols_minmax, cols_enc):
+        self.input_cols = list(input_cols)
+        passthrough = [col for col in self.input_cols if col not in cols_enc]
+        self.columns = passthrough + list(enc.get_feature_names(cols_enc))
+        self.n_features = len(self.columns)
+        self._enc_start = len(passthrough)
+
+        # (output index, input column, shift, scale) steps so each value is computed the way the scalers do
+        stdscaler, minmaxscaler = scalers
+        std_scale = (
+            stdscaler.scale_ if stdscaler.scale_ is not None else [1.0] * len(cols_std)
+        )
+        std_mean = (
+            stdscaler.mean_ if stdscaler.mean_ is not None else [0.0] * len(cols_std)
+        )
+        std = {
+            col: (float(std_mean[i]), float(std_scale[i]))
+            for i, col in enumerate(cols_std)
+        }
+        minmax = {
+            col: (float(minmaxscaler.scale_[i]), float(minmaxscaler.min_[i]))
+            for i, col in enumerate(cols_minmax)
+        }
+        self._copy = []
+        self._std = []
+        self._minmax = []
+        for i, col in enumerate(passthrough):
+            if col in std:
+                self._std.append((i,) + (col,) + std[col])
+            elif col in minmax:
+                self._minmax.append((i,) + (col,) + minmax[col])
+            else:
+                self._copy.append((i, col))
+
+        # Category -> output index for each encoded column; dropped categories map to None
+        self._enc = []
+        offset = self._enc_start
+        for j, col in enumerate(cols_enc):
+            categories = enc.categories_[j].tolist()
+            dropped = None
+            if getattr(enc, "drop_idx_", None) is not None:
+                dropped = enc.drop_idx_[j]
+            lookup = {}
+            for k, category in enumerate(categories):
+                if dropped is not None and k == dropped:
+                    lookup[category] = None
+                else:
+                    lookup[category] = offset
+                    offset += 1
+            self._enc.append((col, lookup))
+
+        self._local = threading.local()
+
+    def accepts(self, columns):
+        """Whether a dataframe with `columns` can take the compiled path"""
+
+        return list(columns) == self.input_cols
+
+    def transform_row(self, row, out=None):
+        """Transform one listing into the model's feature vector
+
+        Args:
+            row (:obj:`dict`): listing fields, keyed by input column name
+            out (:class:`numpy.ndarray`, optional): float vector to fill. Defaults to None (a buffer reused by
+                every call on the current thread, so the result must be used before the next call).
+
+        Returns:
+            :class:`numpy.ndarray`: transformed features, in the order of `columns`
+        """
+
+        if out is None:
+            out = getattr(self._local, "out", None)
+            if out is None:
+                out = self._local.out = np.empty(self.n_features, dtype=np.float64)
+
+        for i, col in self._copy:
+            out[i] = row[col]
+        for i, col, mean, scale in self._std:
+            out[i] = (row[col] - mean) / scale
+        for i, col, scale, minimum in self._minmax:
+            out[i] = row[col] * scale + minimum
+
+        out[self._enc_start :] = 0.0
+        for col, lookup in self._enc:
+            try:
+                i = lookup[row[col]]
+            except KeyError:
+                raise ValueError(
+                    "Found unknown category {!r} in column {}.".format(row[col], col)
+                )
+            if i is not None:
+                out[i] = 1.0
+
+        return out
+
+    def transform_frame(self, X):
+        """Transform a one-row input dataframe into a one-row dataframe matching :func:`src.predict.transform_input`"""
+
+        out = self.transform_row(X.iloc[0].to_dict())
+        return pd.DataFrame(out[np.newaxis, :], columns=self.columns, copy=True)
+
+    def transform_for(self, X, model):
+        """Transform a one-row input dataframe into the input `model` scores
+
+        The flat engine takes the feature vector itself when its features are in :attr:`columns` order, so only
+        other models pay for the one-row dataframe of :meth:`transform_frame`. The vector is this thread's
+        reused buffer, valid until its next transform.
+
+        Args:
+            X (:class:`pandas.DataFrame`): dataframe containing one listing, in :attr:`input_cols` order
+            model (obj): model the transformed listing is passed to
+
+        Returns:
+            :class:`numpy.ndarray` or :class:`pandas.DataFrame`: transformed listing
+        """
+
+        if isinstance(model, FlatTreeEnsemble) and model.feature_names == self.columns:
+            return self.transform_row(X.iloc[0].to_dict())
+        return self.transform_frame(X)
+
+
+def compile_transform(artifacts):
+    """Compile the encoder and scalers of a loaded artifact set into a :class:`CompiledTransform`
+
+    Args:
+        artifacts (:obj:`dict`): loaded artifacts from :mod:`src.model_registry`
+
+    Returns:
+        :class:`CompiledTransform`: compiled transform, or None if the artifacts could not be compiled
+    """
+
+    config = artifacts["config"]
+    try:
+        return CompiledTransform(
+            artifacts["encoder"],
+            artifacts["scalers"],
+            config.select_features,
+            config.cols_num_std,
+            config.cols_num_minmax,
+            config.cols_cat,
+        )
+    except Exception as e:
+        logger.warning("Could not compile single-row transform, using dataframe path.")
+        logger.warning(e)
+        return None
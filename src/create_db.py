@@ -1,15 +1,12 @@
 import os
+import datetime
 import logging
-import logging.config
 import sqlalchemy as sql
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, Integer, String, DateTime, Numeric, Boolean
 import yaml
 
-import config
-
-logging.config.fileConfig(config.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
 Base = declarative_base()
@@ -50,6 +47,13 @@ class Listings(Base):
     require_guest_profile_picture = Column(Boolean, unique=False, nullable=True)
     require_guest_phone_verification = Column(Boolean, unique=False, nullable=True)
     reviews_per_month = Column(Numeric, unique=False, nullable=True)
+    created_at = Column(
+        DateTime,
+        unique=False,
+        nullable=True,
+        index=True,
+        default=datetime.datetime.utcnow,
+    )
 
     def __repr__(self):
         return "<Listings %r>" % self.id
@@ -96,6 +100,7 @@ def create_db(engine_string):
 
     # Create Listings database
     Base.metadata.create_all(engine)
+    _add_created_at(engine)
 
     # Create session
     Session = sessionmaker(bind=engine)
@@ -105,6 +110,25 @@ def create_db(engine_string):
     logger.info("listings table created.")
 
 
+def _add_created_at(engine):
+    """Adds the indexed `created_at` column to a listings table created before the column existed."""
+
+    columns = [c["name"] for c in sql.inspect(engine).get_columns("listings")]
+    if "created_at" in columns:
+        return
+
+    logger.info("Adding created_at column and index to listings table.")
+    column = Listings.__table__.c.created_at
+    with engine.begin() as conn:
+        conn.execute(
+            "ALTER TABLE listings ADD COLUMN created_at {}".format(
+                column.type.compile(dialect=engine.dialect)
+            )
+        )
+    for index in Listings.__table__.indexes:
+        index.create(engine)
+
+
 def _truncate_listings(engine_string):
     """Deletes listings table if rerunning and run into unique key error."""
 
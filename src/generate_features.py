@@ -5,15 +5,12 @@ import numpy as np
 import datetime
 from datetime import date, datetime, timedelta
 import logging
-import logging.config
-import yaml
 
-import config
+from src.model_config import load_config
 
 # Options
 pd.options.mode.chained_assignment = None
 
-logging.config.fileConfig(config.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
 
@@ -31,12 +28,11 @@ def run_generate_features(args):
     logger.info("Reading in configs from modelconfig.yml.")
     try:
         # Load in configs from yml file
-        with open(args.config, "r") as f:
-            config = yaml.load(f, Loader=yaml.FullLoader)
-            data_files = config["data_files"]
-            TARGET_COL = config["TARGET_COL"]
-            COLS_BOOL = config["generate_features"]["COLS_BOOL"]
-            SELECT_FEATURES = config["generate_features"]["SELECT_FEATURES"]
+        config = load_config(args.config)
+        data_files = config.data_files
+        TARGET_COL = config.target_col
+        COLS_BOOL = config.cols_bool
+        SELECT_FEATURES = config.select_features
     except KeyError:
         logger.error(
             "Encountered error when assigning variable from configurations file."
@@ -1,15 +1,68 @@
+import io
+import os
+import threading
 import logging
-import logging.config
 import boto3
-import pandas as pd
 
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
-import config
-
-logging.config.fileConfig(config.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
+# S3 client of this process, keyed by the process ID and endpoint it was created for
+_S3_CLIENTS = {}
+_S3_LOCK = threading.Lock()
+
+# Default multipart threshold and part size of S3 transfers, in bytes
+_PART_SIZE = 8 * 1024 ** 2
+
+
+def get_s3_client():
+    """Return the S3 client of this process, creating it on first use
+
+    Clients are thread-safe and keep a pool of HTTPS connections, so every transfer reuses one client instead of
+    creating its own. A forked process creates its own client. The endpoint can be set with the `S3_ENDPOINT_URL`
+    environment variable, e.g. for an S3-compatible store.
+
+    Returns:
+        :class:`botocore.client.S3`: S3 client
+    """
+
+    key = (os.getpid(), os.environ.get("S3_ENDPOINT_URL"))
+    client = _S3_CLIENTS.get(key)
+    if client is None:
+        with _S3_LOCK:
+            client = _S3_CLIENTS.get(key)
+            if client is None:
+                # Enough pooled connections for every thread of a concurrent multipart transfer
+                pool_size = max(10, get_transfer_config().max_request_concurrency)
+                client = boto3.client(
+                    "s3",
+                    endpoint_url=key[1],
+                    config=Config(max_pool_connections=pool_size),
+                )
+                _S3_CLIENTS[key] = client
+    return client
+
+
+def get_transfer_config():
+    """Return the multipart transfer settings, read from the environment
+
+    - `S3_MULTIPART_THRESHOLD`: size in bytes from which transfers are split into parts. Defaults to 8 MB.
+    - `S3_MULTIPART_CHUNKSIZE`: size in bytes of each part. Defaults to 8 MB.
+    - `S3_MAX_CONCURRENCY`: most parts transferred at once. Defaults to 10.
+
+    Returns:
+        :class:`boto3.s3.transfer.TransferConfig`: transfer settings
+    """
+
+    return TransferConfig(
+        multipart_threshold=int(os.environ.get("S3_MULTIPART_THRESHOLD", _PART_SIZE)),
+        multipart_chunksize=int(os.environ.get("S3_MULTIPART_CHUNKSIZE", _PART_SIZE)),
+        max_concurrency=int(os.environ.get("S3_MAX_CONCURRENCY", 10)),
+    )
+
 
 def upload_to_s3(file_name, bucket, object_name=None):
     """Upload data file to S3 
@@ -28,9 +81,10 @@ def upload_to_s3(file_name, bucket, object_name=None):
 
     # Upload the file
     logger.info("Uploading file {} to bucket {} in S3.".format(file_name, bucket))
-    s3_client = boto3.client("s3")
     try:
-        s3_client.upload_file(file_name, bucket, object_name)
+        get_s3_client().upload_file(
+            str(file_name), bucket, object_name, Config=get_transfer_config()
+        )
     except ClientError as e:
         logger.warning(
             "Could not upload file {} to bucket {} in S3.".format(file_name, bucket)
@@ -40,6 +94,31 @@ def upload_to_s3(file_name, bucket, object_name=None):
     return True
 
 
+def upload_fileobj_to_s3(fileobj, bucket, object_name):
+    """Upload a readable file object or in-memory buffer to S3 in multipart chunks, without writing it to disk first
+
+    Args:
+        fileobj (file-like): binary file object to read the data from, e.g. a :class:`io.BytesIO`
+        bucket (str): S3 bucket name
+        object_name (str): S3 file path of uploaded file
+    """
+
+    logger.info("Uploading stream to {} in bucket {} in S3.".format(object_name, bucket))
+    try:
+        get_s3_client().upload_fileobj(
+            fileobj, bucket, object_name, Config=get_transfer_config()
+        )
+    except ClientError as e:
+        logger.warning(
+            "Could not upload stream to {} in bucket {} in S3.".format(
+                object_name, bucket
+            )
+        )
+        logger.error(e)
+        return False
+    return True
+
+
 def read_from_s3(file_name, bucket, location):
     """Download data file from S3
 
@@ -49,12 +128,11 @@ def read_from_s3(file_name, bucket, location):
         location (str): local file path to download files to
     """
 
-    # Download file
-    s3_client = boto3.client("s3")
-
     logger.info("Downloading file {} from S3 to {}.".format(file_name, location))
     try:
-        s3_client.download_file(bucket, file_name, location)
+        get_s3_client().download_file(
+            bucket, file_name, str(location), Config=get_transfer_config()
+        )
     except ClientError as e:
         logger.warning(
             "Could not download file {} from S3 to {}.".format(file_name, location)
@@ -64,6 +142,69 @@ def read_from_s3(file_name, bucket, location):
     return True
 
 
+def read_fileobj_from_s3(file_name, bucket, fileobj):
+    """Download an S3 file into a writable file object, in concurrent multipart chunks
+
+    Args:
+        file_name (str): S3 file name
+        bucket (str): S3 bucket name
+        fileobj (file-like): binary file object to write the data to, e.g. a :class:`io.BytesIO`
+    """
+
+    logger.info("Downloading file {} from bucket {} in S3.".format(file_name, bucket))
+    try:
+        get_s3_client().download_fileobj(
+            bucket, file_name, fileobj, Config=get_transfer_config()
+        )
+    except ClientError as e:
+        logger.warning(
+            "Could not download file {} from bucket {} in S3.".format(file_name, bucket)
+        )
+        logger.error(e)
+        return False
+    return True
+
+
+def read_bytes_from_s3(file_name, bucket):
+    """Download an S3 file into memory
+
+    Args:
+        file_name (str): S3 file name
+        bucket (str): S3 bucket name
+
+    Returns:
+        :class:`io.BytesIO`: contents of the file, positioned at the start, or None if it could not be downloaded
+    """
+
+    buffer = io.BytesIO()
+    if not read_fileobj_from_s3(file_name, bucket, buffer):
+        return None
+    buffer.seek(0)
+    return buffer
+
+
+def open_from_s3(file_name, bucket):
+    """Open an S3 file for reading as it downloads, e.g. to parse a large CSV file in constant memory
+
+    Args:
+        file_name (str): S3 file name
+        bucket (str): S3 bucket name
+
+    Returns:
+        file-like: binary stream of the file contents, or None if it could not be opened. Close it when done.
+    """
+
+    logger.info("Streaming file {} from bucket {} in S3.".format(file_name, bucket))
+    try:
+        return get_s3_client().get_object(Bucket=bucket, Key=file_name)["Body"]
+    except ClientError as e:
+        logger.warning(
+            "Could not open file {} from bucket {} in S3.".format(file_name, bucket)
+        )
+        logger.error(e)
+        return None
+
+
 def check_for_valid_cols(cols, df):
     """Checks that all coluns in cols list are in the dataframe
 
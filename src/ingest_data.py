@@ -1,19 +1,29 @@
+import io
 import os
 import sys
+import time
+import zlib
+import itertools
+import concurrent.futures
+import shutil
+import hashlib
+import tempfile
 import pandas as pd
 import requests
 import gzip
-import boto3
-import logging
-import logging.config
 import yaml
+import logging
 
-import config
 from src.helpers import upload_to_s3
+from src.model_config import load_config
+from src.ingest_manifest import IngestManifest
+from src.storage import S3Storage, open_storage
 
-logging.config.fileConfig(config.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
+# Bytes read from the source per chunk when streaming
+CHUNK_SIZE = 1024 * 1024
+
 
 def run_ingest_data(args):
     """Run all steps to ingest data from source and upload raw data to S3
@@ -24,16 +34,31 @@ def run_ingest_data(args):
             - url: URL of source data
             - s3_bucket_name: name of the S3 bucket ot upload raw data to
             - data_path: local file path where raw data will be downloaded to
+            - sources (optional): location of a YAML file of (city, pull date) sources to ingest instead of `url`
+            - url_template (optional): URL of a source, with `{state}`, `{city}`, and `{pull_date}` fields
+            - workers (optional): most sources fetched at once
+            - output_dir (optional): local directory to write the partitioned raw data to instead of S3
     """
 
     logger.info("Reading in configs from modelconfig.yml.")
     try:
         # Load in configs from yml file
-        with open(args.config, "r") as f:
-            config = yaml.load(f, Loader=yaml.FullLoader)
-            s3_objects = config["s3_objects"]
-            data_files = config["data_files"]
-            zip_file_name = config["ingest_data"]["ZIP_FILE_NAME"]
+        config = load_config(args.config)
+        s3_objects = config.s3_objects
+        data_files = config.data_files
+        zip_file_name = config.zip_file_name
+        stream = config["ingest_data"].get("STREAM", False)
+        chunk_size = config["ingest_data"].get("CHUNK_SIZE", CHUNK_SIZE)
+        manifest_file = data_files.get("DATA_FILENAME_INGEST_MANIFEST")
+        storage = open_storage(config, args.s3_bucket_name)
+        sources_file = getattr(args, "sources", None)
+        if sources_file is not None:
+            partition = s3_objects["S3_OBJECT_DATA_RAW_PARTITION"]
+            workers = getattr(args, "workers", None) or config["ingest_data"].get(
+                "WORKERS", 4
+            )
+            retries = config["ingest_data"].get("RETRIES", 3)
+            backoff_seconds = config["ingest_data"].get("BACKOFF_SECONDS", 1.0)
     except KeyError:
         logger.error(
             "Encountered error when assigning variable from configurations file."
@@ -43,17 +68,82 @@ def run_ingest_data(args):
         logger.error("Encountered error in reading in the configurations file.")
         sys.exit(1)
 
+    # Fetch every (city, pull date) source concurrently, each into its own partition
+    if sources_file is not None:
+        try:
+            sources = load_sources(sources_file, args.url_template)
+        except (ValueError, IOError, yaml.YAMLError) as e:
+            logger.error("Encountered error in reading in the sources file.")
+            logger.error(e)
+            sys.exit(1)
+        bucket = args.s3_bucket_name
+        if getattr(args, "output_dir", None) is not None:
+            bucket, storage = None, None
+            partition = os.path.join(str(args.output_dir), partition)
+        results = ingest_sources(
+            sources,
+            bucket,
+            partition,
+            manifest_file,
+            workers,
+            chunk_size,
+            retries,
+            backoff_seconds,
+            storage,
+        )
+        if storage is not None:
+            storage.report("ingest")
+        failed = [r for r in results if r["status"] == "failed"]
+        for r in failed:
+            logger.error(
+                "Could not ingest {} {} from {}: {}".format(
+                    r["city"], r["pull_date"], r["url"], r["error"]
+                )
+            )
+        if failed:
+            sys.exit(1)
+        return
+
+    # Only download and upload the snapshot if it changed since it was last ingested
+    if stream and manifest_file is not None:
+        ingest_if_changed(
+            args.url,
+            args.s3_bucket_name,
+            s3_objects["S3_OBJECT_DATA_RAW"],
+            manifest_file,
+            chunk_size,
+            storage,
+        )
+        storage.report("ingest")
+        return
+
+    # Decompress the source while storing it, without writing it to disk or parsing it
+    if stream:
+        if not stream_data_to_storage(
+            args.url,
+            storage,
+            s3_objects["S3_OBJECT_DATA_RAW"],
+            chunk_size,
+        ):
+            sys.exit(1)
+        storage.report("ingest")
+        return
+
     # Import data
     import_data_from_source(
         args.url, zip_file_name, args.data_path, data_files["DATA_FILENAME_RAW"]
     )
 
-    # Upload to S3
-    upload_to_s3(
-        data_files["DATA_FILENAME_RAW"],
-        args.s3_bucket_name,
-        s3_objects["S3_OBJECT_DATA_RAW"],
-    )
+    # Store the raw data
+    try:
+        storage.put_file(
+            data_files["DATA_FILENAME_RAW"], s3_objects["S3_OBJECT_DATA_RAW"]
+        )
+    except IOError as e:
+        logger.error("Encountered error while storing the raw data.")
+        logger.error(e)
+        sys.exit(1)
+    storage.report("ingest")
 
     # Remove raw data file
     logger.info("Removing zip file.")
@@ -101,3 +191,468 @@ def import_data_from_source(url, zip_filename, input_filepath, output_filename):
     except IOError:
         logger.error("Encountered error while attempting to write out raw data file.")
         sys.exit(1)
+
+
+def ingest_if_changed(
+    url, bucket, object_name, manifest_file, chunk_size=CHUNK_SIZE, storage=None
+):
+    """Upload the decompressed snapshot at a source URL to S3, unless it is unchanged or already uploaded
+
+    See :func:`fetch_snapshot`. The manifest is updated once the snapshot is in S3, so a failed upload is retried
+    on the next run.
+
+    Args:
+        url (str): URL of the gzipped raw data source
+        bucket (str): S3 bucket name
+        object_name (str): S3 file path of the uploaded CSV file
+        manifest_file (str): location of the JSON ingest manifest
+        chunk_size (int, optional): bytes read from the source per chunk. Defaults to `CHUNK_SIZE`.
+        storage (:class:`src.storage.Storage`, optional): storage to store the snapshot through. Defaults to None
+            (uploaded to `bucket`).
+
+    Returns:
+        bool: whether the snapshot was uploaded
+    """
+
+    manifest = IngestManifest(manifest_file)
+    try:
+        status, _ = fetch_snapshot(
+            url, bucket, object_name, manifest, chunk_size, storage=storage
+        )
+    except (requests.exceptions.RequestException, IOError, zlib.error) as e:
+        logger.error("Encountered error while ingesting data from {}.".format(url))
+        logger.error(e)
+        sys.exit(1)
+    return status == "stored"
+
+
+def fetch_snapshot(
+    url,
+    bucket,
+    object_name,
+    manifest=None,
+    chunk_size=CHUNK_SIZE,
+    session=None,
+    storage=None,
+):
+    """Store the decompressed snapshot at a source URL, unless it is unchanged or already stored
+
+    The source is requested with the `ETag` and `Last-Modified` validators recorded in the manifest, so an
+    unchanged snapshot is answered with 304 Not Modified and nothing is downloaded. Otherwise the snapshot is
+    decompressed into a temporary file while its SHA-256 hash is computed, in constant memory, and only stored
+    if the destination does not already hold content with that hash.
+
+    Args:
+        url (str): URL of the gzipped raw data source
+        bucket (str): S3 bucket name, or None to store the snapshot as a local file
+        object_name (str): S3 file path, or local file path if `bucket` is None, of the stored CSV file
+        manifest (:class:`src.ingest_manifest.IngestManifest`, optional): manifest to check and update. Defaults to
+            None (the snapshot is always downloaded and stored).
+        chunk_size (int, optional): bytes read from the source per chunk. Defaults to `CHUNK_SIZE`.
+        session (:class:`requests.Session`, optional): session to request the source with. Defaults to None.
+        storage (:class:`src.storage.Storage`, optional): storage to store the snapshot through. Defaults to None
+            (uploaded to `bucket`, or copied to a local file if `bucket` is None).
+
+    Returns:
+        tuple: status, one of "unchanged" (304 Not Modified), "present" (same content already stored), or
+            "stored", and the size of the downloaded snapshot in bytes
+
+    Raises:
+        :class:`requests.exceptions.RequestException`: if the source cannot be fetched
+        IOError: if the snapshot cannot be written or stored
+    """
+
+    headers = {}
+    location = _manifest_location(bucket, object_name, storage)
+    if manifest is not None:
+        headers = manifest.conditional_headers(url, location)
+    logger.info("Requesting {}{}.".format(url, " if changed" if headers else ""))
+    source = open_source_stream(url, chunk_size, headers, session)
+    if source is None:
+        logger.info("Source {} has not changed, skipping ingest.".format(url))
+        manifest.touch(url)
+        manifest.save()
+        return "unchanged", 0
+
+    response = source.raw.response
+    digest = hashlib.sha256()
+    with source, tempfile.NamedTemporaryFile(suffix=".csv") as spool:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            spool.write(chunk)
+        spool.flush()
+        nbytes = spool.tell()
+        sha256 = digest.hexdigest()
+
+        if manifest is not None and manifest.object_hash(location) == sha256:
+            logger.info(
+                "Content of {} is already in {}, skipping upload.".format(
+                    url, _location(bucket, object_name, storage)
+                )
+            )
+            status = "present"
+        else:
+            _store(spool.name, bucket, object_name, storage)
+            status = "stored"
+
+    if manifest is not None:
+        if status == "stored":
+            manifest.record_object(location, sha256, url)
+        manifest.record_source(
+            url,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            sha256,
+            nbytes,
+        )
+        manifest.save()
+    return status, nbytes
+
+
+def ingest_sources(
+    sources,
+    bucket,
+    object_template,
+    manifest_file=None,
+    workers=4,
+    chunk_size=CHUNK_SIZE,
+    retries=3,
+    backoff_seconds=1.0,
+    storage=None,
+):
+    """Fetch the snapshots of many (city, pull date) sources concurrently, each into its own partition
+
+    Sources are fetched by a bounded pool of threads sharing one :class:`requests.Session`, whose connection pool
+    holds a connection per thread. Failed sources are retried with exponential backoff, except for client errors
+    such as a 404 for a pull date that does not exist. Progress is logged as each source finishes.
+
+    Args:
+        sources (:obj:`list`): sources as returned by :func:`load_sources`
+        bucket (str): S3 bucket name, or None to store the snapshots as local files
+        object_template (str): S3 file path, or local file path if `bucket` is None, of each stored CSV file, with
+            `{city}` and `{pull_date}` fields, e.g. "data/raw/city={city}/pull_date={pull_date}/listings-raw.csv"
+        manifest_file (str, optional): location of the JSON ingest manifest. Defaults to None (no manifest).
+        workers (int, optional): most sources fetched at once. Defaults to 4.
+        chunk_size (int, optional): bytes read from each source per chunk. Defaults to `CHUNK_SIZE`.
+        retries (int, optional): times a failed source is retried. Defaults to 3.
+        backoff_seconds (float, optional): wait before the first retry, doubled for each one after. Defaults to 1.0.
+        storage (:class:`src.storage.Storage`, optional): storage to store the snapshots through. Defaults to None
+            (uploaded to `bucket`, or copied to local files if `bucket` is None).
+
+    Returns:
+        :obj:`list`: one dict per source, in the order of `sources`, with `city`, `pull_date`, `url`, `location`,
+            `status` ("unchanged", "present", "stored", or "failed"), `bytes`, `seconds`, `attempts`, and `error`
+    """
+
+    manifest = IngestManifest(manifest_file) if manifest_file is not None else None
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    done = itertools.count(1)
+    start = time.perf_counter()
+
+    def fetch(source):
+        object_name = object_template.format(**source)
+        result = dict(
+            source, location=_location(bucket, object_name, storage), error=None
+        )
+        source_start = time.perf_counter()
+        for attempt in range(retries + 1):
+            try:
+                result["status"], result["bytes"] = fetch_snapshot(
+                    source["url"],
+                    bucket,
+                    object_name,
+                    manifest,
+                    chunk_size,
+                    session,
+                    storage,
+                )
+                break
+            except (requests.exceptions.RequestException, IOError, zlib.error) as e:
+                result["status"], result["bytes"], result["error"] = "failed", 0, str(e)
+                if attempt == retries or _is_client_error(e):
+                    break
+                wait = backoff_seconds * 2 ** attempt
+                logger.warning(
+                    "Fetching {} failed (attempt {}), retrying in {:.1f} seconds: {}".format(
+                        source["url"], attempt + 1, wait, e
+                    )
+                )
+                time.sleep(wait)
+        result["attempts"] = attempt + 1
+        result["seconds"] = time.perf_counter() - source_start
+
+        logger.info(
+            "[{}/{}] {} {}: {} ({:.1f} MB in {:.1f} seconds).".format(
+                next(done),
+                len(sources),
+                source["city"],
+                source["pull_date"],
+                result["status"],
+                result["bytes"] / 1e6,
+                result["seconds"],
+            )
+        )
+        return result
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(fetch, sources))
+    finally:
+        session.close()
+
+    elapsed = time.perf_counter() - start
+    nbytes = sum(r["bytes"] for r in results)
+    logger.info(
+        "Ingested {} sources ({} failed), {:.1f} MB in {:.1f} seconds ({:.1f} MB/s).".format(
+            len(results),
+            sum(r["status"] == "failed" for r in results),
+            nbytes / 1e6,
+            elapsed,
+            nbytes / 1e6 / elapsed if elapsed > 0 else 0.0,
+        )
+    )
+    return results
+
+
+def load_sources(path, url_template):
+    """Read a YAML list of (city, pull date) sources to ingest
+
+    Each source has a `city` and a `pull_date`, and either a `url` or the `state` (e.g. "il") to build the URL
+    from `url_template`.
+
+    Args:
+        path (str): location of the YAML sources file
+        url_template (str): URL of a source, with `{state}`, `{city}`, and `{pull_date}` fields
+
+    Returns:
+        :obj:`list`: sources as dicts with `city`, `pull_date`, and `url`
+
+    Raises:
+        ValueError: if a source is missing its city, pull date, or both its URL and state
+    """
+
+    with open(path, "r") as f:
+        entries = yaml.load(f, Loader=yaml.FullLoader) or []
+    if not isinstance(entries, list):
+        raise ValueError("Sources file {} must be a list of sources.".format(path))
+
+    sources = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict) or "city" not in entry or "pull_date" not in entry:
+            raise ValueError(
+                "Source {} in {} needs a city and a pull_date.".format(i, path)
+            )
+        source = {"city": str(entry["city"]), "pull_date": str(entry["pull_date"])}
+        if "url" in entry:
+            source["url"] = entry["url"]
+        elif "state" in entry:
+            source["url"] = url_template.format(state=entry["state"], **source)
+        else:
+            raise ValueError("Source {} in {} needs a url or a state.".format(i, path))
+        sources.append(source)
+    return sources
+
+
+def stream_data_from_source(url, output_filename, chunk_size=CHUNK_SIZE):
+    """Download and decompress the gzipped data source into a CSV file chunk by chunk, in constant memory
+
+    The raw bytes are written as they are, without parsing them into a dataframe. They are written to a temporary
+    file next to `output_filename` that replaces it once the download has finished, so an interrupted download
+    never leaves a truncated CSV file behind.
+
+    Args:
+        url (str): URL of the gzipped raw data source
+        output_filename (str): file name of the output CSV file
+        chunk_size (int, optional): bytes read from the source per chunk. Defaults to `CHUNK_SIZE`.
+
+    Returns:
+        int: size of the decompressed CSV file in bytes
+    """
+
+    logger.info("Streaming data from {}.".format(url))
+    tmp_filename = "{}.part".format(output_filename)
+    try:
+        with open_source_stream(url, chunk_size) as source, open(
+            tmp_filename, "wb"
+        ) as f:
+            shutil.copyfileobj(source, f, chunk_size)
+            nbytes = f.tell()
+        os.replace(tmp_filename, output_filename)
+    except (requests.exceptions.RequestException, IOError, zlib.error) as e:
+        logger.error("Encountered error while streaming data from {}.".format(url))
+        logger.error(e)
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        sys.exit(1)
+
+    logger.info(
+        "Successfully streamed {:.1f} MB of raw data to {}.".format(
+            nbytes / 1e6, output_filename
+        )
+    )
+    return nbytes
+
+
+def stream_data_to_s3(url, bucket, object_name, chunk_size=CHUNK_SIZE):
+    """Download and decompress the gzipped data source straight into an S3 object, in constant memory
+
+    Args:
+        url (str): URL of the gzipped raw data source
+        bucket (str): S3 bucket name
+        object_name (str): S3 file path of the uploaded CSV file
+        chunk_size (int, optional): bytes read from the source per chunk. Defaults to `CHUNK_SIZE`.
+
+    Returns:
+        bool: whether the upload succeeded
+    """
+
+    return stream_data_to_storage(url, S3Storage(bucket), object_name, chunk_size)
+
+
+def stream_data_to_storage(url, storage, object_name, chunk_size=CHUNK_SIZE):
+    """Download and decompress the gzipped data source straight into a stored object
+
+    Args:
+        url (str): URL of the gzipped raw data source
+        storage (:class:`src.storage.Storage`): storage to store the CSV file through
+        object_name (str): key of the stored CSV file
+        chunk_size (int, optional): bytes read from the source per chunk. Defaults to `CHUNK_SIZE`.
+
+    Returns:
+        bool: whether the snapshot was stored
+    """
+
+    logger.info("Streaming data from {} to {}.".format(url, storage.uri(object_name)))
+    try:
+        with open_source_stream(url, chunk_size) as source:
+            storage.put_fileobj(source, object_name)
+    except (requests.exceptions.RequestException, IOError, zlib.error) as e:
+        logger.error("Encountered error while streaming data from {}.".format(url))
+        logger.error(e)
+        return False
+    return True
+
+
+def open_source_stream(url, chunk_size=CHUNK_SIZE, headers=None, session=None):
+    """Open the gzipped data source as a readable file of its decompressed bytes
+
+    Args:
+        url (str): URL of the gzipped raw data source
+        chunk_size (int, optional): bytes read from the source per chunk. Defaults to `CHUNK_SIZE`.
+        headers (:obj:`dict`, optional): request headers, e.g. conditional request validators. Defaults to None.
+        session (:class:`requests.Session`, optional): session to send the request with. Defaults to None.
+
+    Returns:
+        :class:`io.BufferedReader`: decompressed bytes of the source, read as they are downloaded, or None if
+            the source answered 304 Not Modified. The response is available as `raw.response`.
+
+    Raises:
+        :class:`requests.exceptions.RequestException`: if the source cannot be fetched
+    """
+
+    response = (session or requests).get(
+        url, stream=True, timeout=60, headers=headers
+    )
+    if response.status_code == 304:
+        response.close()
+        return None
+    response.raise_for_status()
+    return io.BufferedReader(GunzipStream(response, chunk_size), chunk_size)
+
+
+class GunzipStream(io.RawIOBase):
+    """Raw stream of the decompressed bytes of a gzipped HTTP response, decompressed as it is read
+
+    Holds at most one compressed chunk and its decompressed bytes at a time, so memory use does not depend on the
+    size of the source. Concatenated gzip members are decompressed one after another, like :mod:`gzip` does.
+
+    Args:
+        response (:class:`requests.Response`): response opened with `stream=True`
+        chunk_size (int, optional): bytes read from the response per chunk. Defaults to `CHUNK_SIZE`.
+    """
+
+    def __init__(self, response, chunk_size=CHUNK_SIZE):
+        self.response = response
+        self._chunks = response.iter_content(chunk_size)
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._buffer = b""
+        self._offset = 0
+        self._eof = False
+        self.compressed_bytes = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._offset == len(self._buffer) and not self._eof:
+            self._fill()
+        n = min(len(b), len(self._buffer) - self._offset)
+        b[:n] = self._buffer[self._offset : self._offset + n]
+        self._offset += n
+        return n
+
+    def close(self):
+        self.response.close()
+        super().close()
+
+    def _fill(self):
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            if not self._decompressor.eof and self.compressed_bytes > 0:
+                raise zlib.error("Source ended in the middle of a gzip member.")
+            self._eof = True
+            return
+        self.compressed_bytes += len(chunk)
+        data = self._decompressor.decompress(chunk)
+        while self._decompressor.eof and self._decompressor.unused_data:
+            rest = self._decompressor.unused_data
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data += self._decompressor.decompress(rest)
+        self._buffer = data
+        self._offset = 0
+
+
+def _store(file_name, bucket, object_name, storage=None):
+    """Store a file through `storage`, or else upload it to S3, or copy it to a local file path if `bucket` is None
+
+    Raises IOError on failure.
+    """
+
+    if storage is not None:
+        storage.put_file(file_name, object_name)
+    elif bucket is None:
+        directory = os.path.dirname(object_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        shutil.copyfile(file_name, "{}.part".format(object_name))
+        os.replace("{}.part".format(object_name), object_name)
+    elif not upload_to_s3(file_name, bucket, object_name):
+        raise IOError(
+            "Could not upload {} to bucket {} in S3.".format(object_name, bucket)
+        )
+
+
+def _location(bucket, object_name, storage=None):
+    if storage is not None:
+        return storage.uri(object_name)
+    return object_name if bucket is None else "s3://{}/{}".format(bucket, object_name)
+
+
+def _manifest_location(bucket, object_name, storage=None):
+    """Location the manifest records a stored object under, or None if it does not outlive the process"""
+
+    if storage is not None and storage.backend.split("+")[0] == "memory":
+        return None
+    return _location(bucket, object_name, storage)
+
+
+def _is_client_error(e):
+    response = getattr(e, "response", None)
+    return response is not None and 400 <= response.status_code < 500
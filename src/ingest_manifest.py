@@ -0,0 +1,134 @@
+import os
+import json
+import datetime
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IngestManifest:
+    """Record of the snapshots ingested from each source URL and of the content stored at each location
+
+    For each source URL (which includes the pull date of the snapshot), the manifest keeps the `ETag` and
+    `Last-Modified` validators the source returned and the SHA-256 hash of the decompressed snapshot. For each
+    stored object, keyed by its location in the storage backend (e.g. `s3://<bucket>/<key>` or a local file path),
+    it keeps the hash of the content last stored there and the URL it came from. Together these let ingest send
+    conditional requests and skip storing content that is already there. Objects without a durable location (e.g.
+    in the memory backend) are not recorded. Sources fetched by different threads can share one manifest.
+
+    Args:
+        path (str): location of the JSON manifest file. A missing file is an empty manifest.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.sources = {}
+        self.objects = {}
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r") as f:
+                manifest = json.load(f)
+            self.sources = manifest.get("sources", {})
+            self.objects = manifest.get("objects", {})
+        except FileNotFoundError:
+            logger.info("No ingest manifest at {}, starting a new one.".format(self.path))
+        except (ValueError, AttributeError) as e:
+            logger.warning(
+                "Could not read ingest manifest {}, starting a new one.".format(self.path)
+            )
+            logger.warning(e)
+
+    def conditional_headers(self, url, location):
+        """Return the headers that make the source answer 304 Not Modified if the snapshot did not change
+
+        Validators are only sent if the stored object still holds the content ingested from `url`, since a 304
+        response carries no content to store.
+
+        Args:
+            url (str): URL of the source
+            location (str): location the snapshot is stored at, or None if it has no durable location
+
+        Returns:
+            :obj:`dict`: `If-None-Match` and/or `If-Modified-Since` headers, empty if unconditional
+        """
+
+        source = self.sources.get(url)
+        if source is None or self.object_hash(location) != source["sha256"]:
+            return {}
+        headers = {}
+        if source.get("etag"):
+            headers["If-None-Match"] = source["etag"]
+        if source.get("last_modified"):
+            headers["If-Modified-Since"] = source["last_modified"]
+        return headers
+
+    def object_hash(self, location):
+        """Return the SHA-256 hash of the content last stored at a location, or None if unknown"""
+
+        if location is None:
+            return None
+        return self.objects.get(_object_key(location), {}).get("sha256")
+
+    def record_source(self, url, etag, last_modified, sha256, nbytes):
+        """Record the validators and content hash of the snapshot at a source URL
+
+        Args:
+            url (str): URL of the source
+            etag (str): `ETag` header of the response, or None
+            last_modified (str): `Last-Modified` header of the response, or None
+            sha256 (str): hex SHA-256 hash of the decompressed snapshot
+            nbytes (int): size of the decompressed snapshot in bytes
+        """
+
+        with self._lock:
+            self.sources[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "sha256": sha256,
+                "bytes": nbytes,
+                "checked_at": _now(),
+            }
+
+    def record_object(self, location, sha256, url):
+        """Record the content hash and source URL of the content stored at a location, unless it is None"""
+
+        if location is None:
+            return
+        with self._lock:
+            self.objects[_object_key(location)] = {
+                "sha256": sha256,
+                "source": url,
+                "uploaded_at": _now(),
+            }
+
+    def touch(self, url):
+        """Record that a source URL was checked and had not changed"""
+
+        with self._lock:
+            if url in self.sources:
+                self.sources[url]["checked_at"] = _now()
+
+    def save(self):
+        """Write the manifest, replacing the previous file only once the new one is complete"""
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = "{}.part".format(self.path)
+        with self._lock:
+            with open(tmp_path, "w") as f:
+                json.dump(
+                    {"sources": self.sources, "objects": self.objects}, f, indent=2
+                )
+            os.replace(tmp_path, self.path)
+
+
+def _object_key(location):
+    if "://" in location:
+        return location
+    return os.path.abspath(location)
+
+
+def _now():
+    return datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z"
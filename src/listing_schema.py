@@ -0,0 +1,176 @@
+import math
+import numbers
+import logging
+import collections.abc
+import pandas as pd
+import sqlalchemy as sql
+
+from src.create_db import Listings
+
+logger = logging.getLogger(__name__)
+
+
+class ListingError(ValueError):
+    """A submitted listing is missing fields or has values that cannot be decoded
+
+    Args:
+        errors (:obj:`dict`): error message for each invalid field, keyed by field name
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(
+            "; ".join("{}: {}".format(name, error) for name, error in errors.items())
+        )
+
+
+class ListingSchema:
+    """Decodes the fields of a submitted listing once into both the model input and the `Listings` row
+
+    Each model input feature is decoded according to the type of the `Listings` column of the same name: numeric
+    columns to finite floats, integer columns to ints, boolean columns to 0 or 1, and string columns to stripped
+    strings no longer than the column. String features that are one-hot encoded must also be one of the
+    categories the encoder was fitted on, so that a listing the model cannot score is rejected before scoring.
+
+    Args:
+        features (:obj:`list`): names of the model input features, in model input order
+        table (:class:`sqlalchemy.Table`): table the listings are written to
+        categories (:obj:`dict`, optional): allowed values of each one-hot encoded feature. Defaults to None.
+
+    Raises:
+        KeyError: if a feature has no column in `table`
+    """
+
+    def __init__(self, features, table, categories=None):
+        self.features = list(features)
+        categories = categories or {}
+
+        # (name, decoder, allowed categories) for each feature, in model input order
+        self._fields = []
+        for feature in self.features:
+            column_type = table.columns[feature].type
+            if isinstance(column_type, sql.Numeric):
+                decode = _decode_float
+            elif isinstance(column_type, sql.Boolean):
+                decode = _decode_bool
+            elif isinstance(column_type, sql.Integer):
+                decode = _decode_int
+            else:
+                decode = _string_decoder(getattr(column_type, "length", None))
+            allowed = categories.get(feature)
+            if allowed is not None:
+                allowed = frozenset(allowed)
+            self._fields.append((feature, decode, allowed))
+
+    def decode(self, fields):
+        """Decode and validate the fields of one listing
+
+        Args:
+            fields (:obj:`dict`): listing fields from the request, e.g. `request.form` or a JSON object
+
+        Returns:
+            :obj:`dict`: decoded value of each feature, usable both as a model input row and as `Listings` columns
+
+        Raises:
+            :class:`ListingError`: if any feature is missing or invalid, listing every invalid feature
+        """
+
+        if not isinstance(fields, collections.abc.Mapping):
+            raise ListingError(
+                {"listing": "expected an object, got {}".format(type(fields).__name__)}
+            )
+
+        row = {}
+        errors = {}
+        for name, decode, allowed in self._fields:
+            value = fields.get(name)
+            if value is None or value == "":
+                errors[name] = "missing"
+                continue
+            try:
+                value = decode(value)
+            except (TypeError, ValueError) as e:
+                errors[name] = str(e)
+                continue
+            if allowed is not None and value not in allowed:
+                errors[name] = "unknown category {!r}".format(value)
+                continue
+            row[name] = value
+
+        if errors:
+            raise ListingError(errors)
+        return row
+
+    def frame(self, rows):
+        """Assemble decoded listings into the input dataframe of :func:`src.predict.run_predict`
+
+        Args:
+            rows (:obj:`list` of :obj:`dict`): listings returned by :meth:`decode`
+
+        Returns:
+            :class:`pandas.DataFrame`: one row per listing, with the model input features as columns
+        """
+
+        return pd.DataFrame(rows, columns=self.features)
+
+
+def build_schema(artifacts):
+    """Build the :class:`ListingSchema` of a loaded artifact set
+
+    Args:
+        artifacts (:obj:`dict`): loaded artifacts from :mod:`src.model_registry`
+
+    Returns:
+        :class:`ListingSchema`: schema of the model input features, checking categories against the encoder
+    """
+
+    config = artifacts["config"]
+    categories = {}
+    for col, values in zip(
+        config.cols_cat, getattr(artifacts["encoder"], "categories_", [])
+    ):
+        # Only string categories can be compared with the decoded strings
+        values = values.tolist()
+        if all(isinstance(c, str) for c in values):
+            categories[col] = values
+    return ListingSchema(config.select_features, Listings.__table__, categories)
+
+
+def _decode_float(value):
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError("expected a finite number, got {!r}".format(value))
+    return value
+
+
+def _decode_int(value):
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError("expected a whole number, got {!r}".format(value))
+    return int(number)
+
+
+def _decode_bool(value):
+    value = _decode_int(value)
+    if value not in (0, 1):
+        raise ValueError("expected 0 or 1, got {!r}".format(value))
+    return value
+
+
+def _string_decoder(length):
+    def decode(value):
+        if not isinstance(value, str):
+            raise TypeError("expected a string, got {}".format(type(value).__name__))
+        value = value.strip()
+        if length is not None and len(value) > length:
+            raise ValueError("longer than {} characters".format(length))
+        return value
+
+    return decode
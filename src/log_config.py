@@ -0,0 +1,32 @@
+import threading
+import logging.config
+
+import config
+
+_LOCK = threading.Lock()
+_CONFIGURED = False
+
+
+def configure_logging(logging_config=None):
+    """Apply the logging configuration file, once per process
+
+    Modules in `src` only create their loggers, so that importing them has no side effects. Entry points (`run.py`,
+    `app.py`) call this before doing any work. Loggers created before the call keep working.
+
+    Args:
+        logging_config (str, optional): location of the logging configuration file. Defaults to None
+            (`LOGGING_CONFIG` in `config.py`).
+
+    Returns:
+        bool: whether the configuration was applied by this call
+    """
+
+    global _CONFIGURED
+    with _LOCK:
+        if _CONFIGURED:
+            return False
+        logging.config.fileConfig(
+            logging_config or config.LOGGING_CONFIG, disable_existing_loggers=False
+        )
+        _CONFIGURED = True
+        return True
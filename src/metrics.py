@@ -0,0 +1,219 @@
+import time
+import threading
+import collections
+import contextlib
+import numpy as np
+
+# Prefix of every exported metric name
+NAMESPACE = "airbnbchi"
+
+# Quantiles reported for every summary
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Observations per summary kept to estimate quantiles; count and sum cover all observations
+WINDOW = 1024
+
+_LOCK = threading.Lock()
+_SUMMARIES = {}
+_COUNTERS = {}
+_GAUGES = {}
+_HELP = {
+    "stage_seconds": ("summary", "Time spent in each stage of serving a prediction."),
+    "request_seconds": ("summary", "Time spent handling a request, by endpoint."),
+    "requests_total": ("counter", "Requests handled, by endpoint, method, and status."),
+    "errors_total": ("counter", "Errors caught while handling requests, by stage."),
+    "model_loads_total": ("counter", "Model artifact sets loaded into the model pool, by city and version."),
+    "model_evictions_total": ("counter", "Model artifact sets evicted from the model pool, by city and version."),
+    "model_pool_resident_bytes": ("gauge", "Approximate size of the artifact sets resident in the model pool."),
+    "model_pool_resident_models": ("gauge", "Artifact sets resident in the model pool."),
+    "shadow_total": ("counter", "Listings submitted for shadow scoring by the candidate model, by outcome."),
+    "shadow_abs_diff": ("summary", "Absolute difference between the candidate and primary model predictions."),
+    "shadow_latency_diff_seconds": ("summary", "Candidate minus primary model latency of shadow scored listings."),
+    "storage_bytes_total": ("counter", "Bytes read from and written to the storage backend, by backend and direction."),
+    "storage_cache_total": ("counter", "Reads served from the local storage cache, by outcome (hit or miss)."),
+}
+
+
+class Summary:
+    """Count, sum, and sliding-window quantiles of observed values"""
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.window = collections.deque(maxlen=WINDOW)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            self.window.append(value)
+
+    def snapshot(self):
+        """Return (count, sum, {quantile: value}), with NaN quantiles if nothing was observed"""
+
+        with self._lock:
+            count, total, window = self.count, self.sum, list(self.window)
+        if window:
+            values = np.percentile(window, [q * 100 for q in QUANTILES])
+        else:
+            values = [float("nan")] * len(QUANTILES)
+        return count, total, dict(zip(QUANTILES, values))
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, value, **labels):
+    """Record one observation of a summary metric, e.g. a duration in seconds
+
+    Args:
+        name (str): metric name, without the namespace prefix
+        value (float): observed value
+        **labels: label values identifying the series
+    """
+
+    key = _key(name, labels)
+    summary = _SUMMARIES.get(key)
+    if summary is None:
+        with _LOCK:
+            summary = _SUMMARIES.setdefault(key, Summary())
+    summary.observe(value)
+
+
+def inc(name, amount=1, **labels):
+    """Increase a counter metric
+
+    Args:
+        name (str): metric name, without the namespace prefix
+        amount (int, optional): amount to increase by. Defaults to 1.
+        **labels: label values identifying the series
+    """
+
+    key = _key(name, labels)
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge metric to its current value
+
+    Args:
+        name (str): metric name, without the namespace prefix
+        value (float): current value
+        **labels: label values identifying the series
+    """
+
+    key = _key(name, labels)
+    with _LOCK:
+        _GAUGES[key] = value
+
+
+@contextlib.contextmanager
+def timer(stage, timings=None):
+    """Time the enclosed block and record it in the `stage_seconds` summary, even if it raises
+
+    Args:
+        stage (str): name of the stage, e.g. "transform"
+        timings (:obj:`dict`, optional): also set `timings[stage]` to the seconds taken. Defaults to None.
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("stage_seconds", elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = elapsed
+
+
+def render():
+    """Render every metric in the Prometheus text exposition format
+
+    Returns:
+        str: metrics text
+    """
+
+    with _LOCK:
+        summaries = sorted(_SUMMARIES.items())
+        counters = sorted(_COUNTERS.items())
+        gauges = sorted(_GAUGES.items())
+
+    lines = []
+    described = set()
+
+    def describe(name):
+        if name not in described and name in _HELP:
+            metric_type, help_text = _HELP[name]
+            lines.append("# HELP {}_{} {}".format(NAMESPACE, name, help_text))
+            lines.append("# TYPE {}_{} {}".format(NAMESPACE, name, metric_type))
+            described.add(name)
+
+    for (name, labels), summary in summaries:
+        describe(name)
+        count, total, quantiles = summary.snapshot()
+        for quantile, value in quantiles.items():
+            lines.append(
+                "{}_{}{} {}".format(
+                    NAMESPACE,
+                    name,
+                    _format_labels(labels + (("quantile", str(quantile)),)),
+                    _format_value(value),
+                )
+            )
+        lines.append(
+            "{}_{}_sum{} {}".format(
+                NAMESPACE, name, _format_labels(labels), _format_value(total)
+            )
+        )
+        lines.append(
+            "{}_{}_count{} {}".format(NAMESPACE, name, _format_labels(labels), count)
+        )
+
+    for (name, labels), value in counters:
+        describe(name)
+        lines.append(
+            "{}_{}{} {}".format(NAMESPACE, name, _format_labels(labels), value)
+        )
+
+    for (name, labels), value in gauges:
+        describe(name)
+        lines.append(
+            "{}_{}{} {}".format(
+                NAMESPACE, name, _format_labels(labels), _format_value(value)
+            )
+        )
+
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Drop all recorded metrics"""
+
+    with _LOCK:
+        _SUMMARIES.clear()
+        _COUNTERS.clear()
+        _GAUGES.clear()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            '{}="{}"'.format(
+                k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            )
+            for k, v in labels
+        )
+        + "}"
+    )
+
+
+def _format_value(value):
+    if value != value:
+        return "NaN"
+    return repr(float(value))
@@ -0,0 +1,193 @@
+import os
+import copy
+import threading
+import logging
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# Parsed configurations, keyed by absolute path, with the modification time and size they were parsed at
+_CONFIGS = {}
+_LOCK = threading.Lock()
+
+# Most distinct input column layouts whose valid columns are remembered per configuration
+_MAX_VALID_COLS = 64
+
+
+class ConfigError(KeyError):
+    """A required configuration is missing or has the wrong type
+
+    Subclasses :class:`KeyError`, so that stages which exit on a missing configuration handle it the same way.
+    """
+
+
+class ModelConfig:
+    """Parsed and validated `modelconfig.yml`, with the structures the stages derive from it computed once
+
+    Sections are available as attributes (e.g. `config.cols_cat`), and the parsed YAML is still available by key
+    (e.g. `config["train_model"]`) for settings passed through to scikit-learn and XGBoost as they are. Sections
+    read by key are copies, since the same instance is shared by every caller of :func:`load_config` and the
+    stages change the settings they are given.
+
+    Args:
+        raw (:obj:`dict`): parsed YAML configurations
+        path (str, optional): location of the YAML config file. Defaults to None.
+
+    Raises:
+        :class:`ConfigError`: if a required configuration is missing or has the wrong type
+    """
+
+    def __init__(self, raw, path=None):
+        if not isinstance(raw, dict):
+            raise ConfigError(
+                "Configurations must be a mapping, got {}.".format(type(raw).__name__)
+            )
+        self.raw = raw
+        self.path = path
+
+        self.target_col = _get(raw, str, "TARGET_COL")
+        self.seed = _get(raw, int, "seed")
+        self.s3_objects = _get(raw, dict, "s3_objects")
+        self.data_files = _get(raw, dict, "data_files")
+        self.model_files = _get(raw, dict, "model_files")
+        self.serving = raw.get("serving") or {}
+        self.storage = raw.get("storage") or {}
+
+        self.zip_file_name = _get(raw, str, "ingest_data", "ZIP_FILE_NAME")
+        self.listing_dtypes = _get(raw, dict, "clean_data", "LISTING_DTYPES")
+        self.drop_cols = _get_cols(raw, "clean_data", "DROP_COLS")
+        self.select_features = _get_cols(raw, "generate_features", "SELECT_FEATURES")
+        self.cols_bool = _get_cols(raw, "generate_features", "COLS_BOOL")
+        self.impute_cols = _get_cols(raw, "train_model", "IMPUTE_COLS")
+        self.cols_num_std = _get_cols(raw, "train_model", "COLS_NUM_STD")
+        self.cols_num_minmax = _get_cols(raw, "train_model", "COLS_NUM_MINMAX")
+        self.cols_cat = _get_cols(raw, "train_model", "COLS_CAT")
+        self.host_response_map = _get(raw, dict, "train_model", "HOST_RESPONSE_MAP")
+
+        for name in ["IMPUTE_COLS", "COLS_NUM_STD", "COLS_NUM_MINMAX", "COLS_CAT"]:
+            unknown = [
+                c for c in raw["train_model"][name] if c not in self.select_features
+            ]
+            if unknown:
+                raise ConfigError(
+                    "train_model.{} contains columns not in SELECT_FEATURES: {}.".format(
+                        name, unknown
+                    )
+                )
+        if len(set(self.host_response_map.values())) != len(self.host_response_map):
+            raise ConfigError(
+                "train_model.HOST_RESPONSE_MAP must map each category to a different code."
+            )
+
+        # Position of each feature in the input, and of each transformed column in its scaler or encoder
+        self.feature_index = {col: i for i, col in enumerate(self.select_features)}
+        self.std_index = {col: i for i, col in enumerate(self.cols_num_std)}
+        self.minmax_index = {col: i for i, col in enumerate(self.cols_num_minmax)}
+        self.cat_index = {col: i for i, col in enumerate(self.cols_cat)}
+        self.host_response_inverse = {v: k for k, v in self.host_response_map.items()}
+
+        self._valid_cols = {}
+        self._valid_cols_lock = threading.Lock()
+
+    def __getitem__(self, key):
+        return copy.deepcopy(self.raw[key])
+
+    def __contains__(self, key):
+        return key in self.raw
+
+    def get(self, key, default=None):
+        return copy.deepcopy(self.raw.get(key, default))
+
+    def valid_cols(self, name, columns):
+        """Return the columns of a configured column list that are present in the data
+
+        Equivalent to :func:`src.helpers.check_for_valid_cols`, but only checked (and warned about) once per
+        distinct set of data columns.
+
+        Args:
+            name (str): attribute of the column list, e.g. "cols_num_std"
+            columns (iterable): columns of the data
+
+        Returns:
+            :obj:`list`: columns from the list that are in `columns`, in configured order
+        """
+
+        key = (name, tuple(columns))
+        cols = self._valid_cols.get(key)
+        if cols is None:
+            present = set(key[1])
+            cols = [col for col in getattr(self, name) if col in present]
+            missing = [col for col in getattr(self, name) if col not in present]
+            if missing:
+                logger.warning(
+                    "Dataset is missing {} expected columns {}".format(
+                        len(missing), missing
+                    )
+                )
+            with self._valid_cols_lock:
+                if len(self._valid_cols) >= _MAX_VALID_COLS:
+                    self._valid_cols.clear()
+                self._valid_cols[key] = cols
+        return cols
+
+
+def load_config(path):
+    """Return the parsed configurations of a YAML config file, parsing it only if it changed since the last call
+
+    Args:
+        path (str): location of the YAML config file
+
+    Returns:
+        :class:`ModelConfig`: parsed configurations, shared by every caller until the file changes
+
+    Raises:
+        FileNotFoundError: if the file does not exist
+        :class:`ConfigError`: if a required configuration is missing or has the wrong type
+    """
+
+    path = os.path.abspath(str(path))
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _CONFIGS.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _LOCK:
+        cached = _CONFIGS.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        logger.debug("Parsing configurations file {}.".format(path))
+        with open(path, "r") as f:
+            config = ModelConfig(yaml.load(f, Loader=yaml.FullLoader), path)
+        _CONFIGS[path] = (version, config)
+        return config
+
+
+def _get(raw, kind, *keys):
+    """Look up a nested configuration and check its type"""
+
+    value = raw
+    for i, key in enumerate(keys):
+        if not isinstance(value, dict) or key not in value:
+            raise ConfigError(
+                "Missing configuration {}.".format(".".join(keys[: i + 1]))
+            )
+        value = value[key]
+    if not isinstance(value, kind):
+        raise ConfigError(
+            "Configuration {} must be of type {}, got {}.".format(
+                ".".join(keys), kind.__name__, type(value).__name__
+            )
+        )
+    return value
+
+
+def _get_cols(raw, *keys):
+    """Look up a configured list of column names"""
+
+    cols = _get(raw, list, *keys)
+    if not all(isinstance(col, str) for col in cols):
+        raise ConfigError(
+            "Configuration {} must be a list of column names.".format(".".join(keys))
+        )
+    return cols
@@ -0,0 +1,264 @@
+import os
+import time
+import threading
+import collections
+import logging
+
+from src import metrics
+from src.model_registry import read_artifacts, served_model
+
+logger = logging.getLogger(__name__)
+
+
+class ModelPool:
+    """Artifact sets of models for several cities and pull dates, loaded on first use and kept under a memory budget
+
+    Models are keyed by (city, version), where the version is the pull date of the data the model was trained on.
+    Each key maps to a modelconfig, either given in `configs` or found at `<config_dir>/<city>/<version>.yml`. The
+    config directory is scanned at most once every `scan_seconds`, or when :meth:`refresh` is called, so that
+    requests do not list it.
+    Loaded artifact sets stay resident while their estimated size fits in `max_bytes`; once it does not, the least
+    recently used ones are evicted. The set just requested is never evicted, even if it alone exceeds the budget.
+
+    Args:
+        configs (:obj:`dict`, optional): modelconfig file locations keyed by (city, version). Defaults to None.
+        config_dir (str, optional): directory of `<city>/<version>.yml` modelconfig files. Defaults to None.
+        max_bytes (int, optional): memory budget of the resident artifact sets. Defaults to None (unbounded).
+        scan_seconds (float, optional): longest time a scan of the config directory is reused. Defaults to 60.0.
+    """
+
+    def __init__(
+        self, configs=None, config_dir=None, max_bytes=None, scan_seconds=60.0
+    ):
+        self.configs = dict(configs or {})
+        self.config_dir = config_dir
+        self.max_bytes = max_bytes
+        self.scan_seconds = scan_seconds
+        # (time of the scan, modelconfig locations found in the config directory)
+        self._scanned = None
+        self._resident = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Lock held while a model is loaded, dropped once the load finishes
+        self._loading = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def available(self):
+        """Return the modelconfig file locations of every model this pool can serve
+
+        Returns:
+            :obj:`dict`: modelconfig file locations keyed by (city, version)
+        """
+
+        scanned = self._scanned
+        if scanned is None or time.monotonic() - scanned[0] > self.scan_seconds:
+            scanned = (time.monotonic(), self._scan())
+            self._scanned = scanned
+        configs = dict(scanned[1])
+        configs.update(self.configs)
+        return configs
+
+    def refresh(self):
+        """Scan the config directory again on the next lookup, e.g. after adding a modelconfig to it"""
+
+        self._scanned = None
+
+    def _scan(self):
+        """Find the `<city>/<version>.yml` modelconfig files in the config directory"""
+
+        configs = {}
+        if self.config_dir is not None and os.path.isdir(self.config_dir):
+            for city in os.listdir(self.config_dir):
+                city_dir = os.path.join(self.config_dir, city)
+                if not os.path.isdir(city_dir):
+                    continue
+                for name in os.listdir(city_dir):
+                    version, ext = os.path.splitext(name)
+                    if ext in (".yml", ".yaml"):
+                        configs[(city, version)] = os.path.join(city_dir, name)
+        return configs
+
+    def resolve(self, city, version=None):
+        """Return the (city, version) key and modelconfig location of a model, with the latest version by default
+
+        Args:
+            city (str): city the model was trained for
+            version (str, optional): pull date of the training data, e.g. "2019-11-21". Defaults to None (latest).
+
+        Returns:
+            tuple: ((city, version), modelconfig location)
+
+        Raises:
+            KeyError: if there is no model for the city and version
+        """
+
+        configs = self.available()
+        if version is None:
+            versions = sorted(v for c, v in configs if c == city)
+            if not versions:
+                raise KeyError("No model for city {}.".format(city))
+            version = versions[-1]
+        key = (city, version)
+        if key not in configs:
+            raise KeyError("No model for city {} and version {}.".format(city, version))
+        return key, configs[key]
+
+    def get(self, city, version=None):
+        """Return the artifact set of a model, loading it and evicting cold ones if it is not resident
+
+        Args:
+            city (str): city the model was trained for
+            version (str, optional): pull date of the training data. Defaults to None (latest).
+
+        Returns:
+            :obj:`dict`: loaded artifacts, as returned by :func:`src.model_registry.read_artifacts`
+
+        Raises:
+            KeyError: if there is no model for the city and version
+            :class:`src.model_registry.ArtifactError`: if the model's artifacts cannot be loaded
+        """
+
+        key, modelconfig = self.resolve(city, version)
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is not None:
+                self._resident.move_to_end(key)
+                return entry[0]
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given model, while models already resident keep being served
+        try:
+            with loading:
+                return self._load(key, modelconfig)
+        finally:
+            with self._lock:
+                if self._loading.get(key) is loading:
+                    del self._loading[key]
+
+    def _load(self, key, modelconfig):
+        """Load a model that is not resident yet, holding its loading lock"""
+
+        with self._lock:
+            entry = self._resident.get(key)
+            if entry is not None:
+                self._resident.move_to_end(key)
+                return entry[0]
+
+        with metrics.timer("model_pool_load"):
+            artifacts = read_artifacts(modelconfig)
+        nbytes = artifacts_nbytes(artifacts)
+        logger.info(
+            "Loaded model for {} {} from {} ({:.1f} MB).".format(
+                key[0], key[1], modelconfig, nbytes / 1e6
+            )
+        )
+        metrics.inc("model_loads_total", city=key[0], version=key[1])
+
+        with self._lock:
+            self._resident[key] = (artifacts, nbytes)
+            self.loads += 1
+            self._evict(keep=key)
+            self._report()
+        return artifacts
+
+    def evict(self, city, version):
+        """Drop a resident model, so that the next request for it loads it again
+
+        Args:
+            city (str): city the model was trained for
+            version (str): pull date of the training data
+
+        Returns:
+            bool: whether the model was resident
+        """
+
+        with self._lock:
+            entry = self._resident.pop((city, version), None)
+            if entry is not None:
+                self._evicted((city, version), entry[1])
+                self._report()
+        return entry is not None
+
+    def stats(self):
+        """Return the resident models and their estimated sizes
+
+        Returns:
+            :obj:`dict`: `resident` (city, version, and bytes of each model, least recently used first),
+                `resident_bytes`, `max_bytes`, `available`, `loads`, and `evictions`
+        """
+
+        available = len(self.available())
+        with self._lock:
+            return {
+                "resident": [
+                    {"city": city, "version": version, "bytes": nbytes}
+                    for (city, version), (_, nbytes) in self._resident.items()
+                ],
+                "resident_bytes": self._resident_bytes(),
+                "max_bytes": self.max_bytes,
+                "available": available,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self, keep):
+        """Evict least recently used models other than `keep` until the resident ones fit the budget"""
+
+        if self.max_bytes is None:
+            return
+        for key in list(self._resident):
+            if self._resident_bytes() <= self.max_bytes:
+                break
+            if key != keep:
+                self._evicted(key, self._resident.pop(key)[1])
+        if self._resident_bytes() > self.max_bytes:
+            logger.warning(
+                "Model for {} {} alone exceeds the model memory budget of {:.1f} MB.".format(
+                    keep[0], keep[1], self.max_bytes / 1e6
+                )
+            )
+
+    def _evicted(self, key, nbytes):
+        self.evictions += 1
+        logger.info(
+            "Evicted model for {} {} ({:.1f} MB).".format(key[0], key[1], nbytes / 1e6)
+        )
+        metrics.inc("model_evictions_total", city=key[0], version=key[1])
+
+    def _resident_bytes(self):
+        return sum(nbytes for _, nbytes in self._resident.values())
+
+    def _report(self):
+        metrics.set_gauge("model_pool_resident_bytes", self._resident_bytes())
+        metrics.set_gauge("model_pool_resident_models", len(self._resident))
+
+
+def artifacts_nbytes(artifacts):
+    """Estimate the memory held by a loaded artifact set
+
+    Pickled objects are counted at the size of the files they were loaded from, and arrays (including
+    memory-mapped ones) at their size in memory.
+
+    Args:
+        artifacts (:obj:`dict`): loaded artifacts, as returned by :func:`src.model_registry.read_artifacts`
+
+    Returns:
+        int: estimated size in bytes
+    """
+
+    model_files = artifacts["config"].model_files
+    nbytes = 0
+    for key in (
+        served_model(artifacts["config"])[0],
+        "MODEL_FILENAME_ENCODER",
+        "MODEL_FILENAME_SCALERS",
+    ):
+        try:
+            nbytes += os.path.getsize(model_files[key])
+        except (KeyError, OSError):
+            pass
+    if artifacts["percentiles"] is not None:
+        nbytes += artifacts["percentiles"].nbytes
+    if artifacts["flat_model"] is not None:
+        nbytes += artifacts["flat_model"].nbytes
+    return int(nbytes)
@@ -0,0 +1,384 @@
+import sys
+import hashlib
+import itertools
+import threading
+import pickle as pkl
+import numpy as np
+import pandas as pd
+import logging
+
+from src import metrics
+from src.model_config import load_config
+from src.storage import open_storage
+from src.compiled_transform import compile_transform
+from src.listing_schema import build_schema
+from src.tree_engine import FlatTreeEnsemble
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactError(IOError):
+    """Model artifacts could not be loaded, because of a bad configurations file or a missing or unreadable artifact
+
+    Raised by :func:`read_artifacts` instead of exiting, so that a server can report the failure and keep serving
+    other models. :func:`load_artifacts` exits on it, for the command line stages.
+    """
+
+
+# Loaded model artifacts, keyed by the config file and artifact file paths they were loaded from
+_ARTIFACTS = {}
+_LOCK = threading.Lock()
+
+# Increases every time artifacts are loaded, so that anything derived from a model can tell when it changes
+_GENERATION = itertools.count(1)
+
+
+def get_artifacts(
+    modelconfig, model_file=None, enc_file=None, scalers_file=None, s3_bucket_name=None
+):
+    """Return the model artifacts for a modelconfig, loading them from disk only on first use in this process
+
+    Args:
+        modelconfig (str): location of the YAML config file
+        model_file (str, optional): local file path of the trained model object. Defaults to None (checks the modelconfig file).
+        enc_file (str, optional): local file path of the encoders. Defaults to None (checks the modelconfig file).
+        scalers_file (str, optional): local file path of the scalers. Defaults to None (checks the modelconfig file).
+        s3_bucket_name (str, optional): name of the S3 bucket to obtain model artifacts from on first load. Defaults to None.
+
+    Returns:
+        :obj:`dict`: loaded artifacts with keys `config`, `model`, `encoder`, `scalers`, `percentiles`, `transform`,
+            `schema`, `flat_model`, and `generation`
+
+    Raises:
+        :class:`ArtifactError`: if the artifacts cannot be loaded
+    """
+
+    key = (str(modelconfig), model_file, enc_file, scalers_file)
+    artifacts = _ARTIFACTS.get(key)
+    if artifacts is None:
+        with _LOCK:
+            # Another thread may have finished loading while waiting on the lock
+            artifacts = _ARTIFACTS.get(key)
+            if artifacts is None:
+                artifacts = read_artifacts(
+                    modelconfig, model_file, enc_file, scalers_file, s3_bucket_name
+                )
+                _ARTIFACTS[key] = artifacts
+    return artifacts
+
+
+def reload_artifacts(
+    modelconfig, model_file=None, enc_file=None, scalers_file=None, s3_bucket_name=None
+):
+    """Re-read the model artifacts for a modelconfig and replace the cached copy
+
+    Args:
+        modelconfig (str): location of the YAML config file
+        model_file (str, optional): local file path of the trained model object. Defaults to None (checks the modelconfig file).
+        enc_file (str, optional): local file path of the encoders. Defaults to None (checks the modelconfig file).
+        scalers_file (str, optional): local file path of the scalers. Defaults to None (checks the modelconfig file).
+        s3_bucket_name (str, optional): name of the S3 bucket to re-download model artifacts from. Defaults to None.
+
+    Returns:
+        :obj:`dict`: newly loaded artifacts
+
+    Raises:
+        :class:`ArtifactError`: if the artifacts cannot be loaded, in which case the cached copy is kept
+    """
+
+    key = (str(modelconfig), model_file, enc_file, scalers_file)
+    artifacts = read_artifacts(
+        modelconfig, model_file, enc_file, scalers_file, s3_bucket_name
+    )
+    with _LOCK:
+        _ARTIFACTS[key] = artifacts
+    logger.info("Reloaded model artifacts for {}.".format(modelconfig))
+    return artifacts
+
+
+def invalidate_artifacts(modelconfig=None):
+    """Drop cached model artifacts so that the next request loads them again
+
+    Args:
+        modelconfig (str, optional): location of the YAML config file whose artifacts to drop.
+            Defaults to None (drops all cached artifacts).
+    """
+
+    with _LOCK:
+        if modelconfig is None:
+            _ARTIFACTS.clear()
+        else:
+            for key in [k for k in _ARTIFACTS if k[0] == str(modelconfig)]:
+                del _ARTIFACTS[key]
+    logger.info("Invalidated cached model artifacts.")
+
+
+def load_artifacts(
+    modelconfig, model_file=None, enc_file=None, scalers_file=None, s3_bucket_name=None
+):
+    """Load the model artifacts with :func:`read_artifacts`, exiting if they cannot be loaded
+
+    Args:
+        modelconfig (str): location of the YAML config file
+        model_file (str, optional): local file path of the trained model object. Defaults to None (checks the modelconfig file).
+        enc_file (str, optional): local file path of the encoders. Defaults to None (checks the modelconfig file).
+        scalers_file (str, optional): local file path of the scalers. Defaults to None (checks the modelconfig file).
+        s3_bucket_name (str, optional): name of the S3 bucket to obtain model, encoder, and scaler artifacts. Defaults to None.
+
+    Returns:
+        :obj:`dict`: loaded artifacts, as returned by :func:`read_artifacts`
+    """
+
+    try:
+        return read_artifacts(
+            modelconfig, model_file, enc_file, scalers_file, s3_bucket_name
+        )
+    except ArtifactError as e:
+        logger.error(e)
+        sys.exit(1)
+
+
+def read_artifacts(
+    modelconfig, model_file=None, enc_file=None, scalers_file=None, s3_bucket_name=None
+):
+    """Read the configurations, unpickle the trained model object, encoder, and scalers, and load the percentile index
+
+    Args:
+        modelconfig (str): location of the YAML config file
+        model_file (str, optional): local file path of the trained model object. Defaults to None (checks the modelconfig file).
+        enc_file (str, optional): local file path of the encoders. Defaults to None (checks the modelconfig file).
+        scalers_file (str, optional): local file path of the scalers. Defaults to None (checks the modelconfig file).
+        s3_bucket_name (str, optional): name of the S3 bucket to obtain model, encoder, and scaler artifacts. Defaults to None.
+            If not None, then model artifacts will be pulled from S3. Otherwise, will search local file paths for objects.
+
+    Returns:
+        :obj:`dict`: loaded artifacts with keys `config`, `model`, `encoder`, `scalers`, `percentiles`, `transform`,
+            `schema`, `flat_model`, and `generation`
+
+    Raises:
+        :class:`ArtifactError`: if the configurations file or a model artifact cannot be read
+    """
+
+    logger.info("Reading in configs from modelconfig.yml.")
+    try:
+        with metrics.timer("yaml_load"):
+            config = load_config(modelconfig)
+            s3_objects = config.s3_objects
+            # The flattened model artifact is written from the configured model file, not an overridden one
+            model_file_overridden = model_file is not None
+            if model_file is None:
+                model_file = config.model_files[served_model(config)[0]]
+            if enc_file is None:
+                enc_file = config.model_files["MODEL_FILENAME_ENCODER"]
+            if scalers_file is None:
+                scalers_file = config.model_files["MODEL_FILENAME_SCALERS"]
+            if s3_bucket_name is not None:
+                storage = open_storage(config, s3_bucket_name)
+    except KeyError as e:
+        raise ArtifactError(
+            "Encountered error when assigning variable from configurations file {}: {}".format(
+                modelconfig, e
+            )
+        ) from e
+    except (FileNotFoundError, IOError) as e:
+        raise ArtifactError(
+            "Encountered error in reading in the configurations file {}: {}".format(
+                modelconfig, e
+            )
+        ) from e
+
+    downloaded = {}
+    # Array artifacts that could not be fetched, whose local files may be left from another model
+    stale = set()
+    if s3_bucket_name is not None:
+        logger.info("Downloading model artifacts from S3.")
+        with metrics.timer("s3_download"):
+            # Pickled objects are unpickled straight from memory, while arrays are written to their local files
+            # so that they can be memory-mapped. Pickles that cannot be fetched fail the load, since the local
+            # files may belong to another model, while arrays that cannot be fetched are rebuilt from the data and
+            # the trained model object.
+            for local_file, s3_object in (
+                (model_file, served_model(config)[1]),
+                (enc_file, "S3_OBJECT_MODEL_ENCODER"),
+                (scalers_file, "S3_OBJECT_MODEL_SCALERS"),
+            ):
+                try:
+                    downloaded[local_file] = storage.read_bytes(s3_objects[s3_object])
+                except (KeyError, IOError) as e:
+                    raise ArtifactError(
+                        "Encountered error when downloading model artifact {}: {}".format(
+                            s3_object, e
+                        )
+                    ) from e
+            for name, s3_object in (
+                ("MODEL_FILENAME_PERCENTILES", "S3_OBJECT_MODEL_PERCENTILES"),
+                ("MODEL_FILENAME_FLAT", "S3_OBJECT_MODEL_FLAT"),
+            ):
+                if name in config.model_files:
+                    try:
+                        storage.get_file(
+                            s3_objects[s3_object], config.model_files[name]
+                        )
+                    except IOError as e:
+                        logger.warning(e)
+                        stale.add(name)
+        storage.report("load_artifacts")
+
+    try:
+        with metrics.timer("unpickle"):
+            logger.info("Loading in trained model object from {}.".format(model_file))
+            with _open_artifact(model_file, downloaded) as file:
+                model_bytes = file.read()
+            model = pkl.loads(model_bytes)
+
+            logger.info("Loading in encoder object from {}.".format(enc_file))
+            with _open_artifact(enc_file, downloaded) as file:
+                enc = pkl.load(file)
+
+            logger.info("Loading in scalers objects from {}.".format(scalers_file))
+            with _open_artifact(scalers_file, downloaded) as file:
+                scalers = pkl.load(file)
+    except KeyError as e:
+        raise ArtifactError(
+            "Encountered error when loading in model artifacts: {}".format(e)
+        ) from e
+    except (FileNotFoundError, IOError) as e:
+        raise ArtifactError(
+            "Encountered error when reading in model artifacts: {}".format(e)
+        ) from e
+
+    with metrics.timer("percentile_load"):
+        percentiles = load_percentiles(
+            config, rebuild="MODEL_FILENAME_PERCENTILES" in stale
+        )
+
+    artifacts = {
+        "config": config,
+        "model": model,
+        "encoder": enc,
+        "scalers": scalers,
+        "percentiles": percentiles,
+    }
+    artifacts["transform"] = compile_transform(artifacts)
+    artifacts["schema"] = build_schema(artifacts)
+    with metrics.timer("flat_model_load"):
+        model_sha256 = None
+        if not model_file_overridden and "MODEL_FILENAME_FLAT" not in stale:
+            model_sha256 = hashlib.sha256(model_bytes).hexdigest()
+        artifacts["flat_model"] = load_flat_model(config, model, model_sha256)
+    artifacts["generation"] = next(_GENERATION)
+
+    return artifacts
+
+
+def load_percentiles(config, rebuild=False):
+    """Load the sorted target values used to rank predictions
+
+    Falls back to reading and sorting the target column of the features data file if the percentile index
+    artifact has not been written by `run_train_model`. The index is memory-mapped if `serving.MMAP_ARTIFACTS`
+    is set.
+
+    Args:
+        config (:class:`src.model_config.ModelConfig` or :obj:`dict`): parsed configurations
+        rebuild (bool, optional): build the index from the features data without reading the percentile index
+            artifact. Defaults to False.
+
+    Returns:
+        :class:`numpy.ndarray`: sorted target values, or None if neither source could be read
+    """
+
+    if not rebuild:
+        try:
+            percentiles_file = config["model_files"]["MODEL_FILENAME_PERCENTILES"]
+            logger.info("Loading in percentile index from {}.".format(percentiles_file))
+            return np.load(percentiles_file, mmap_mode=_mmap_mode(config))
+        except (KeyError, FileNotFoundError, IOError):
+            logger.warning(
+                "Percentile index not found, building it from the features data."
+            )
+
+    try:
+        y = pd.read_csv(config["data_files"]["DATA_FILENAME_FEATURES"])[
+            config["TARGET_COL"]
+        ].values
+        return np.sort(y[~np.isnan(y)])
+    except Exception as e:
+        logger.error("Encountered error when loading in actual reviews per month data.")
+        logger.error(e)
+        return None
+
+
+def load_flat_model(config, model, model_sha256=None):
+    """Load the flattened trees used by the flat scoring engine, if the engine is enabled
+
+    Falls back to flattening the trained model object in memory if the flattened model artifact has not been
+    written by `run_train_model`, or was flattened from a different pickle than `model_sha256`. The arrays are
+    memory-mapped if `serving.MMAP_ARTIFACTS` is set, so that the pages are shared by every process serving the
+    same file instead of copied into each one.
+
+    Args:
+        config (:class:`src.model_config.ModelConfig`): parsed configurations
+        model (:class:`sklearn.ensemble.VotingRegressor`): trained model object
+        model_sha256 (str, optional): hex SHA-256 hash of the pickle `model` was loaded from. Defaults to None
+            (always flattens `model` in memory).
+
+    Returns:
+        :class:`src.tree_engine.FlatTreeEnsemble`: flattened model, or None if the engine is disabled or unavailable
+    """
+
+    if config.serving.get("ENGINE", "sklearn") != "flat":
+        return None
+
+    # The flattened model artifact holds the trees of the ensemble, so a served student is flattened here
+    if model_sha256 is not None and served_model(config)[0] == "MODEL_FILENAME_TMO":
+        try:
+            flat_file = config.model_files["MODEL_FILENAME_FLAT"]
+            logger.info("Loading in flattened model from {}.".format(flat_file))
+            flat = FlatTreeEnsemble.load(flat_file, mmap_mode=_mmap_mode(config))
+            if flat.source_sha256 == model_sha256:
+                return flat
+            logger.warning(
+                "Flattened model in {} was not flattened from the loaded model object, flattening it.".format(
+                    flat_file
+                )
+            )
+        except (KeyError, FileNotFoundError, IOError):
+            logger.warning("Flattened model not found, flattening the trained model object.")
+
+    try:
+        return FlatTreeEnsemble.from_model(model)
+    except Exception as e:
+        logger.error("Could not flatten the trained model object, scoring with sklearn.")
+        logger.error(e)
+        return None
+
+
+def served_model(config):
+    """Return the keys in `model_files` and `s3_objects` of the model object selected by `serving.MODEL`
+
+    Args:
+        config (:class:`src.model_config.ModelConfig`): parsed configurations
+
+    Returns:
+        tuple: (`model_files` key, `s3_objects` key), of the student model with `MODEL: student` and of the
+            trained model object otherwise
+    """
+
+    if config.serving.get("MODEL", "ensemble") == "student":
+        return "MODEL_FILENAME_STUDENT", "S3_OBJECT_MODEL_STUDENT"
+    return "MODEL_FILENAME_TMO", "S3_OBJECT_MODEL_TMO"
+
+
+def _open_artifact(local_file, downloaded):
+    """Artifact downloaded into memory for `local_file`, or the local file if it was not downloaded"""
+
+    if downloaded.get(local_file) is not None:
+        return downloaded[local_file]
+    return open(local_file, "rb")
+
+
+def _mmap_mode(config):
+    """Mode to memory-map array artifacts with, or None to read them into memory"""
+
+    serving = config.get("serving") or {}
+    return "r" if serving.get("MMAP_ARTIFACTS", False) else None
@@ -1,33 +1,10 @@
-import sys
-import pandas as pd
 import numpy as np
-import math
-import xgboost as xgb
-import pickle as pkl
+import pandas as pd
 import logging
-import logging.config
-import yaml
-
-from scipy import stats
-from sklearn.experimental import enable_iterative_imputer
-from sklearn.impute import IterativeImputer
-from sklearn.preprocessing import StandardScaler, OneHotEncoder, MinMaxScaler
-from sklearn.model_selection import train_test_split
-from sklearn.model_selection import cross_val_score
-from sklearn.model_selection import GridSearchCV
-from sklearn.model_selection import RandomizedSearchCV
-from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.ensemble import GradientBoostingRegressor
-from sklearn.ensemble import VotingRegressor
-from xgboost import XGBRegressor
-from sklearn.metrics import mean_squared_error
-
-import config
-from src.helpers import read_from_s3, check_for_valid_cols
-
-
-logging.config.fileConfig(config.LOGGING_CONFIG)
+
+from src import metrics
+from src.model_registry import get_artifacts
+
 logger = logging.getLogger(__name__)
 
 
@@ -39,6 +16,8 @@ def run_predict(
     scalers_file=None,
     s3_bucket_name=None,
     percentile=True,
+    artifacts=None,
+    timings=None,
 ):
     """Generate the predicted number of reviews per month and percentile rank given app user input
 
@@ -51,99 +30,147 @@ def run_predict(
         s3_bucket_name (str, optional): name of the S3 bucket to obtain model, encoder, and scaler artifacts. Defaults to None.
             If not None, then model artifacts will be pulled from S3. Otherwise, will search local file paths for objects.
         percentile (bool, optional): whether to return percentile rank score. Defaults to True.
+        artifacts (:obj:`dict`, optional): already loaded artifacts from :mod:`src.model_registry`. Defaults to None
+            (artifacts are fetched from the process-wide registry, which only reads them from disk on first use).
+        timings (:obj:`dict`, optional): set `timings["predict"]` to the seconds the model call took. Defaults to None.
 
     Returns:
         pred (float): predicted number of reviews per month
         perc (float): percentile rank of predicted value relative to existing listins
     """
 
-    logger.info("Reading in configs from modelconfig.yml.")
-    try:
-        with open(modelconfig, "r") as f:
-            config = yaml.load(f, Loader=yaml.FullLoader)
-            s3_objects = config["s3_objects"]
-            # Load in model artifacts
-            if model_file is None:
-                model_file = config["model_files"]["MODEL_FILENAME_TMO"]
-            if enc_file is None:
-                enc_file = config["model_files"]["MODEL_FILENAME_ENCODER"]
-            if scalers_file is None:
-                scalers_file = config["model_files"]["MODEL_FILENAME_SCALERS"]
-            # Load in dataset configurations
-            COLS_NUM_STD = config["train_model"]["COLS_NUM_STD"]
-            COLS_NUM_MINMAX = config["train_model"]["COLS_NUM_MINMAX"]
-            COLS_CAT = config["train_model"]["COLS_CAT"]
-            if percentile == True:
-                data_file = config["data_files"]["DATA_FILENAME_FEATURES"]
-                target_col = config["TARGET_COL"]
-    except KeyError:
-        logger.error(
-            "Encountered error when assigning variable from configurations file."
-        )
-        sys.exit(1)
-    except (FileNotFoundError, IOError):
-        logger.error("Encountered error in reading in the configurations file.")
-        sys.exit(1)
-
-    if s3_bucket_name is not None:
-        logger.info("Downloading model artifacts from S3.")
-        read_from_s3(s3_objects["S3_OBJECT_MODEL_TMO"], s3_bucket_name, model_file)
-        read_from_s3(s3_objects["S3_OBJECT_MODEL_ENCODER"], s3_bucket_name, enc_file)
-        read_from_s3(
-            s3_objects["S3_OBJECT_MODEL_SCALERS"], s3_bucket_name, scalers_file
+    if artifacts is None:
+        artifacts = get_artifacts(
+            modelconfig, model_file, enc_file, scalers_file, s3_bucket_name
         )
 
-    # Load model artifacts
-    try:
-        logger.info("Loading in trained model object from {}.".format(model_file))
-        with open(model_file, "rb") as file:
-            model = pkl.load(file)
-
-        logger.info("Loading in encoder object from {}.".format(enc_file))
-        with open(enc_file, "rb") as file:
-            enc = pkl.load(file)
-
-        logger.info("Loading in scalers objects from {}.".format(scalers_file))
-        with open(scalers_file, "rb") as file:
-            scalers = pkl.load(file)
-    except KeyError:
-        logger.error("Encountered error when loading in model artifacts.")
-        sys.exit(1)
-    except (FileNotFoundError, IOError):
-        logger.error("Encountered error when reading in model artifacts.")
-        sys.exit(1)
-
-    # Check that all features expected are in the dataframe
-    logger.debug("Checking that expected feature are in the input dataframe.")
-    COLS_NUM_STD = check_for_valid_cols(COLS_NUM_STD, X)
-    COLS_NUM_MINMAX = check_for_valid_cols(COLS_NUM_MINMAX, X)
-    COLS_CAT = check_for_valid_cols(COLS_CAT, X)
-
-    # Transform raw input data
-    logger.debug("Performing transformations on input data.")
-    X = transform_input(X, enc, scalers, COLS_NUM_STD, COLS_NUM_MINMAX, COLS_CAT)
+    # Transform raw input data, taking the compiled path for a single complete listing
+    transform = artifacts.get("transform")
+    model = select_model(artifacts, X.shape[0])
+    with metrics.timer("transform"):
+        if transform is not None and X.shape[0] == 1 and transform.accepts(X.columns):
+            try:
+                X = transform.transform_for(X, model)
+            except Exception as e:
+                logger.error("Could not apply compiled transform to input dataframe.")
+                logger.error(e)
+                metrics.inc("errors_total", stage="transform")
+                X = prepare_input(X, artifacts)
+        else:
+            X = prepare_input(X, artifacts)
 
     # Generate prediction
     logger.debug("Generating prediction.")
-    pred = generate_prediction(X, model)
+    with metrics.timer("predict", timings):
+        pred = generate_prediction(X, model)
 
     # Generate percentile
     if percentile == True:
         logger.debug("Calculating percentile rank.")
-        try:
-            y = pd.read_csv(data_file)[target_col]
-            perc = generate_percentile(pred, y)
-        except:
-            logger.error(
-                "Encountered error when loading in actual reviews per month data."
-            )
+        if artifacts.get("percentiles") is None:
+            logger.error("No actual reviews per month data to rank the prediction against.")
             perc = None
+        else:
+            with metrics.timer("percentile"):
+                perc = generate_percentile(
+                    pred, artifacts["percentiles"], presorted=True
+                )
     else:
         perc = None
 
     return pred, perc
 
 
+def run_predict_batch(X, modelconfig=None, percentile=True, artifacts=None):
+    """Generate predicted numbers of reviews per month and percentile ranks for many listings in one pass
+
+    Args:
+        X (:class:`pandas.DataFrame`): dataframe containing one row per listing
+        modelconfig (str, optional): location of the YAML config file. Defaults to None.
+        percentile (bool, optional): whether to return percentile rank scores. Defaults to True.
+        artifacts (:obj:`dict`, optional): already loaded artifacts from :mod:`src.model_registry`. Defaults to None
+            (artifacts are fetched from the process-wide registry).
+
+    Returns:
+        preds (:class:`numpy.ndarray`): predicted number of reviews per month, in the order of the rows of `X`
+        percs (:class:`numpy.ndarray`): percentile ranks of the predicted values, or None if not requested
+    """
+
+    if artifacts is None:
+        artifacts = get_artifacts(modelconfig)
+
+    # Transform all listings together, so the encoder and scalers each run once
+    with metrics.timer("transform_batch"):
+        X = prepare_input(X.reset_index(drop=True), artifacts)
+
+    logger.debug("Generating predictions for {} listings.".format(X.shape[0]))
+    with metrics.timer("predict_batch"):
+        preds = generate_predictions(X, select_model(artifacts, X.shape[0]))
+
+    percs = None
+    if percentile == True and preds is not None:
+        logger.debug("Calculating percentile ranks.")
+        if artifacts.get("percentiles") is None:
+            logger.error("No actual reviews per month data to rank the predictions against.")
+        else:
+            with metrics.timer("percentile_batch"):
+                percs = generate_percentile(
+                    preds, artifacts["percentiles"], presorted=True
+                )
+
+    return preds, percs
+
+
+def select_model(artifacts, n_rows):
+    """Return the model object to score a batch of `n_rows` listings with
+
+    The flattened trees avoid sklearn's per-estimator overhead, which dominates for small batches, while
+    larger batches are scored faster by sklearn's compiled per-tree traversal.
+
+    Args:
+        artifacts (:obj:`dict`): loaded artifacts from :mod:`src.model_registry`
+        n_rows (int): number of listings to score
+
+    Returns:
+        object with a `predict` method: the flattened model if enabled and `n_rows` is small enough, else the trained model object
+    """
+
+    flat_model = artifacts.get("flat_model")
+    if flat_model is not None:
+        max_rows = artifacts["config"].serving.get("FLAT_MAX_ROWS", 128)
+        if n_rows <= max_rows:
+            return flat_model
+    return artifacts["model"]
+
+
+def prepare_input(X, artifacts):
+    """Check the input against the configured feature lists and apply the encoder and scalers
+
+    Args:
+        X (:class:`pandas.DataFrame`): dataframe containing user's input
+        artifacts (:obj:`dict`): loaded artifacts from :mod:`src.model_registry`
+
+    Returns:
+        :class:`pandas.DataFrame`: input dataframe with applied data transformations to be fed into TMO for prediction
+    """
+
+    # Check that all features expected are in the dataframe, once per distinct set of input columns
+    config = artifacts["config"]
+    COLS_NUM_STD = config.valid_cols("cols_num_std", X.columns)
+    COLS_NUM_MINMAX = config.valid_cols("cols_num_minmax", X.columns)
+    COLS_CAT = config.valid_cols("cols_cat", X.columns)
+
+    logger.debug("Performing transformations on input data.")
+    return transform_input(
+        X,
+        artifacts["encoder"],
+        artifacts["scalers"],
+        COLS_NUM_STD,
+        COLS_NUM_MINMAX,
+        COLS_CAT,
+    )
+
+
 def transform_input(X, enc, scalers, cols_std=None, cols_minmax=None, cols_enc=None):
     """Transform input data
 
@@ -208,7 +235,7 @@ def generate_prediction(X, model):
     """Return predicted target value for input data
 
     Args:
-        X (:class:`pandas.DataFrame`): input data to generate a prediction for
+        X (:class:`pandas.DataFrame` or :class:`numpy.ndarray`): input data to generate a prediction for
         model (:class:`sklearn.ensemble.VotingRegressor`): trained model object
 
     Returns:
@@ -220,22 +247,59 @@ def generate_prediction(X, model):
     except Exception as e:
         logger.error("Could not generate prediction.")
         logger.error(e)
+        metrics.inc("errors_total", stage="predict")
         return None
 
 
-def generate_percentile(pred, y):
-    """Return percentile rank of predicted value relative to actual values
+def generate_predictions(X, model):
+    """Return predicted target values for every row of the input data
 
     Args:
-        pred (float): predicted number of reviews per month
+        X (:class:`pandas.DataFrame`): input data to generate predictions for
+        model (:class:`sklearn.ensemble.VotingRegressor`): trained model object
+
+    Returns:
+        :class:`numpy.ndarray`: predicted target values, in the order of the rows of `X`
+    """
+
+    try:
+        return np.round(np.exp(model.predict(X)), 2)
+    except Exception as e:
+        logger.error("Could not generate predictions.")
+        logger.error(e)
+        metrics.inc("errors_total", stage="predict_batch")
+        return None
+
+
+def generate_percentile(pred, y, presorted=False):
+    """Return percentile rank of predicted value(s) relative to actual values
+
+    Matches :func:`scipy.stats.percentileofscore` with `kind="rank"`, but ranks by binary search so
+    that a presorted `y` is ranked against in O(log n) per prediction.
+
+    Args:
+        pred (float or :obj:`list`): predicted number(s) of reviews per month
         y (:obj:`list`): list of actual reviews per month
+        presorted (bool, optional): whether `y` is already sorted in ascending order. Defaults to False.
 
     Returns:
-        float: percentile rank
+        float or :class:`numpy.ndarray`: percentile rank(s), in the same shape as `pred`
     """
 
     try:
-        return np.round(stats.percentileofscore(y, pred), 2)
+        preds = np.asarray(pred)
+        if not np.issubdtype(preds.dtype, np.number):
+            raise TypeError("Predictions must be numeric, got {}.".format(preds.dtype))
+        y = np.asarray(y)
+        if not presorted:
+            y = np.sort(y)
+
+        # Number of actual values strictly below and at or below each prediction
+        left = np.searchsorted(y, preds, side="left")
+        right = np.searchsorted(y, preds, side="right")
+        perc = (left + right + (right > left)) * (50.0 / y.shape[0])
+
+        return np.round(perc, 2) if perc.ndim > 0 else float(np.round(perc, 2))
     except Exception as e:
         logger.error("Could not calculate percentile rank.")
         logger.error(e)
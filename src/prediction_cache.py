@@ -0,0 +1,163 @@
+import math
+import numbers
+import threading
+import collections
+import logging
+
+from src.predict import run_predict
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionCache:
+    """Bounded least-recently-used cache of predictions for single listings
+
+    Entries are keyed on the normalized feature values of a listing and belong to one generation of model
+    artifacts. The first lookup made with artifacts from a different generation (e.g. after
+    :func:`src.model_registry.reload_artifacts`) empties the cache.
+
+    Args:
+        maxsize (int): maximum number of cached predictions. A size of 0 disables caching.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, generation):
+        """Return the cached (prediction, percentile) for `key`, or None on a miss"""
+
+        with self._lock:
+            self._check_generation(generation)
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, generation, value):
+        """Cache the (prediction, percentile) for `key`, evicting the least recently used entry if full"""
+
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._check_generation(generation)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all cached predictions"""
+
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """Return the cache size and hit/miss counters
+
+        Returns:
+            :obj:`dict`: `size`, `maxsize`, `hits`, `misses`, `hit_rate`, `evictions`, and `invalidations`
+        """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _check_generation(self, generation):
+        if generation != self._generation:
+            if self._entries:
+                logger.info(
+                    "Model artifacts changed, dropping {} cached predictions.".format(
+                        len(self._entries)
+                    )
+                )
+                self._entries.clear()
+                self.invalidations += 1
+            self._generation = generation
+
+
+def listing_key(X, features):
+    """Build a hashable cache key from the feature values of a single listing
+
+    Numbers are normalized to float so that e.g. `1` and `1.0` share an entry, strings are stripped of
+    surrounding whitespace, and missing values are normalized to None.
+
+    Args:
+        X (:class:`pandas.DataFrame`): dataframe containing one listing
+        features (:obj:`list`): names of the model input features, in the order used for the key
+
+    Returns:
+        tuple: normalized feature values
+    """
+
+    row = X.iloc[0]
+    return tuple(_normalize(row[feature]) for feature in features)
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, numbers.Number):
+        value = float(value)
+        return None if math.isnan(value) else value
+    if value is None:
+        return None
+    return str(value)
+
+
+def run_predict_cached(X, artifacts, cache, percentile=True, timings=None):
+    """Generate the prediction and percentile rank for one listing, reusing a cached result if possible
+
+    Inputs with more than one listing or with columns outside of the model input features bypass the cache.
+    Failed predictions are not cached.
+
+    Args:
+        X (:class:`pandas.DataFrame`): dataframe containing user's input
+        artifacts (:obj:`dict`): loaded artifacts from :mod:`src.model_registry`
+        cache (:class:`PredictionCache`): cache to read from and write to
+        percentile (bool, optional): whether to return percentile rank scores. Defaults to True.
+        timings (:obj:`dict`, optional): set `timings["predict"]` to the seconds the model call took, left unset
+            if the result was cached. Defaults to None.
+
+    Returns:
+        pred (float): predicted number of reviews per month
+        perc (float): percentile rank of predicted value relative to existing listins
+    """
+
+    features = artifacts["config"].select_features
+    if X.shape[0] != 1 or set(X.columns) != set(features):
+        return run_predict(
+            X, percentile=percentile, artifacts=artifacts, timings=timings
+        )
+
+    key = (listing_key(X, features), percentile)
+    generation = artifacts.get("generation")
+    cached = cache.get(key, generation)
+    if cached is not None:
+        return cached
+
+    pred, perc = run_predict(
+        X, percentile=percentile, artifacts=artifacts, timings=timings
+    )
+    if pred is not None:
+        cache.put(key, generation, (pred, perc))
+    return pred, perc
@@ -0,0 +1,103 @@
+import threading
+import collections
+import logging
+import sqlalchemy as sql
+
+logger = logging.getLogger(__name__)
+
+
+class RecentListings:
+    """Ring buffer of the most recently submitted listings, newest first
+
+    The buffer is filled as listings are submitted, so showing the recent history does not query the
+    database. On first use it is seeded with the newest rows of the table through the `created_at` index.
+
+    Args:
+        get_engine (callable): returns the :class:`sqlalchemy.engine.Engine` to seed from
+        table (:class:`sqlalchemy.Table`): table of listings, with a `created_at` column
+        maxlen (int): number of listings to keep
+    """
+
+    def __init__(self, get_engine, table, maxlen):
+        self.get_engine = get_engine
+        self.table = table
+        self.maxlen = maxlen
+        self._rows = collections.deque(maxlen=maxlen)
+        self._seeded = False
+        self._lock = threading.Lock()
+
+    def append(self, row):
+        """Add a newly submitted listing to the front of the buffer
+
+        Args:
+            row (:obj:`dict`): column values of the listing
+        """
+
+        with self._lock:
+            self._rows.appendleft(row)
+
+    def rows(self):
+        """Return the buffered listings, newest first, seeding the buffer from the database on first use
+
+        Returns:
+            :obj:`list` of :obj:`dict`: up to `maxlen` listings
+        """
+
+        if not self._seeded:
+            self.seed()
+        with self._lock:
+            return list(self._rows)
+
+    def seed(self):
+        """Fill the buffer with the newest listings in the table, behind any listings added since startup"""
+
+        try:
+            newest = query_recent_listings(self.get_engine(), self.table, self.maxlen)
+        except Exception as e:
+            logger.error("Could not seed recent listings from the database.")
+            logger.error(e)
+            newest = []
+
+        with self._lock:
+            if self._seeded:
+                return
+            # Listings appended before seeding are newer than the table's, and may already have been written to it
+            cutoff = min(
+                (row["created_at"] for row in self._rows if row.get("created_at")),
+                default=None,
+            )
+            for row in newest:
+                if len(self._rows) == self.maxlen:
+                    break
+                if cutoff is None or (row["created_at"] and row["created_at"] < cutoff):
+                    self._rows.append(row)
+            self._seeded = True
+        logger.debug("Seeded {} recent listings.".format(len(newest)))
+
+    def reset(self):
+        """Empty the buffer so that it is seeded again on next use"""
+
+        with self._lock:
+            self._rows.clear()
+            self._seeded = False
+
+
+def query_recent_listings(engine, table, limit):
+    """Query the newest listings, using the index on `created_at`
+
+    Args:
+        engine (:class:`sqlalchemy.engine.Engine`): engine of the database
+        table (:class:`sqlalchemy.Table`): table of listings, with a `created_at` column
+        limit (int): number of listings to return
+
+    Returns:
+        :obj:`list` of :obj:`dict`: listings, newest first
+    """
+
+    query = (
+        sql.select([table])
+        .order_by(table.c.created_at.desc(), table.c.id.desc())
+        .limit(limit)
+    )
+    with engine.connect() as conn:
+        return [dict(row) for row in conn.execute(query)]
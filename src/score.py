@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import collections
+import logging
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+
+from src.model_registry import ArtifactError, get_artifacts
+from src.predict import (
+    prepare_input,
+    select_model,
+    generate_predictions,
+    generate_percentile,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def run_score(args):
+    """Score a CSV file of listings of any size in chunks, writing predictions in input order
+
+    Args:
+        args (args from user): contains
+            - config: location of YAML config file
+            - input: local file path of the listings to score
+            - output: local file path to write the scored listings to
+            - chunksize: number of listings per chunk
+            - n_jobs: number of worker processes
+    """
+
+    if args.n_jobs is None or args.n_jobs < 1:
+        args.n_jobs = os.cpu_count() or 1
+
+    logger.info(
+        "Scoring listings in {} in chunks of {} with {} worker(s).".format(
+            args.input, args.chunksize, args.n_jobs
+        )
+    )
+    try:
+        chunks = pd.read_csv(args.input, chunksize=args.chunksize)
+    except (FileNotFoundError, IOError):
+        logger.error("Encountered error in reading in the listings file.")
+        sys.exit(1)
+
+    # Load the artifacts before starting the pool: a bad config fails fast, and forked workers inherit them
+    try:
+        get_artifacts(args.config)
+    except ArtifactError as e:
+        logger.error(e)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    n_rows = score_chunks(chunks, args.config, args.output, args.n_jobs)
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        "Scored {} listings in {:.2f} seconds ({:.0f} rows/sec). Output written to {}.".format(
+            n_rows, elapsed, n_rows / max(elapsed, 1e-9), args.output
+        )
+    )
+
+
+def score_chunks(chunks, modelconfig, output, n_jobs=1):
+    """Score an iterable of listing chunks and append each scored chunk to the output file in order
+
+    At most `2 * n_jobs` chunks are read ahead of the chunk being written, so memory use is bounded by the
+    chunk size rather than by the size of the input.
+
+    Args:
+        chunks (iterable of :class:`pandas.DataFrame`): listings to score
+        modelconfig (str): location of the YAML config file
+        output (str): local file path to write the scored listings to
+        n_jobs (int, optional): number of worker processes. Defaults to 1 (score in this process).
+
+    Returns:
+        int: number of listings scored
+    """
+
+    n_rows = 0
+    start = time.perf_counter()
+    header = True
+
+    def write(scored):
+        nonlocal n_rows, header
+        scored.to_csv(output, mode="w" if header else "a", header=header, index=False)
+        header = False
+        n_rows += scored.shape[0]
+        logger.info(
+            "Scored {} listings ({:.0f} rows/sec).".format(
+                n_rows, n_rows / max(time.perf_counter() - start, 1e-9)
+            )
+        )
+
+    if n_jobs == 1:
+        for chunk in chunks:
+            write(score_chunk(chunk, modelconfig))
+        return n_rows
+
+    # Futures are kept in submission order, so popping from the left writes chunks in input order
+    pending = collections.deque()
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        for chunk in chunks:
+            pending.append(executor.submit(score_chunk, chunk, modelconfig))
+            if len(pending) >= 2 * n_jobs:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+
+    return n_rows
+
+
+def score_chunk(chunk, modelconfig):
+    """Generate predictions and percentile ranks for one chunk of listings
+
+    The model artifacts are fetched from the process-wide registry, so each worker process loads them once.
+
+    Args:
+        chunk (:class:`pandas.DataFrame`): listings to score
+        modelconfig (str): location of the YAML config file
+
+    Returns:
+        :class:`pandas.DataFrame`: `chunk` with `predicted_reviews_per_month` and `percentile` columns added
+    """
+
+    artifacts = get_artifacts(modelconfig)
+    chunk = chunk.reset_index(drop=True)
+
+    # Listings with known outcomes (e.g. the features data) keep their target column in the output only
+    X = chunk.drop(columns=[artifacts["config"].target_col], errors="ignore")
+
+    # The model cannot score listings with missing inputs, so those are left without a prediction
+    complete = X.notna().all(axis=1).values
+    if not complete.all():
+        logger.warning(
+            "Skipping {} listings with missing inputs.".format((~complete).sum())
+        )
+    preds = np.full(chunk.shape[0], np.nan)
+    percs = np.full(chunk.shape[0], np.nan)
+
+    if complete.any():
+        X = prepare_input(X[complete].reset_index(drop=True), artifacts)
+        scored = generate_predictions(X, select_model(artifacts, X.shape[0]))
+        if scored is None:
+            logger.error("Could not score chunk of {} listings.".format(X.shape[0]))
+        else:
+            preds[complete] = scored
+            if artifacts.get("percentiles") is not None:
+                percs[complete] = generate_percentile(
+                    scored, artifacts["percentiles"], presorted=True
+                )
+
+    chunk["predicted_reviews_per_month"] = preds
+    chunk["percentile"] = percs
+    return chunk
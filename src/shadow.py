@@ -0,0 +1,278 @@
+import os
+import time
+import math
+import queue
+import atexit
+import threading
+import collections
+import logging
+import numpy as np
+
+from src import metrics
+from src.predict import prepare_input, select_model
+
+logger = logging.getLogger(__name__)
+
+# Put on the queue once per worker to make it exit
+_STOP = object()
+
+# Quantiles of the absolute prediction difference and latency difference reported by `stats`
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class ShadowScorer:
+    """Background threads that score requests with a candidate model and compare it with the primary model
+
+    The request path only pays for `submit`, which hands the listing and the primary model's prediction to a
+    bounded queue and never waits: if the queue is full, the listing is dropped from the comparison. Each worker
+    scores the listing with the candidate artifacts and records both predictions and the latencies of both model
+    calls, leaving out the latency of predictions the primary model served from the prediction cache. The most
+    recent `max_records` comparisons are kept, and running totals over every comparison summarize how far the
+    candidate diverges from the primary model.
+
+    The candidate artifacts are loaded by the first worker that needs them, off the request path. Like
+    :class:`src.write_behind.WriteBehindQueue`, the workers are started lazily and restarted if the process has
+    forked since they were started.
+
+    Args:
+        get_candidate (callable): returns the loaded artifacts of the candidate model, as returned by
+            :func:`src.model_registry.get_artifacts`
+        workers (int, optional): number of worker threads. Defaults to 1.
+        max_pending (int, optional): most listings waiting to be scored before `submit` drops more. Defaults to 1000.
+        max_records (int, optional): most recent comparisons kept. Defaults to 10000.
+    """
+
+    def __init__(self, get_candidate, workers=1, max_pending=1000, max_records=10000):
+        self.get_candidate = get_candidate
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._records = collections.deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self.submitted = 0
+        self.scored = 0
+        self.dropped = 0
+        self.errors = 0
+        self._sum_diff = 0.0
+        self._sum_abs_diff = 0.0
+        self._sum_sq_diff = 0.0
+        self._max_abs_diff = 0.0
+        self._sum_latency_diff = 0.0
+        self._latency_n = 0
+        atexit.register(self.stop)
+
+    def submit(self, X, primary, primary_seconds=None):
+        """Queue a listing to be scored by the candidate model without waiting on it
+
+        Args:
+            X (:class:`pandas.DataFrame`): input dataframe the primary model was scored on, before transformation
+            primary (float): primary model's prediction
+            primary_seconds (float, optional): time the primary model's call took to produce it. Defaults to None
+                (served from the prediction cache, so only the predictions are compared).
+
+        Returns:
+            bool: whether the listing was queued. False if too many listings are waiting.
+        """
+
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((X, primary, primary_seconds))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            metrics.inc("shadow_total", outcome="dropped")
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def flush(self):
+        """Block until every listing queued so far has been scored (or failed)"""
+
+        if any(thread.is_alive() for thread in self._threads):
+            self._queue.join()
+
+    def stop(self, timeout=10.0):
+        """Stop the worker threads once the listings already queued have been scored
+
+        Args:
+            timeout (float, optional): seconds to wait for each worker to finish. Defaults to 10.0.
+        """
+
+        with self._lock:
+            threads = [t for t in self._threads if t.is_alive()]
+            if not threads or self._pid != os.getpid():
+                return
+            self._threads = []
+        for _ in threads:
+            self._queue.put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+
+    def records(self):
+        """Return the most recent comparisons, oldest first
+
+        Returns:
+            :obj:`list`: dicts with `primary`, `candidate`, `diff` (candidate minus primary), `primary_ms`,
+                `candidate_ms`, and `latency_diff_ms` (candidate minus primary), with `primary_ms` and
+                `latency_diff_ms` None for predictions served from the prediction cache
+        """
+
+        with self._lock:
+            return list(self._records)
+
+    def stats(self):
+        """Summarize how the candidate model diverges from the primary model
+
+        Means, RMSE, and maximum cover every comparison; quantiles cover the comparisons kept in `records`.
+        Latency differences only cover the comparisons whose primary prediction was not cached.
+
+        Returns:
+            :obj:`dict`: `pending`, `submitted`, `scored`, `cached`, `dropped`, `errors`, `records`, `mean_diff`,
+                `mean_abs_diff`, `rmse`, `max_abs_diff`, `abs_diff` and `latency_diff_ms` quantiles, and
+                `mean_latency_diff_ms`
+        """
+
+        with self._lock:
+            n = self.scored
+            records = list(self._records)
+            stats = {
+                "pending": self._queue.qsize(),
+                "submitted": self.submitted,
+                "scored": n,
+                "cached": n - self._latency_n,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "records": len(records),
+                "mean_diff": self._sum_diff / n if n else None,
+                "mean_abs_diff": self._sum_abs_diff / n if n else None,
+                "rmse": math.sqrt(self._sum_sq_diff / n) if n else None,
+                "max_abs_diff": self._max_abs_diff if n else None,
+                "mean_latency_diff_ms": (
+                    self._sum_latency_diff / self._latency_n
+                    if self._latency_n
+                    else None
+                ),
+            }
+
+        for name, values in (
+            ("abs_diff", [abs(r["diff"]) for r in records]),
+            (
+                "latency_diff_ms",
+                [
+                    r["latency_diff_ms"]
+                    for r in records
+                    if r["latency_diff_ms"] is not None
+                ],
+            ),
+        ):
+            if values:
+                quantiles = np.percentile(values, [q * 100 for q in QUANTILES])
+                stats[name] = {str(q): float(v) for q, v in zip(QUANTILES, quantiles)}
+            else:
+                stats[name] = {str(q): None for q in QUANTILES}
+        return stats
+
+    def _ensure_workers(self):
+        if self._threads and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._threads and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Listings queued before the fork belong to the parent
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._run, name="shadow-{}".format(i))
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.daemon = True
+                thread.start()
+            logger.debug("Started {} shadow scoring workers.".format(self.workers))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._score(*item)
+            finally:
+                self._queue.task_done()
+
+    def _score(self, X, primary, primary_seconds):
+        try:
+            candidate_artifacts = self.get_candidate()
+            timings = {}
+            candidate = score_candidate(X, candidate_artifacts, timings)
+            candidate_seconds = timings["predict"]
+        except Exception as e:
+            logger.warning("Shadow scoring failed: {}".format(e))
+            with self._lock:
+                self.errors += 1
+            metrics.inc("shadow_total", outcome="error")
+            return
+
+        diff = candidate - primary
+        latency_diff = None
+        if primary_seconds is not None:
+            latency_diff = candidate_seconds - primary_seconds
+        with self._lock:
+            self._records.append(
+                {
+                    "primary": primary,
+                    "candidate": candidate,
+                    "diff": diff,
+                    "primary_ms": _ms(primary_seconds),
+                    "candidate_ms": _ms(candidate_seconds),
+                    "latency_diff_ms": _ms(latency_diff),
+                }
+            )
+            self.scored += 1
+            self._sum_diff += diff
+            self._sum_abs_diff += abs(diff)
+            self._sum_sq_diff += diff ** 2
+            self._max_abs_diff = max(self._max_abs_diff, abs(diff))
+            if latency_diff is not None:
+                self._sum_latency_diff += latency_diff * 1000
+                self._latency_n += 1
+        metrics.inc("shadow_total", outcome="scored")
+        metrics.observe("shadow_abs_diff", abs(diff))
+        if latency_diff is not None:
+            metrics.observe("shadow_latency_diff_seconds", latency_diff)
+
+
+def score_candidate(X, artifacts, timings=None):
+    """Predict one listing with a candidate model, without recording serving stage or error metrics
+
+    The candidate applies its own encoder and scalers, so a model retrained on newer data can be compared with
+    the primary model on the same listings. Errors are raised to the caller.
+
+    Args:
+        X (:class:`pandas.DataFrame`): dataframe containing one listing, before transformation
+        artifacts (:obj:`dict`): loaded artifacts of the candidate model
+        timings (:obj:`dict`, optional): set `timings["predict"]` to the seconds the model call took, like
+            :func:`src.predict.run_predict`. Defaults to None.
+
+    Returns:
+        float: predicted number of reviews per month
+    """
+
+    transform = artifacts.get("transform")
+    model = select_model(artifacts, X.shape[0])
+    if transform is not None and X.shape[0] == 1 and transform.accepts(X.columns):
+        X = transform.transform_for(X, model)
+    else:
+        X = prepare_input(X, artifacts)
+    start = time.perf_counter()
+    pred = float(np.round(np.exp(model.predict(X)), 2))
+    if timings is not None:
+        timings["predict"] = time.perf_counter() - start
+    return pred
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
@@ -0,0 +1,553 @@
+import io
+import os
+import abc
+import shutil
+import itertools
+import threading
+import logging
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from src import metrics
+from src.model_config import ConfigError
+from src.helpers import (
+    get_s3_client,
+    open_from_s3,
+    read_from_s3,
+    upload_fileobj_to_s3,
+    upload_to_s3,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Storage(abc.ABC):
+    """Objects shared between the pipeline stages, stored under keys such as "data/listings-raw.csv"
+
+    Subclasses store the objects in S3, in a local directory, or in memory. Every transfer is counted, so that each
+    stage can report how many bytes it moved with :meth:`report`, and the `storage_bytes_total` counter is updated
+    for the `/metrics` endpoint. Subclasses implement every abstract method. Failed transfers raise :class:`IOError`, and missing objects
+    :class:`FileNotFoundError`.
+    """
+
+    backend = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.reads = 0
+        self.writes = 0
+
+    @abc.abstractmethod
+    def put_file(self, file_name, key):
+        """Store a local file under a key
+
+        Args:
+            file_name (str): local file path to store
+            key (str): key to store it under
+
+        Returns:
+            int: bytes written
+        """
+
+    @abc.abstractmethod
+    def put_fileobj(self, fileobj, key):
+        """Store the contents of a readable binary file object or in-memory buffer under a key
+
+        Args:
+            fileobj (file-like): binary file object to read the contents from
+            key (str): key to store it under
+
+        Returns:
+            int: bytes written
+        """
+
+    @abc.abstractmethod
+    def get_file(self, key, file_name):
+        """Copy a stored object to a local file
+
+        Args:
+            key (str): key of the object
+            file_name (str): local file path to write it to
+
+        Returns:
+            int: bytes read
+        """
+
+    @abc.abstractmethod
+    def open(self, key):
+        """Open a stored object for reading, e.g. to parse it with :func:`pandas.read_csv` as it is read
+
+        Args:
+            key (str): key of the object
+
+        Returns:
+            file-like: binary stream of the object. Close it when done.
+        """
+
+    def read_bytes(self, key):
+        """Return the contents of a stored object
+
+        Args:
+            key (str): key of the object
+
+        Returns:
+            :class:`io.BytesIO`: contents of the object, positioned at the start
+        """
+
+        with self.open(key) as f:
+            return io.BytesIO(f.read())
+
+    @abc.abstractmethod
+    def version(self, key):
+        """Return a string that changes whenever the object under a key is replaced, or None if there is none"""
+
+    def exists(self, key):
+        """Return whether an object is stored under a key"""
+
+        return self.version(key) is not None
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """Delete the object under a key, if there is one"""
+
+    @abc.abstractmethod
+    def uri(self, key):
+        """Return the location of the object under a key, for logging"""
+
+    def stats(self):
+        """Return the bytes moved through this storage
+
+        Returns:
+            :obj:`dict`: `backend`, `reads`, `bytes_read`, `writes`, and `bytes_written`
+        """
+
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "reads": self.reads,
+                "bytes_read": self.bytes_read,
+                "writes": self.writes,
+                "bytes_written": self.bytes_written,
+            }
+
+    def report(self, stage):
+        """Log the bytes a stage moved through this storage
+
+        Args:
+            stage (str): name of the stage, e.g. "clean"
+
+        Returns:
+            :obj:`dict`: stats, as returned by :meth:`stats`
+        """
+
+        stats = self.stats()
+        message = "Stage {} read {:.1f} MB in {} reads and wrote {:.1f} MB in {} writes through {} storage"
+        message = message.format(
+            stage,
+            stats["bytes_read"] / 1e6,
+            stats["reads"],
+            stats["bytes_written"] / 1e6,
+            stats["writes"],
+            stats["backend"],
+        )
+        if "cache_hits" in stats:
+            message += ", with {} cache hits ({:.1f} MB) and {} cache misses".format(
+                stats["cache_hits"], stats["bytes_cached"] / 1e6, stats["cache_misses"]
+            )
+        logger.info(message + ".")
+        return stats
+
+    def _count(self, direction, nbytes, transfers=1):
+        with self._lock:
+            if direction == "read":
+                self.bytes_read += nbytes
+                self.reads += transfers
+            else:
+                self.bytes_written += nbytes
+                self.writes += transfers
+        if nbytes:
+            metrics.inc(
+                "storage_bytes_total", nbytes, backend=self.backend, direction=direction
+            )
+
+    def _counted(self, fileobj, direction, transfers=1):
+        """Wrap a file object so that the bytes read from it are counted as one transfer"""
+
+        self._count(direction, 0, transfers)
+        return _CountingReader(fileobj, lambda n: self._count(direction, n, 0))
+
+
+class S3Storage(Storage):
+    """Objects stored in an S3 bucket, transferred with the pooled client and multipart settings of :mod:`src.helpers`
+
+    Args:
+        bucket (str): S3 bucket name
+    """
+
+    backend = "s3"
+
+    def __init__(self, bucket):
+        super().__init__()
+        self.bucket = bucket
+
+    def put_file(self, file_name, key):
+        if not upload_to_s3(file_name, self.bucket, key):
+            raise IOError("Could not upload {}.".format(self.uri(key)))
+        nbytes = os.path.getsize(file_name)
+        self._count("write", nbytes)
+        return nbytes
+
+    def put_fileobj(self, fileobj, key):
+        counted = self._counted(fileobj, "write")
+        if not upload_fileobj_to_s3(counted, self.bucket, key):
+            raise IOError("Could not upload {}.".format(self.uri(key)))
+        return counted.nbytes
+
+    def get_file(self, key, file_name):
+        _makedirs(file_name)
+        if not read_from_s3(key, self.bucket, file_name):
+            raise FileNotFoundError("Could not download {}.".format(self.uri(key)))
+        nbytes = os.path.getsize(file_name)
+        self._count("read", nbytes)
+        return nbytes
+
+    def open(self, key):
+        body = open_from_s3(key, self.bucket)
+        if body is None:
+            raise FileNotFoundError("Could not open {}.".format(self.uri(key)))
+        return self._counted(body, "read")
+
+    def version(self, key):
+        try:
+            return get_s3_client().head_object(Bucket=self.bucket, Key=key)["ETag"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return None
+            raise IOError("Could not look up {}: {}".format(self.uri(key), e))
+        except BotoCoreError as e:
+            raise IOError("Could not look up {}: {}".format(self.uri(key), e))
+
+    def delete(self, key):
+        try:
+            get_s3_client().delete_object(Bucket=self.bucket, Key=key)
+        except (ClientError, BotoCoreError) as e:
+            raise IOError("Could not delete {}: {}".format(self.uri(key), e))
+
+    def uri(self, key):
+        return "s3://{}/{}".format(self.bucket, key)
+
+
+class LocalStorage(Storage):
+    """Objects stored as files under a local directory
+
+    Args:
+        root (str): directory the keys are relative to
+    """
+
+    backend = "local"
+
+    def __init__(self, root):
+        super().__init__()
+        self.root = str(root)
+
+    def put_file(self, file_name, key):
+        path = self._path(key)
+        if os.path.abspath(file_name) != os.path.abspath(path):
+            _copy_file(file_name, path)
+        nbytes = os.path.getsize(path)
+        self._count("write", nbytes)
+        return nbytes
+
+    def put_fileobj(self, fileobj, key):
+        counted = self._counted(fileobj, "write")
+        _copy_fileobj(counted, self._path(key))
+        return counted.nbytes
+
+    def get_file(self, key, file_name):
+        path = self._path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError("No object {}.".format(self.uri(key)))
+        if os.path.abspath(file_name) != os.path.abspath(path):
+            _copy_file(path, file_name)
+        nbytes = os.path.getsize(path)
+        self._count("read", nbytes)
+        return nbytes
+
+    def open(self, key):
+        return self._counted(open(self._path(key), "rb"), "read")
+
+    def version(self, key):
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return "{}-{}".format(stat.st_mtime_ns, stat.st_size)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def uri(self, key):
+        return self._path(key)
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+
+class MemoryStorage(Storage):
+    """Objects kept in memory, shared by the stages run in one process, e.g. in tests"""
+
+    backend = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self.objects = {}
+        self._versions = itertools.count(1)
+
+    def put_file(self, file_name, key):
+        with open(file_name, "rb") as f:
+            return self.put_fileobj(f, key)
+
+    def put_fileobj(self, fileobj, key):
+        content = fileobj.read()
+        with self._lock:
+            self.objects[key] = (content, str(next(self._versions)))
+        self._count("write", len(content))
+        return len(content)
+
+    def get_file(self, key, file_name):
+        content = self._get(key)
+        _copy_fileobj(io.BytesIO(content), file_name)
+        self._count("read", len(content))
+        return len(content)
+
+    def open(self, key):
+        return self._counted(io.BytesIO(self._get(key)), "read")
+
+    def version(self, key):
+        entry = self.objects.get(key)
+        return entry[1] if entry is not None else None
+
+    def delete(self, key):
+        with self._lock:
+            self.objects.pop(key, None)
+
+    def uri(self, key):
+        return "memory://{}".format(key)
+
+    def _get(self, key):
+        entry = self.objects.get(key)
+        if entry is None:
+            raise FileNotFoundError("No object {}.".format(self.uri(key)))
+        return entry[0]
+
+
+class CachedStorage(Storage):
+    """Local cache tier in front of another storage, so that consecutive stages on one machine reuse a local copy
+
+    Objects written through the cache are kept as local files under `cache_dir`, next to the version the backend
+    reports for them. Reads check the version with the backend (a HEAD request for S3) and are served from the local
+    copy if it is current, so the raw data ingested by one stage is not downloaded again by the next one. Otherwise
+    the object is downloaded into the cache first. The bytes moved to and from the backend are counted by the
+    backend, and :meth:`stats` adds the cache hits and misses.
+
+    Args:
+        backend (:class:`Storage`): storage the objects are kept in
+        cache_dir (str): local directory of the cached copies
+    """
+
+    def __init__(self, backend, cache_dir):
+        super().__init__()
+        self.store = backend
+        self.backend = "{}+cache".format(backend.backend)
+        self.cache_dir = str(cache_dir)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.bytes_cached = 0
+
+    def put_file(self, file_name, key):
+        nbytes = self.store.put_file(file_name, key)
+        _copy_file(file_name, self._path(key))
+        self._remember(key)
+        return nbytes
+
+    def put_fileobj(self, fileobj, key):
+        # Written to the cache first, so that the upload can be retried and the next stage reads the local copy
+        path = self._path(key)
+        _copy_fileobj(fileobj, path)
+        nbytes = self.store.put_file(path, key)
+        self._remember(key)
+        return nbytes
+
+    def get_file(self, key, file_name):
+        path = self._fetch(key)
+        if os.path.abspath(file_name) != os.path.abspath(path):
+            _copy_file(path, file_name)
+        return os.path.getsize(path)
+
+    def open(self, key):
+        return open(self._fetch(key), "rb")
+
+    def version(self, key):
+        return self.store.version(key)
+
+    def delete(self, key):
+        self.store.delete(key)
+        for path in (self._path(key), self._version_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def uri(self, key):
+        return self.store.uri(key)
+
+    def stats(self):
+        stats = self.store.stats()
+        with self._lock:
+            stats.update(
+                {
+                    "backend": self.backend,
+                    "cache_hits": self.cache_hits,
+                    "cache_misses": self.cache_misses,
+                    "bytes_cached": self.bytes_cached,
+                }
+            )
+        return stats
+
+    def _fetch(self, key):
+        """Return the local path of a current copy of an object, downloading it if the cached copy is stale"""
+
+        version = self.store.version(key)
+        if version is None:
+            raise FileNotFoundError("No object {}.".format(self.uri(key)))
+        path = self._path(key)
+        if os.path.exists(path) and self._cached_version(key) == version:
+            nbytes = os.path.getsize(path)
+            with self._lock:
+                self.cache_hits += 1
+                self.bytes_cached += nbytes
+            metrics.inc("storage_cache_total", outcome="hit")
+            logger.info(
+                "Reading {} from the local copy {}.".format(self.uri(key), path)
+            )
+            return path
+
+        with self._lock:
+            self.cache_misses += 1
+        metrics.inc("storage_cache_total", outcome="miss")
+        tmp_path = "{}.part".format(path)
+        self.store.get_file(key, tmp_path)
+        os.replace(tmp_path, path)
+        self._write_version(key, version)
+        return path
+
+    def _remember(self, key):
+        self._write_version(key, self.store.version(key))
+
+    def _cached_version(self, key):
+        try:
+            with open(self._version_path(key), "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_version(self, key, version):
+        with open(self._version_path(key), "w") as f:
+            f.write(version or "")
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _version_path(self, key):
+        return "{}.version".format(self._path(key))
+
+
+# Objects of the memory backend, shared by every stage run in this process
+_MEMORY = MemoryStorage()
+
+
+def open_storage(config, s3_bucket_name=None):
+    """Return the storage a stage reads and writes its shared objects through, as set in the `storage` configs
+
+    Args:
+        config (:class:`src.model_config.ModelConfig`): parsed configurations
+        s3_bucket_name (str, optional): S3 bucket of the "s3" backend. Defaults to None.
+
+    Returns:
+        :class:`Storage`: storage of the configured backend, behind a local cache tier if `CACHE_DIR` is set
+
+    Raises:
+        :class:`src.model_config.ConfigError`: if the backend is unknown
+    """
+
+    settings = config.get("storage") or {}
+    backend = settings.get("BACKEND", "s3")
+    if backend == "s3":
+        storage = S3Storage(s3_bucket_name)
+    elif backend == "local":
+        return LocalStorage(settings.get("LOCAL_ROOT", "data/store"))
+    elif backend == "memory":
+        return _MEMORY
+    else:
+        raise ConfigError(
+            "Configuration storage.BACKEND must be one of s3, local, or memory, got {}.".format(
+                backend
+            )
+        )
+
+    if settings.get("CACHE_DIR"):
+        storage = CachedStorage(storage, settings["CACHE_DIR"])
+    return storage
+
+
+class _CountingReader(io.RawIOBase):
+    """Readable binary stream that counts the bytes read through it"""
+
+    def __init__(self, fileobj, callback):
+        self._fileobj = fileobj
+        self._callback = callback
+        self.nbytes = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._fileobj.read(len(b))
+        n = len(data)
+        b[:n] = data
+        self.nbytes += n
+        self._callback(n)
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._fileobj.close()
+        super().close()
+
+
+def _makedirs(file_name):
+    directory = os.path.dirname(str(file_name))
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+def _copy_file(src, dst):
+    """Copy a file, replacing `dst` only once the copy is complete"""
+
+    _makedirs(dst)
+    shutil.copyfile(src, "{}.part".format(dst))
+    os.replace("{}.part".format(dst), dst)
+
+
+def _copy_fileobj(fileobj, dst):
+    """Write the contents of a file object to a file, replacing `dst` only once it is complete"""
+
+    _makedirs(dst)
+    with open("{}.part".format(dst), "wb") as f:
+        shutil.copyfileobj(fileobj, f, 1024 * 1024)
+    os.replace("{}.part".format(dst), dst)
@@ -1,4 +1,6 @@
+import os
 import sys
+import time
 import pathlib
 import pandas as pd
 import numpy as np
@@ -7,8 +9,6 @@ import scipy
 import xgboost as xgb
 import pickle as pkl
 import logging
-import logging.config
-import yaml
 
 # Modeling packages
 from sklearn.experimental import enable_iterative_imputer
@@ -23,13 +23,13 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.ensemble import GradientBoostingRegressor
 from sklearn.ensemble import VotingRegressor
 from xgboost import XGBRegressor
-from sklearn.metrics import mean_squared_error
+from sklearn.metrics import mean_squared_error, r2_score
 
 # User-written modules
-import config
-from src.helpers import upload_to_s3, check_for_valid_cols
+from src.storage import open_storage
+from src.model_config import load_config
+from src.tree_engine import FlatTreeEnsemble, export_flat_model
 
-logging.config.fileConfig(config.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
 
@@ -49,28 +49,26 @@ def run_train_model(args):
     logger.info("Reading in configs from modelconfig.yml.")
     try:
         # Load in configs from yml file
-        with open(args.config, "r") as f:
-            config = yaml.load(f, Loader=yaml.FullLoader)
-            s3_objects = config["s3_objects"]
-            data_files = config["data_files"]
-            model_files = config["model_files"]
-
-            # Feature lists and dictionaries for transformations
-            HOST_RESPONSE_MAP = config["train_model"]["HOST_RESPONSE_MAP"]
-            TARGET_COL = config["TARGET_COL"]
-            IMPUTE_COLS = config["train_model"]["IMPUTE_COLS"]
-            COLS_NUM_STD = config["train_model"]["COLS_NUM_STD"]
-            COLS_NUM_MINMAX = config["train_model"]["COLS_NUM_MINMAX"]
-            COLS_CAT = config["train_model"]["COLS_CAT"]
-
-            # Model object settings
-            seed = config["seed"]
-            iter_imp_settings = config["train_model"]["iter_imp_settings"]
-            train_test_settings = config["train_model"]["train_test_settings"]
-            tuning_param_settings = config["train_model"]["tuning_param_settings"]
-            grid_search_settings = config["train_model"]["grid_search_settings"]
-            voting_model_settings = config["train_model"]["voting_model_settings"]
-            tuned_params = config["train_model"]["tuned_params"]
+        config = load_config(args.config)
+        s3_objects = config.s3_objects
+        data_files = config.data_files
+        model_files = config.model_files
+
+        # Feature lists and dictionaries for transformations
+        HOST_RESPONSE_MAP = config.host_response_map
+        TARGET_COL = config.target_col
+
+        # Model object settings
+        seed = config.seed
+        iter_imp_settings = config["train_model"]["iter_imp_settings"]
+        train_test_settings = config["train_model"]["train_test_settings"]
+        tuning_param_settings = config["train_model"]["tuning_param_settings"]
+        grid_search_settings = config["train_model"]["grid_search_settings"]
+        voting_model_settings = config["train_model"]["voting_model_settings"]
+        tuned_params = config["train_model"]["tuned_params"]
+        lite_model_settings = config["train_model"].get("lite_model_settings")
+        student_model_settings = config["train_model"].get("student_model_settings")
+        storage = open_storage(config, args.s3_bucket_name)
 
     except KeyError:
         logger.error(
@@ -98,10 +96,10 @@ def run_train_model(args):
 
     # Check that all features expected are in the dataframe
     logger.debug("Checking that expected feature are in the dataframe.")
-    IMPUTE_COLS = check_for_valid_cols(IMPUTE_COLS, df)
-    COLS_NUM_STD = check_for_valid_cols(COLS_NUM_STD, df)
-    COLS_NUM_MINMAX = check_for_valid_cols(COLS_NUM_MINMAX, df)
-    COLS_CAT = check_for_valid_cols(COLS_CAT, df)
+    IMPUTE_COLS = config.valid_cols("impute_cols", df.columns)
+    COLS_NUM_STD = config.valid_cols("cols_num_std", df.columns)
+    COLS_NUM_MINMAX = config.valid_cols("cols_num_minmax", df.columns)
+    COLS_CAT = config.valid_cols("cols_cat", df.columns)
 
     # Impute missing values
     dummy_cols = [col for col in COLS_CAT if col not in IMPUTE_COLS]
@@ -111,6 +109,7 @@ def run_train_model(args):
         dummy_cols,
         iter_imp_settings,
         HOST_RESPONSE_MAP,
+        host_response_inverse=config.host_response_inverse,
     )
     df.loc[:, IMPUTE_COLS] = df_imputed[IMPUTE_COLS]
 
@@ -131,24 +130,55 @@ def run_train_model(args):
         voting_model_settings,
         tuned_params=tuned_params,
         use_existing_params=args.use_existing_params,
+        lite_model_settings=lite_model_settings,
     )
     logger.info("Obtained trained model object and model artifacts.")
 
+    # Distill the ensemble into a small student model, scored on inputs transformed the way they are when serving
+    student = None
+    if student_model_settings is not None and tmo is not None:
+        logger.info("Distilling trained model object into a student model.")
+        X_served = df_model.drop(columns=TARGET_COL)
+        X_served.loc[:, COLS_NUM_STD] = stdscaler.transform(X_served[COLS_NUM_STD])
+        X_served.loc[:, COLS_NUM_MINMAX] = minmaxscaler.transform(
+            X_served[COLS_NUM_MINMAX]
+        )
+        groups = onehot_groups(enc, COLS_CAT)
+        student, student_metrics = distill_model(
+            tmo, X_served, student_model_settings, groups, seed=seed
+        )
+        if metrics is not None and student_metrics is not None:
+            metrics = pd.concat([metrics, student_metrics], ignore_index=True)
+
     # Output model and encoder to pkl file
     if args.output is None:
         model_file_tmo = model_files["MODEL_FILENAME_TMO"]
         model_file_encoder = model_files["MODEL_FILENAME_ENCODER"]
         model_file_scalers = model_files["MODEL_FILENAME_SCALERS"]
         model_file_metrics = model_files["MODEL_FILENAME_METRICS"]
+        model_file_percentiles = model_files["MODEL_FILENAME_PERCENTILES"]
+        model_file_flat = model_files["MODEL_FILENAME_FLAT"]
+        model_file_lite = model_files["MODEL_FILENAME_LITE"]
+        model_file_student = model_files["MODEL_FILENAME_STUDENT"]
     else:
         model_file_tmo = pathlib.Path(args.output) / "model.pkl"
         model_file_encoder = pathlib.Path(args.output) / "encoders.pkl"
         model_file_scalers = pathlib.Path(args.output) / "scalers.pkl"
         model_file_metrics = pathlib.Path(args.output) / "metrics.csv"
+        model_file_percentiles = pathlib.Path(args.output) / "percentiles.npy"
+        model_file_flat = pathlib.Path(args.output) / "model-flat.npz"
+        model_file_lite = pathlib.Path(args.output) / "model-lite.npz"
+        model_file_student = pathlib.Path(args.output) / "model-student.pkl"
 
     with open(model_file_tmo, "wb") as file:
         logger.info("Writing trained model object to {}.".format(model_file_tmo))
         pkl.dump(tmo, file)
+    if student is not None:
+        with open(model_file_student, "wb") as file:
+            logger.info(
+                "Writing student model object to {}.".format(model_file_student)
+            )
+            pkl.dump(student, file)
     with open(model_file_encoder, "wb") as file:
         logger.info("Writing encoder object to {}.".format(model_file_encoder))
         pkl.dump(enc, file)
@@ -158,40 +188,49 @@ def run_train_model(args):
     if metrics is not None:
         logger.info("Writing metrics to {}.".format(model_file_metrics))
         metrics.to_csv(model_file_metrics, index=False)
+    # Moved into place once written, since serving processes may have the previous index memory-mapped
+    tmp_file_percentiles = "{}.tmp-{}".format(model_file_percentiles, os.getpid())
+    with open(tmp_file_percentiles, "wb") as file:
+        logger.info("Writing percentile index to {}.".format(model_file_percentiles))
+        np.save(file, get_percentile_index(df[TARGET_COL]))
+    os.replace(tmp_file_percentiles, model_file_percentiles)
+    flat_written = export_flat_model(tmo, model_file_flat, source_file=model_file_tmo)
+    lite_written = lite_model_settings is not None and export_flat_model(
+        tmo, model_file_lite, source_file=model_file_tmo, **lite_model_settings
+    )
 
-    # Upload model artifacts to S3 if chosen
+    # Store model artifacts if chosen
     if args.upload == True:
-        logger.info(
-            "Uploading model artifacts to S3 bucket {}.".format(args.s3_bucket_name)
-        )
-        upload_to_s3(
-            model_files["MODEL_FILENAME_TMO"],
-            args.s3_bucket_name,
-            s3_objects["S3_OBJECT_MODEL_TMO"],
-        )
-        logger.info(
-            "Uploading {} to S3 bucket {}.".format(
-                model_files["MODEL_FILENAME_ENCODER"], args.s3_bucket_name
-            )
-        )
-        upload_to_s3(
-            model_files["MODEL_FILENAME_ENCODER"],
-            args.s3_bucket_name,
-            s3_objects["S3_OBJECT_MODEL_ENCODER"],
-        )
-        logger.info(
-            "Uploading {} to S3 bucket {}.".format(
-                model_files["MODEL_FILENAME_SCALERS"], args.s3_bucket_name
+        artifacts = [
+            (model_files["MODEL_FILENAME_TMO"], "S3_OBJECT_MODEL_TMO"),
+            (model_files["MODEL_FILENAME_ENCODER"], "S3_OBJECT_MODEL_ENCODER"),
+            (model_files["MODEL_FILENAME_SCALERS"], "S3_OBJECT_MODEL_SCALERS"),
+            (model_file_percentiles, "S3_OBJECT_MODEL_PERCENTILES"),
+        ]
+        if flat_written:
+            artifacts.append((model_file_flat, "S3_OBJECT_MODEL_FLAT"))
+        if lite_written:
+            artifacts.append((model_file_lite, "S3_OBJECT_MODEL_LITE"))
+        if student is not None:
+            artifacts.append((model_file_student, "S3_OBJECT_MODEL_STUDENT"))
+
+        for file_name, s3_object in artifacts:
+            logger.info(
+                "Uploading {} to {}.".format(
+                    file_name, storage.uri(s3_objects[s3_object])
+                )
             )
-        )
-        upload_to_s3(
-            model_files["MODEL_FILENAME_SCALERS"],
-            args.s3_bucket_name,
-            s3_objects["S3_OBJECT_MODEL_SCALERS"],
-        )
+            try:
+                storage.put_file(str(file_name), s3_objects[s3_object])
+            except IOError as e:
+                logger.error("Could not upload {}.".format(file_name))
+                logger.error(e)
+        storage.report("train")
 
 
-def get_imputed_values(df, dummy_cols, settings, host_response_map):
+def get_imputed_values(
+    df, dummy_cols, settings, host_response_map, host_response_inverse=None
+):
     """Imputes missing values for features with known missing values.
 
     Args:
@@ -199,6 +238,8 @@ def get_imputed_values(df, dummy_cols, settings, host_response_map):
         dummy_cols (:obj:`list`): columns to convert to dummy variables prior to imputation
         settings (:obj:`dict`): settings for the IterativeImputer
         host_response_map (:obj:`dict`): mapping of host_response_time categories to numerical values
+        host_response_inverse (:obj:`dict`, optional): mapping of numerical values back to host_response_time
+            categories. Defaults to None (inverts `host_response_map`).
 
     Returns:
         :class:`pandas.DataFrame`: listings data with imputed values
@@ -248,7 +289,9 @@ def get_imputed_values(df, dummy_cols, settings, host_response_map):
                 df_imp["host_response_time_code"], 0
             ).astype(int)
             # Invert the host response time map
-            inv_map = {v: k for k, v in host_response_map.items()}
+            inv_map = host_response_inverse
+            if inv_map is None:
+                inv_map = {v: k for k, v in host_response_map.items()}
             logger.debug(
                 "Re-mapping integer values for host_response_time to categorical values."
             )
@@ -310,6 +353,7 @@ def get_trained_model_object(
     voting_model_settings=None,
     tuned_params=None,
     use_existing_params=False,
+    lite_model_settings=None,
 ):
     """Performs input data transformations, hyperparameter tuning (if specified), and model fitting to
     obtain trained model object and model artifacts.
@@ -325,6 +369,8 @@ def get_trained_model_object(
         voting_model_settings (:obj:`dict`, optional): settings for voting ensemble model. Defaults to None.
         tuned_params (:obj:`dict`, optional): previously tuned parameters for all models. Defaults to None.
         use_existing_params (bool, optional): specification of whether to use `tuned_params`. Defaults to False.
+        lite_model_settings (:obj:`dict`, optional): compression settings of the lite model, to compare it with the
+            full model in the metrics. Defaults to None.
 
     Returns:
         :class:`sklearn.ensemble.VotingRegressor`: trained model object
@@ -468,6 +514,10 @@ def get_trained_model_object(
         ereg = VotingRegressor(**voting_model_settings)
         ereg.fit(X_train, y_train)
         metrics = evaluate_model(ereg, X_train, X_test, y_train, y_test)
+        if metrics is not None and lite_model_settings is not None:
+            metrics = evaluate_lite_model(
+                ereg, X_train, X_test, y_train, y_test, lite_model_settings, metrics
+            )
 
         # Final TMO using all data
         ereg.fit(X, y)
@@ -479,6 +529,20 @@ def get_trained_model_object(
     return ereg, stdscaler, minmaxscaler, metrics
 
 
+def get_percentile_index(y):
+    """Sort the actual target values so that percentile ranks can be looked up by binary search
+
+    Args:
+        y (:class:`pandas.Series`): actual target values
+
+    Returns:
+        :class:`numpy.ndarray`: sorted target values, with missing values removed
+    """
+
+    y = np.asarray(y, dtype=np.float64)
+    return np.sort(y[~np.isnan(y)])
+
+
 def tune_model_grid_search(model, X_train, y_train, grid, grid_settings):
     """Conduct randomized grid search to obtain optimal hyperparameters for model
 
@@ -559,3 +623,203 @@ def evaluate_model(model, X_train, X_test, y_train, y_test):
         )
         logger.error(e)
         return None
+
+
+def evaluate_lite_model(
+    model, X_train, X_test, y_train, y_test, settings, metrics=None
+):
+    """Compare the size, latency, and performance of the trained model object with its flattened and lite variants
+
+    Args:
+        model (:class:`sklearn.ensemble.VotingRegressor`): trained model object
+        X_train (:class:`pandas.DataFrame`): training data features
+        X_test (:class:`pandas.DataFrame`): testing data features
+        y_train (:class:`pandas.Series`): training data target variable
+        y_test (:class:`pandas.Series`): testing data target variable
+        settings (:obj:`dict`): `max_rounds`, `max_depth`, and `dtype` of the lite model
+        metrics (:class:`pandas.DataFrame`, optional): metrics to return if the comparison fails. Defaults to None.
+
+    Returns:
+        :class:`pandas.DataFrame`: one row of metrics per variant ("tmo", "flat", and "lite"), with the model size
+            in bytes, the latency of predicting one listing in milliseconds, and the change in test R2 and RMSE
+            relative to the trained model object
+    """
+
+    try:
+        flat = FlatTreeEnsemble.from_model(model)
+        lite = FlatTreeEnsemble.from_model(model, **settings)
+        variants = [
+            ("tmo", model, len(pkl.dumps(model))),
+            ("flat", flat, flat.nbytes),
+            ("lite", lite, lite.nbytes),
+        ]
+
+        rows = []
+        for name, variant, nbytes in variants:
+            pred_test = variant.predict(X_test)
+            rows.append(
+                {
+                    "Model": name,
+                    "Train R2": r2_score(y_train, variant.predict(X_train)),
+                    "Test R2": r2_score(y_test, pred_test),
+                    "Test RMSE": math.sqrt(mean_squared_error(pred_test, y_test)),
+                    "Model Bytes": nbytes,
+                    "Predict ms": predict_latency(variant, X_test) * 1000,
+                }
+            )
+        df_metrics = pd.DataFrame(rows)
+        df_metrics["Test R2 Delta"] = df_metrics["Test R2"] - df_metrics["Test R2"][0]
+        df_metrics["Test RMSE Delta"] = (
+            df_metrics["Test RMSE"] - df_metrics["Test RMSE"][0]
+        )
+
+        logger.info(
+            "Lite model with settings {}: {} bytes, test R2 delta {}, test RMSE delta {}.".format(
+                settings,
+                rows[-1]["Model Bytes"],
+                df_metrics["Test R2 Delta"].iloc[-1],
+                df_metrics["Test RMSE Delta"].iloc[-1],
+            )
+        )
+        return df_metrics
+
+    except Exception as e:
+        logger.error("Encountered error while evaluating the lite model.")
+        logger.error(e)
+        return metrics
+
+
+def predict_latency(model, X, repeat=25):
+    """Return the median time in seconds that `model` takes to predict a single row of `X`"""
+
+    row = X.iloc[[0]]
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.predict(row)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def onehot_groups(enc, cols):
+    """Return the one-hot columns of each categorical feature, as named by the fitted encoder
+
+    Args:
+        enc (:class:`sklearn.preprocessing.OneHotEncoder`): encoder fit by :func:`encode_variables`
+        cols (:obj:`list`): categorical features the encoder was fit to, in order
+
+    Returns:
+        :obj:`list` of :obj:`list`: one-hot column names of each feature in `cols`
+    """
+
+    names = list(enc.get_feature_names(cols))
+    drop_idx = getattr(enc, "drop_idx_", None)
+    groups = []
+    start = 0
+    for j, categories in enumerate(enc.categories_):
+        n = len(categories)
+        if drop_idx is not None and drop_idx[j] is not None:
+            n -= 1
+        groups.append(names[start : start + n])
+        start += n
+    return groups
+
+
+def synthetic_samples(X, n, groups=None, swap_prob=0.5, seed=None):
+    """Draw synthetic rows from the feature space of `X`
+
+    Each synthetic row starts as a random row of `X`, and each of its features is replaced with probability
+    `swap_prob` by the same feature of another random row. The one-hot columns of a categorical feature are swapped
+    together, so that every synthetic row has a valid encoding.
+
+    Args:
+        X (:class:`pandas.DataFrame`): transformed input data
+        n (int): number of rows to draw
+        groups (:obj:`list` of :obj:`list`, optional): columns swapped together, e.g. the one-hot columns of each
+            categorical feature. Columns not in a group are swapped on their own. Defaults to None.
+        swap_prob (float, optional): probability of replacing each feature. Defaults to 0.5.
+        seed (int, optional): random seed. Defaults to None.
+
+    Returns:
+        :class:`pandas.DataFrame`: synthetic rows, with the columns of `X`
+    """
+
+    rng = np.random.RandomState(seed)
+    values = X.values
+    samples = values[rng.randint(0, X.shape[0], n)].copy()
+
+    grouped = [c for group in (groups or []) for c in group]
+    groups = [g for g in (groups or []) if g] + [
+        [c] for c in X.columns if c not in grouped
+    ]
+    for group in groups:
+        cols = [X.columns.get_loc(c) for c in group]
+        swap = np.flatnonzero(rng.rand(n) < swap_prob)
+        donors = rng.randint(0, X.shape[0], swap.shape[0])
+        samples[np.ix_(swap, cols)] = values[np.ix_(donors, cols)]
+
+    return pd.DataFrame(samples, columns=X.columns)
+
+
+def distill_model(teacher, X, settings, groups=None, seed=None):
+    """Fit a small gradient boosted student model to the predictions of the trained model object
+
+    The student learns the teacher's predictions on the rows of `X` and on synthetic rows drawn from its feature
+    space by :func:`synthetic_samples`. A share of both is held out to measure how closely the student follows the
+    teacher.
+
+    Args:
+        teacher (:class:`sklearn.ensemble.VotingRegressor`): trained model object
+        X (:class:`pandas.DataFrame`): transformed input data
+        settings (:obj:`dict`): `params` of the :class:`sklearn.ensemble.GradientBoostingRegressor` student, and
+            optionally `n_synthetic` (rows, default 10000), `swap_prob` (default 0.5), and `holdout` (default 0.2)
+        groups (:obj:`list` of :obj:`list`, optional): one-hot columns of each categorical feature. Defaults to None.
+        seed (int, optional): random seed. Defaults to None.
+
+    Returns:
+        :class:`sklearn.ensemble.GradientBoostingRegressor`: student model fit on all rows, or None if it could not be fit
+        :class:`pandas.DataFrame`: metrics of the "student" model with its size in bytes, the latency of predicting
+            one listing in milliseconds, and the R2 and RMSE of its predictions against the teacher's on the held
+            out rows, or None if it could not be fit
+    """
+
+    try:
+        X_synthetic = synthetic_samples(
+            X,
+            settings.get("n_synthetic", 10000),
+            groups,
+            settings.get("swap_prob", 0.5),
+            seed,
+        )
+        X_all = pd.concat([X, X_synthetic], ignore_index=True)
+        y_teacher = teacher.predict(X_all)
+
+        X_fit, X_holdout, y_fit, y_holdout = train_test_split(
+            X_all, y_teacher, test_size=settings.get("holdout", 0.2), random_state=seed
+        )
+        student = GradientBoostingRegressor(**settings["params"]).fit(X_fit, y_fit)
+        pred_holdout = student.predict(X_holdout)
+        fidelity_r2 = r2_score(y_holdout, pred_holdout)
+        fidelity_rmse = math.sqrt(mean_squared_error(pred_holdout, y_holdout))
+        logger.info("Student fidelity R2: {}".format(fidelity_r2))
+        logger.info("Student fidelity RMSE: {}".format(fidelity_rmse))
+
+        # Final student using all rows
+        student.fit(X_all, y_teacher)
+        df_metrics = pd.DataFrame(
+            {
+                "Model": "student",
+                "Model Bytes": len(pkl.dumps(student)),
+                "Predict ms": predict_latency(student, X) * 1000,
+                "Fidelity R2": fidelity_r2,
+                "Fidelity RMSE": fidelity_rmse,
+            },
+            index=np.arange(0, 1),
+        )
+
+        return student, df_metrics
+
+    except Exception as e:
+        logger.error("Encountered error while distilling the student model.")
+        logger.error(e)
+        return None, None
@@ -0,0 +1,554 @@
+import os
+import json
+import hashlib
+import struct
+import zipfile
+import tempfile
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class FlatTreeEnsemble:
+    """Tree ensemble flattened into contiguous NumPy arrays and scored by vectorized traversal
+
+    Every tree of every estimator is stored in the same node arrays. Leaves point to themselves, so all
+    trees can be advanced together one level at a time until the deepest tree is exhausted. A prediction is
+    `intercept + sum(coef[t] * leaf_value[t])` over trees `t`, which covers random forest averaging, gradient
+    boosting learning rates and initial predictions, XGBoost base scores, and voting weights.
+
+    Args:
+        arrays (:obj:`dict`): node and tree arrays, as produced by :func:`flatten_model`
+    """
+
+    # Array names written to and read from disk
+    ARRAYS = [
+        "feature",
+        "threshold",
+        "left",
+        "right",
+        "default_left",
+        "value",
+        "roots",
+        "depth",
+        "coef",
+        "intercept",
+        "max_depth",
+        "feature_names",
+    ]
+
+    # Arrays derived from the ones above, also written to disk so that memory-mapped loads can share them
+    DERIVED_ARRAYS = ["children", "feature_index"]
+
+    # SHA-256 hash of the pickled model object the arrays were flattened from, written by :func:`export_flat_model`
+    FINGERPRINT = "source_sha256"
+
+    # Rows traversed at a time, bounding the (rows x trees) working arrays
+    BLOCK_SIZE = 1024
+
+    def __init__(self, arrays):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.default_left = arrays["default_left"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.depth = arrays["depth"]
+        self.coef = arrays["coef"]
+        self.intercept = float(arrays["intercept"])
+        self.max_depth = int(arrays["max_depth"])
+        self.feature_names = [str(name) for name in arrays["feature_names"]]
+        self.has_missing = bool(np.any(self.default_left))
+        self.source_sha256 = None
+        if self.FINGERPRINT in arrays:
+            self.source_sha256 = str(arrays[self.FINGERPRINT])
+
+        # Trees are stored deepest first, so the trees still descending at each level are a prefix
+        self._n_active = np.array(
+            [np.sum(self.depth > level) for level in range(self.max_depth)],
+            dtype=np.int64,
+        )
+        # Child lookup by (node, went right), replacing two gathers and a select with one gather
+        self._children = arrays.get("children")
+        if self._children is None:
+            self._children = (
+                np.stack([self.left, self.right], axis=1).ravel().astype(np.intp)
+            )
+        self._feature = arrays.get("feature_index")
+        if self._feature is None:
+            self._feature = self.feature.astype(np.intp)
+
+    @classmethod
+    def from_model(cls, model, **compression):
+        """Flatten a trained model object
+
+        Args:
+            model (:class:`sklearn.ensemble.VotingRegressor` or a supported tree model): trained model object
+            **compression: `max_rounds`, `max_depth`, and `dtype` passed to :func:`flatten_model`
+
+        Returns:
+            :class:`FlatTreeEnsemble`: flattened model
+        """
+
+        return cls(flatten_model(model, **compression))
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Load a flattened model written by :meth:`save`
+
+        Args:
+            path (str): local file path of the flattened model `.npz` file
+            mmap_mode (str, optional): "r" to memory-map the arrays from the file instead of reading them into
+                memory, so that every process scoring with the same file shares its pages. Defaults to None.
+
+        Returns:
+            :class:`FlatTreeEnsemble`: flattened model
+        """
+
+        if mmap_mode is not None:
+            return cls(map_npz(path, mmap_mode))
+        with np.load(path, allow_pickle=False) as arrays:
+            optional = cls.DERIVED_ARRAYS + [cls.FINGERPRINT]
+            names = cls.ARRAYS + [n for n in optional if n in arrays.files]
+            return cls({name: arrays[name] for name in names})
+
+    def save(self, path):
+        """Write the flattened model as an uncompressed `.npz` file
+
+        The file is written next to `path` and then moved into place, so that processes which have the previous
+        file memory-mapped keep reading the old arrays instead of a truncated file.
+        """
+
+        arrays = self.arrays()
+        if self.source_sha256 is not None:
+            arrays[self.FINGERPRINT] = np.array(self.source_sha256)
+        tmp_path = "{}.tmp-{}".format(path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                children=self._children,
+                feature_index=self._feature,
+                **arrays,
+            )
+        os.replace(tmp_path, path)
+
+    def arrays(self):
+        """Return the arrays that make up the flattened model, keyed by name"""
+
+        return {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "left": self.left,
+            "right": self.right,
+            "default_left": self.default_left,
+            "value": self.value,
+            "roots": self.roots,
+            "depth": self.depth,
+            "coef": self.coef,
+            "intercept": np.float64(self.intercept),
+            "max_depth": np.int64(self.max_depth),
+            "feature_names": np.array(self.feature_names),
+        }
+
+    @property
+    def n_trees(self):
+        return self.roots.shape[0]
+
+    @property
+    def nbytes(self):
+        """Size of the node and tree arrays in bytes"""
+
+        return sum(getattr(a, "nbytes", 0) for a in self.arrays().values())
+
+    def predict(self, X):
+        """Predict the (log) target for every row of `X`, matching the flattened model's `predict`
+
+        Args:
+            X (:class:`pandas.DataFrame` or :class:`numpy.ndarray`): transformed input data
+
+        Returns:
+            :class:`numpy.ndarray`: predictions, in the order of the rows of `X`
+        """
+
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names and X.columns.tolist() != self.feature_names:
+                X = X[self.feature_names]
+            X = X.values
+        # Trees compare single precision inputs, as sklearn and XGBoost do
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+
+        preds = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], self.BLOCK_SIZE):
+            block = X[start : start + self.BLOCK_SIZE]
+            preds[start : start + block.shape[0]] = self._predict_block(block)
+        return preds
+
+    def _predict_block(self, X):
+        n_features = X.shape[1]
+        X = np.ascontiguousarray(X).ravel()
+        row_offsets = (np.arange(X.shape[0] // n_features) * n_features)[:, np.newaxis]
+        nodes = np.repeat(
+            self.roots.astype(np.intp)[np.newaxis, :], row_offsets.shape[0], axis=0
+        )
+        for n_active in self._n_active:
+            active = nodes[:, :n_active]
+            x = X[row_offsets + self._feature[active]]
+            go_right = x > self.threshold[active]
+            if self.has_missing:
+                # A missing value compares false, so only splits that send it right need correcting
+                go_right |= np.isnan(x) & ~self.default_left[active]
+            nodes[:, :n_active] = self._children[2 * active + go_right]
+        return self.value[nodes].dot(self.coef) + self.intercept
+
+
+def flatten_model(model, max_rounds=None, max_depth=None, dtype=np.float64):
+    """Flatten every tree of a trained model into contiguous node arrays, optionally compressing it
+
+    Supports :class:`sklearn.ensemble.VotingRegressor` over the other supported models,
+    :class:`sklearn.ensemble.RandomForestRegressor`, :class:`sklearn.ensemble.GradientBoostingRegressor`,
+    :class:`sklearn.tree.DecisionTreeRegressor`, and :class:`xgboost.XGBRegressor` (gbtree booster).
+
+    A compressed model keeps only the first `max_rounds` rounds of each boosted model, which is its prediction
+    after that many rounds, and turns the nodes at depth `max_depth` into leaves predicting the node's value.
+    With `dtype` float32, thresholds are rounded down to the float32 below them, which splits float32 inputs
+    exactly as before, and leaf values are rounded to the nearest float32.
+
+    Args:
+        model: trained model object
+        max_rounds (int, optional): boosting rounds to keep per boosted model. Defaults to None (all).
+        max_depth (int, optional): depth to cut every tree at. Defaults to None (full depth).
+        dtype (str or :class:`numpy.dtype`, optional): type to store thresholds and values as. Defaults to float64.
+
+    Returns:
+        :obj:`dict`: arrays for :class:`FlatTreeEnsemble`
+    """
+
+    trees = []
+    intercept = 0.0
+    for estimator, weight in _weighted_estimators(model):
+        estimator_trees, estimator_intercept = _flatten_estimator(estimator, max_rounds)
+        if max_depth is not None:
+            estimator_trees = [
+                (_prune_tree(tree, max_depth), coef) for tree, coef in estimator_trees
+            ]
+        trees.extend((tree, coef * weight) for tree, coef in estimator_trees)
+        intercept += estimator_intercept * weight
+
+    # Concatenate the trees deepest first, offsetting child pointers by each tree's first node
+    trees.sort(key=lambda tree: tree[0]["max_depth"], reverse=True)
+    feature, threshold, left, right, default_left, value = [], [], [], [], [], []
+    roots, depth, coef = [], [], []
+    max_depth = 0
+    offset = 0
+    for tree, tree_coef in trees:
+        n_nodes = tree["value"].shape[0]
+        roots.append(offset)
+        depth.append(tree["max_depth"])
+        coef.append(tree_coef)
+        feature.append(tree["feature"])
+        threshold.append(tree["threshold"])
+        left.append(tree["left"] + offset)
+        right.append(tree["right"] + offset)
+        default_left.append(tree["default_left"])
+        value.append(tree["value"])
+        max_depth = max(max_depth, tree["max_depth"])
+        offset += n_nodes
+
+    threshold = np.concatenate(threshold).astype(np.float64)
+    dtype = np.dtype(dtype)
+    if dtype != np.float64:
+        # Round down rather than to nearest, so that `x > threshold` is unchanged for every float32 `x`
+        rounded = threshold.astype(dtype)
+        threshold = np.where(
+            rounded > threshold, np.nextafter(rounded, dtype.type(-np.inf)), rounded
+        )
+
+    return {
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": threshold.astype(dtype),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "default_left": np.concatenate(default_left).astype(bool),
+        "value": np.concatenate(value).astype(dtype),
+        "roots": np.array(roots, dtype=np.int32),
+        "depth": np.array(depth, dtype=np.int32),
+        "coef": np.array(coef, dtype=np.float64),
+        "intercept": np.float64(intercept),
+        "max_depth": np.int64(max_depth),
+        "feature_names": np.array(_feature_names(model)),
+    }
+
+
+def export_flat_model(model, path, source_file=None, **compression):
+    """Flatten a trained model object and write it to `path`
+
+    Args:
+        model: trained model object
+        path (str): local file path of the flattened model `.npz` file
+        source_file (str, optional): local file path of the pickled model object, whose SHA-256 hash is written with
+            the arrays so that the flattened model is only served alongside the same pickle. Defaults to None.
+        **compression: `max_rounds`, `max_depth`, and `dtype` passed to :func:`flatten_model`
+
+    Returns:
+        bool: whether the flattened model was written
+    """
+
+    try:
+        flat = FlatTreeEnsemble.from_model(model, **compression)
+        if source_file is not None:
+            with open(source_file, "rb") as f:
+                flat.source_sha256 = hashlib.sha256(f.read()).hexdigest()
+        flat.save(path)
+        logger.info(
+            "Wrote flattened model with {} trees ({} bytes) to {}.".format(
+                flat.n_trees, flat.nbytes, path
+            )
+        )
+        return True
+    except Exception as e:
+        logger.error("Could not export flattened model.")
+        logger.error(e)
+        return False
+
+
+def map_npz(path, mmap_mode="r"):
+    """Memory-map every array of an uncompressed `.npz` file in place
+
+    `np.load` ignores `mmap_mode` for `.npz` files. The members of an archive written by `np.savez` are stored
+    without compression, so each one is a `.npy` file at a known offset of the archive and can be mapped directly.
+
+    Args:
+        path (str): local file path of the `.npz` file
+        mmap_mode (str, optional): mode passed to :class:`numpy.memmap`. Defaults to "r".
+
+    Returns:
+        :obj:`dict`: arrays keyed by member name, without the `.npy` suffix
+    """
+
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(
+                    "Cannot memory-map compressed member {} of {}.".format(
+                        info.filename, path
+                    )
+                )
+
+            # The data follows the member's local header, whose extra field can differ from the central directory's
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                raise ValueError(
+                    "Cannot memory-map object array {} of {}.".format(info.filename, path)
+                )
+
+            name = info.filename[: -len(".npy")]
+            if shape == ():
+                arrays[name] = np.fromfile(f, dtype=dtype, count=1).reshape(())
+            elif 0 in shape:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(
+                    path,
+                    dtype=dtype,
+                    mode=mmap_mode,
+                    offset=f.tell(),
+                    shape=shape,
+                    order="F" if fortran_order else "C",
+                )
+    return arrays
+
+
+def _weighted_estimators(model):
+    """Return (estimator, weight) pairs, expanding a voting ensemble into its normalized members"""
+
+    if type(model).__name__ != "VotingRegressor":
+        return [(model, 1.0)]
+
+    weights = model.weights
+    if weights is None:
+        weights = [1.0] * len(model.estimators)
+    kept = [
+        w for (_, est), w in zip(model.estimators, weights) if est not in (None, "drop")
+    ]
+    total = float(sum(kept))
+    return [(est, w / total) for est, w in zip(model.estimators_, kept)]
+
+
+def _flatten_estimator(estimator, max_rounds=None):
+    """Return ([(tree arrays, coefficient)], intercept) for one ensemble member, keeping `max_rounds` boosting rounds"""
+
+    name = type(estimator).__name__
+    if name == "DecisionTreeRegressor":
+        return [(_flatten_sklearn_tree(estimator.tree_), 1.0)], 0.0
+    if name == "RandomForestRegressor":
+        n_trees = len(estimator.estimators_)
+        return (
+            [(_flatten_sklearn_tree(t.tree_), 1.0 / n_trees) for t in estimator.estimators_],
+            0.0,
+        )
+    if name == "GradientBoostingRegressor":
+        if isinstance(estimator.init_, str) and estimator.init_ == "zero":
+            init = 0.0
+        else:
+            n_features = getattr(estimator, "n_features_in_", None)
+            if n_features is None:
+                n_features = estimator.n_features_
+            init = float(
+                np.ravel(estimator.init_.predict(np.zeros((1, n_features))))[0]
+            )
+        return (
+            [
+                (_flatten_sklearn_tree(t.tree_), estimator.learning_rate)
+                for t in estimator.estimators_[:max_rounds, 0]
+            ],
+            init,
+        )
+    if name == "XGBRegressor":
+        return _flatten_xgboost(estimator.get_booster(), max_rounds)
+    raise ValueError("Cannot flatten model of type {}.".format(name))
+
+
+def _flatten_sklearn_tree(tree):
+    """Node arrays for a fitted :class:`sklearn.tree._tree.Tree`, which routes left when `x <= threshold`"""
+
+    n_nodes = tree.node_count
+    index = np.arange(n_nodes)
+    is_leaf = tree.children_left == -1
+    return {
+        "feature": np.where(is_leaf, 0, tree.feature),
+        "threshold": np.where(is_leaf, 0.0, tree.threshold),
+        "left": np.where(is_leaf, index, tree.children_left),
+        "right": np.where(is_leaf, index, tree.children_right),
+        "default_left": np.zeros(n_nodes, dtype=bool),
+        "value": tree.value[:, 0, 0].copy(),
+        "max_depth": int(tree.max_depth),
+    }
+
+
+def _flatten_xgboost(booster, max_rounds=None):
+    """([(tree arrays, coefficient)], base score) for the first `max_rounds` trees of an XGBoost booster, read from its JSON model dump"""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "model.json")
+        booster.save_model(path)
+        with open(path, "r") as f:
+            learner = json.load(f)["learner"]
+
+    if learner["gradient_booster"]["name"] != "gbtree":
+        raise ValueError(
+            "Cannot flatten XGBoost booster {}.".format(
+                learner["gradient_booster"]["name"]
+            )
+        )
+    base_score = float(learner["learner_model_param"]["base_score"])
+
+    trees = []
+    for tree in learner["gradient_booster"]["model"]["trees"][:max_rounds]:
+        left = np.array(tree["left_children"], dtype=np.int64)
+        right = np.array(tree["right_children"], dtype=np.int64)
+        split = np.array(tree["split_conditions"], dtype=np.float32)
+        index = np.arange(left.shape[0])
+        is_leaf = left == -1
+
+        # Every node has an unscaled weight, and leaves store it scaled by the learning rate, so internal nodes
+        # can predict too once the tree is cut below them
+        weight = np.array(tree["base_weights"], dtype=np.float64)
+        scaled = is_leaf & (weight != 0)
+        learning_rate = (
+            float(np.median(split[scaled] / weight[scaled])) if scaled.any() else 0.0
+        )
+
+        # XGBoost routes left when `x < split` in single precision, which for single precision inputs is
+        # the same as `x <= ` the next float below the split
+        threshold = np.nextafter(split, np.float32(-np.inf)).astype(np.float64)
+        trees.append(
+            (
+                {
+                    "feature": np.where(is_leaf, 0, tree["split_indices"]),
+                    "threshold": np.where(is_leaf, 0.0, threshold),
+                    "left": np.where(is_leaf, index, left),
+                    "right": np.where(is_leaf, index, right),
+                    "default_left": np.where(
+                        is_leaf, False, np.array(tree["default_left"], dtype=bool)
+                    ),
+                    # Leaves store their (already learning-rate scaled) value in place of a split
+                    "value": np.where(is_leaf, split, weight * learning_rate).astype(
+                        np.float64
+                    ),
+                    "max_depth": _tree_depth(left, right),
+                },
+                1.0,
+            )
+        )
+    return trees, base_score
+
+
+def _prune_tree(tree, max_depth):
+    """Cut the node arrays of one tree at `max_depth`, turning the nodes there into leaves and dropping those below"""
+
+    if tree["max_depth"] <= max_depth:
+        return tree
+
+    # Renumber the nodes kept in breadth-first order, so that they stay contiguous
+    left, right = tree["left"], tree["right"]
+    kept = [0]
+    depth = {0: 0}
+    for node in kept:
+        if depth[node] < max_depth and left[node] != node:
+            for child in (left[node], right[node]):
+                depth[child] = depth[node] + 1
+                kept.append(child)
+    kept = np.array(kept)
+    new_index = np.empty(left.shape[0], dtype=np.int64)
+    new_index[kept] = np.arange(kept.shape[0])
+
+    index = np.arange(kept.shape[0])
+    is_leaf = (left[kept] == kept) | (np.array([depth[n] for n in kept]) == max_depth)
+    return {
+        "feature": np.where(is_leaf, 0, tree["feature"][kept]),
+        "threshold": np.where(is_leaf, 0.0, tree["threshold"][kept]),
+        "left": np.where(is_leaf, index, new_index[left[kept]]),
+        "right": np.where(is_leaf, index, new_index[right[kept]]),
+        "default_left": np.where(is_leaf, False, tree["default_left"][kept]),
+        "value": tree["value"][kept],
+        "max_depth": max_depth,
+    }
+
+
+def _tree_depth(left, right):
+    """Depth of a tree given its child arrays, with -1 marking leaves"""
+
+    depth = 0
+    level = [0]
+    while True:
+        level = [c for n in level for c in (left[n], right[n]) if c != -1]
+        if not level:
+            return depth
+        depth += 1
+
+
+def _feature_names(model):
+    """Names of the input features the model was trained on, if known"""
+
+    for estimator, _ in _weighted_estimators(model):
+        if type(estimator).__name__ == "XGBRegressor":
+            names = estimator.get_booster().feature_names
+            if names:
+                return list(names)
+        names = getattr(estimator, "feature_names_in_", None)
+        if names is not None:
+            return list(names)
+    return []
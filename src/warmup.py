@@ -0,0 +1,67 @@
+import logging
+import numpy as np
+import pandas as pd
+
+from src.predict import run_predict, run_predict_batch, prepare_input
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_listings(artifacts):
+    """Build listings that together cover every category stored in the encoder
+
+    Listing `i` takes the `i`-th category of each one-hot encoded column (wrapping around for columns with fewer
+    categories), the training mean of each standardized column, the middle of the training range of each minmax
+    scaled column, and 1 for every other feature.
+
+    Args:
+        artifacts (:obj:`dict`): loaded artifacts from :mod:`src.model_registry`
+
+    Returns:
+        :class:`pandas.DataFrame`: one row per synthetic listing, with the model input features as columns
+    """
+
+    config = artifacts["config"]
+    stdscaler, minmaxscaler = artifacts["scalers"]
+    categories = dict(zip(config.cols_cat, artifacts["encoder"].categories_))
+
+    n_listings = max(len(c) for c in categories.values())
+    columns = {}
+    for feature in config.select_features:
+        if feature in categories:
+            values = categories[feature].tolist()
+            columns[feature] = [values[i % len(values)] for i in range(n_listings)]
+        elif feature in config.std_index and stdscaler.mean_ is not None:
+            columns[feature] = float(stdscaler.mean_[config.std_index[feature]])
+        elif feature in config.minmax_index:
+            i = config.minmax_index[feature]
+            columns[feature] = float(
+                (minmaxscaler.data_min_[i] + minmaxscaler.data_max_[i]) / 2
+            )
+        else:
+            columns[feature] = 1
+    return pd.DataFrame(columns, index=np.arange(0, n_listings))[
+        config.select_features
+    ]
+
+
+def warm_up_model(artifacts):
+    """Score synthetic listings through every prediction path the app serves
+
+    Each listing goes through the single-listing path of `/add` (compiled transform, flattened trees, and
+    percentile rank), all of them through the batch path of `/predict/batch`, and the transformed batch through
+    the trained model object, which scores batches too large for the flattened trees.
+
+    Args:
+        artifacts (:obj:`dict`): loaded artifacts from :mod:`src.model_registry`
+
+    Returns:
+        int: number of synthetic listings scored
+    """
+
+    X = synthetic_listings(artifacts)
+    for i in range(X.shape[0]):
+        run_predict(X.iloc[[i]].reset_index(drop=True), artifacts=artifacts)
+    run_predict_batch(X, artifacts=artifacts)
+    artifacts["model"].predict(prepare_input(X.copy(), artifacts))
+    return X.shape[0]
@@ -0,0 +1,199 @@
+import os
+import time
+import queue
+import atexit
+import threading
+import logging
+
+from src import metrics
+
+logger = logging.getLogger(__name__)
+
+# Put on the queue to make the worker flush what it has and exit
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """In-process queue of rows that a background thread writes to a table in batched inserts
+
+    The request path only pays for `put`. The worker collects rows until `batch_size` rows are waiting or
+    `flush_seconds` have passed since the first of them arrived, then writes them all in one transaction with a
+    single `INSERT` executed for every row. Each row is bound as its own set of parameters, so large batches stay
+    within the database's limit on parameters per statement (999 on older SQLite builds). Pending rows are written when the queue is stopped, which
+    happens automatically at interpreter exit.
+
+    The worker thread is started lazily and restarted if the process has forked since it was started (e.g. a
+    gunicorn worker forked from a preloaded master), since threads do not survive a fork.
+
+    Args:
+        get_engine (callable): returns the :class:`sqlalchemy.engine.Engine` to write with
+        table (:class:`sqlalchemy.Table`): table to insert the rows into
+        batch_size (int, optional): most rows written per insert. Defaults to 500.
+        flush_seconds (float, optional): longest time a row waits before being written. Defaults to 1.0.
+        max_queue (int, optional): most rows waiting to be written before `put` refuses more. Defaults to 10000.
+        retries (int, optional): times a failed insert is retried before its rows are dropped. Defaults to 2.
+    """
+
+    def __init__(
+        self,
+        get_engine,
+        table,
+        batch_size=500,
+        flush_seconds=1.0,
+        max_queue=10000,
+        retries=2,
+    ):
+        self.get_engine = get_engine
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.retries = retries
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.batches_written = 0
+        atexit.register(self.stop)
+
+    def put(self, row):
+        """Queue a row to be written without waiting on the database
+
+        Args:
+            row (:obj:`dict`): column values of the row
+
+        Returns:
+            bool: whether the row was queued. False if the queue is full, in which case the caller should write
+            the row itself.
+        """
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            logger.warning("Write-behind queue is full, row not queued.")
+            return False
+
+    def flush(self):
+        """Block until every row queued so far has been written (or dropped)"""
+
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def stop(self, timeout=10.0):
+        """Write all pending rows and stop the worker thread
+
+        Args:
+            timeout (float, optional): seconds to wait for the worker to finish. Defaults to 10.0.
+        """
+
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive() or self._pid != os.getpid():
+                return
+            self._queue.put(_STOP)
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.error(
+                    "Write-behind worker did not finish within {} seconds, {} rows may be lost.".format(
+                        timeout, self._queue.qsize()
+                    )
+                )
+            self._thread = None
+
+    def stats(self):
+        """Return the number of queued, written, and dropped rows
+
+        Returns:
+            :obj:`dict`: `queued`, `rows_written`, `batches_written`, and `rows_dropped`
+        """
+
+        return {
+            "queued": self._queue.qsize(),
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+            "rows_dropped": self.rows_dropped,
+        }
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Rows queued before the fork belong to the parent, which writes them itself
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="write-behind-{}".format(self.table.name)
+            )
+            self._thread.daemon = True
+            self._thread.start()
+            logger.debug("Started write-behind worker for {}.".format(self.table.name))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            stopping = batch[0] is _STOP
+            if stopping:
+                batch = []
+
+            # Collect more rows until the batch is full or the oldest row has waited long enough
+            deadline = time.monotonic() + self.flush_seconds
+            while not stopping and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stopping = True
+                else:
+                    batch.append(row)
+
+            # When stopping, drain everything that is still waiting
+            while stopping:
+                try:
+                    row = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is not _STOP:
+                    batch.append(row)
+                else:
+                    self._queue.task_done()
+
+            for start in range(0, len(batch), self.batch_size):
+                self._write(batch[start : start + self.batch_size])
+            for _ in range(len(batch) + (1 if stopping else 0)):
+                self._queue.task_done()
+            if stopping:
+                return
+
+    def _write(self, rows):
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.timer("db_flush"), self.get_engine().begin() as conn:
+                    conn.execute(self.table.insert(), rows)
+                self.rows_written += len(rows)
+                self.batches_written += 1
+                logger.debug("Wrote {} rows to {}.".format(len(rows), self.table.name))
+                return
+            except Exception as e:
+                logger.warning(
+                    "Write-behind insert of {} rows failed (attempt {}): {}".format(
+                        len(rows), attempt + 1, e
+                    )
+                )
+                time.sleep(0.1 * (attempt + 1))
+        self.rows_dropped += len(rows)
+        metrics.inc("errors_total", stage="db_flush")
+        logger.error(
+            "Dropped {} rows for {} after {} failed inserts.".format(
+                len(rows), self.table.name, self.retries + 1
+            )
+        )
@@ -0,0 +1,193 @@
+import sys
+import uuid
+import argparse
+import threading
+import http.server
+import urllib.parse
+import pandas as pd
+import pytest
+import yaml
+
+sys.path.append("./")
+sys.path.append("./src")
+
+from src.train_model import run_train_model
+
+
+@pytest.fixture(scope="session")
+def model_artifacts(tmp_path_factory):
+    """Train a model on the test features data and write its artifacts and a matching modelconfig file
+
+    Returns:
+        str: location of the YAML config file pointing at the trained model artifacts
+    """
+
+    tmp_dir = tmp_path_factory.mktemp("models")
+
+    with open("config/modelconfig.yml", "r") as f:
+        modelconfig = yaml.load(f, Loader=yaml.FullLoader)
+
+    # Keep the ensemble small so that the fixture trains in a few seconds
+    tuned_params = modelconfig["train_model"]["tuned_params"]
+    tuned_params["params_rf"]["n_estimators"] = 10
+    tuned_params["params_gb"]["n_estimators"] = 20
+    tuned_params["params_gb"]["max_depth"] = 5
+    student_settings = modelconfig["train_model"]["student_model_settings"]
+    student_settings["n_synthetic"] = 2000
+    student_settings["params"]["n_estimators"] = 20
+
+    modelconfig["data_files"]["DATA_FILENAME_FEATURES"] = "test/test_features.csv"
+    modelconfig["storage"]["CACHE_DIR"] = str(tmp_dir / "cache")
+    for key, filename in modelconfig["model_files"].items():
+        modelconfig["model_files"][key] = str(tmp_dir / filename.split("/")[-1])
+
+    config_file = str(tmp_dir / "modelconfig.yml")
+    with open(config_file, "w") as f:
+        yaml.dump(modelconfig, f)
+
+    args = argparse.Namespace(
+        config=config_file,
+        input="test/test_features.csv",
+        output=None,
+        use_existing_params=True,
+        upload=False,
+        s3_bucket_name=None,
+    )
+    run_train_model(args)
+
+    return config_file
+
+
+@pytest.fixture
+def listings_input():
+    """Raw app inputs for the listings in the test features data"""
+
+    return pd.read_csv("test/test_features.csv").drop(columns="reviews_per_month")
+
+
+class _S3(http.server.BaseHTTPRequestHandler):
+    """Local stand-in for S3, keeping objects in `server.objects` keyed by (bucket, key)
+
+    Handles path-style object PUT, GET (with byte ranges), HEAD, and DELETE, and the multipart upload calls. Every
+    request is logged to `server.requests` as (method, key, query parameter names).
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_PUT(self):
+        bucket, key, query = self._parse()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            if "uploadId" in query:
+                self.server.uploads[query["uploadId"]][int(query["partNumber"])] = body
+            else:
+                self.server.objects[(bucket, key)] = body
+        self._send(200, headers={"ETag": '"{}"'.format(uuid.uuid4().hex)})
+
+    def do_POST(self):
+        bucket, key, query = self._parse()
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            if "uploads" in query:
+                upload_id = uuid.uuid4().hex
+                self.server.uploads[upload_id] = {}
+                body = (
+                    "<InitiateMultipartUploadResult><Bucket>{}</Bucket><Key>{}</Key>"
+                    "<UploadId>{}</UploadId></InitiateMultipartUploadResult>"
+                ).format(bucket, key, upload_id)
+            else:
+                parts = self.server.uploads.pop(query["uploadId"])
+                self.server.objects[(bucket, key)] = b"".join(
+                    parts[number] for number in sorted(parts)
+                )
+                body = (
+                    "<CompleteMultipartUploadResult><Bucket>{}</Bucket><Key>{}</Key>"
+                    '<ETag>"{}"</ETag></CompleteMultipartUploadResult>'
+                ).format(bucket, key, uuid.uuid4().hex)
+        self._send(200, body.encode())
+
+    def do_GET(self):
+        self._read(send_body=True)
+
+    def do_HEAD(self):
+        self._read(send_body=False)
+
+    def do_DELETE(self):
+        bucket, key, query = self._parse()
+        with self.server.lock:
+            if "uploadId" in query:
+                self.server.uploads.pop(query["uploadId"], None)
+            else:
+                self.server.objects.pop((bucket, key), None)
+        self._send(204)
+
+    def log_message(self, *args):
+        pass
+
+    def _read(self, send_body):
+        bucket, key, _ = self._parse()
+        content = self.server.objects.get((bucket, key))
+        if content is None:
+            body = b"<Error><Code>NoSuchKey</Code><Message>Not found</Message></Error>"
+            self._send(404, body if send_body else b"")
+            return
+        headers = {"ETag": '"{}"'.format(hash(content)), "Accept-Ranges": "bytes"}
+        status = 200
+        if self.headers.get("Range"):
+            start, end = self.headers["Range"].split("=")[1].split("-")
+            end = min(int(end) if end else len(content) - 1, len(content) - 1)
+            headers["Content-Range"] = "bytes {}-{}/{}".format(start, end, len(content))
+            content = content[int(start) : end + 1]
+            status = 206
+        if send_body:
+            self._send(status, content, headers)
+        else:
+            headers["Content-Length"] = str(len(content))
+            self._send(status, headers=headers)
+
+    def _parse(self):
+        url = urllib.parse.urlsplit(self.path)
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        key = urllib.parse.unquote(key)
+        query = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+        self.server.requests.append((self.command, key, sorted(query)))
+        return bucket, key, query
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        headers = dict(headers or {})
+        headers.setdefault("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+@pytest.fixture
+def s3_server(monkeypatch):
+    """Local S3 stand-in that every S3 client created through `src.helpers` connects to
+
+    Returns:
+        :class:`http.server.ThreadingHTTPServer`: server with the stored `objects` and logged `requests`
+    """
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _S3)
+    server.objects = {}
+    server.uploads = {}
+    server.requests = []
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setenv(
+        "S3_ENDPOINT_URL", "http://127.0.0.1:{}".format(server.server_address[1])
+    )
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    # Send plain request bodies rather than aws-chunked ones with trailing checksums
+    monkeypatch.setenv("AWS_REQUEST_CHECKSUM_CALCULATION", "when_required")
+    monkeypatch.setenv("AWS_RESPONSE_CHECKSUM_VALIDATION", "when_required")
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,182 @@
+import sys
+import pytest
+
+sys.path.append("./")
+sys.path.append("./src")
+
+import app as webapp
+import src.model_registry as model_registry
+from src.create_db import create_db, Listings
+from src.shadow import ShadowScorer
+
+
+@pytest.fixture
+def client(model_artifacts, tmp_path):
+    """Flask test client backed by a fresh SQLite database and the test model artifacts"""
+
+    engine_string = "sqlite:///{}".format(tmp_path / "test.db")
+    create_db(engine_string)
+    webapp.app.config["SQLALCHEMY_DATABASE_URI"] = engine_string
+    webapp.app.config["YAML_CONFIG"] = model_artifacts
+    webapp.db.session.remove()
+    webapp.recent_listings.reset()
+    return webapp.app.test_client()
+
+
+def _form(listing):
+    """Decode a listing from the test features data into `/add` form fields"""
+
+    artifacts = model_registry.get_artifacts(webapp.app.config["YAML_CONFIG"])
+    return artifacts["schema"].decode(listing)
+
+
+def test_predict_batch(client, listings_input):
+    """Test batch predictions are returned in order and every listing is written to the database"""
+
+    listings = listings_input.dropna().head(5).to_dict("records")
+    response = client.post("/predict/batch", json=listings)
+
+    assert response.status_code == 200
+    assert len(response.get_json()["predictions"]) == 5
+    assert len(response.get_json()["percentiles"]) == 5
+    with webapp.app.app_context():
+        assert webapp.db.session.query(Listings).count() == 5
+
+
+def test_predict_batch_bad(client, listings_input):
+    """Test a listing with a missing feature is rejected without scoring the batch"""
+
+    listings = listings_input.dropna().head(2).to_dict("records")
+    del listings[1]["price"]
+    response = client.post("/predict/batch", json={"listings": listings})
+
+    assert response.status_code == 400
+
+
+def test_add_cached(client, listings_input):
+    """Test resubmitting the same listing to /add is served from the prediction cache"""
+
+    webapp.prediction_cache.clear()
+    listing = listings_input.dropna().head(1).to_dict("records")[0]
+    form = _form(listing)
+    for _ in range(2):
+        response = client.post("/add", data=form)
+        assert response.status_code == 200
+
+    stats = client.get("/cache/stats").get_json()
+    assert stats["hits"] >= 1
+    assert stats["size"] >= 1
+
+
+def test_add_recent_listings(client, listings_input):
+    """Test the listing submitted to /add is shown first in the recent history"""
+
+    listing = listings_input.dropna().head(1).to_dict("records")[0]
+    form = _form(listing)
+    response = client.post("/add", data=form)
+
+    assert response.status_code == 200
+    assert webapp.recent_listings.rows()[0]["price"] == form["price"]
+
+
+def test_metrics(client, listings_input):
+    """Test /metrics reports per-stage latencies and request counts after a prediction"""
+
+    listing = listings_input.dropna().head(1).to_dict("records")[0]
+    client.post("/add", data=_form(listing))
+    response = client.get("/metrics")
+    text = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert 'airbnbchi_stage_seconds_count{stage="db_write"}' in text
+    assert 'airbnbchi_requests_total{endpoint="/add",method="POST",status="200"}' in text
+
+
+def test_create_app_preload(client, model_artifacts):
+    """Test the app factory loads the model artifacts into the registry before any request"""
+
+    model_registry.invalidate_artifacts()
+    application = webapp.create_app(preload=True, YAML_CONFIG=model_artifacts)
+
+    assert application is webapp.app
+    assert model_registry._ARTIFACTS
+
+
+def test_ready_after_warm_up(client):
+    """Test /ready reports the app as not ready until warm-up has finished"""
+
+    webapp.ready.clear()
+    assert client.get("/ready").status_code == 503
+
+    webapp.warm_up()
+    response = client.get("/ready")
+
+    assert response.status_code == 200
+    assert response.get_json()["ready"]
+
+
+def test_add_invalid(client, listings_input):
+    """Test a form with missing and malformed fields is rejected before scoring or writing to the database"""
+
+    form = _form(listings_input.dropna().head(1).to_dict("records")[0])
+    del form["price"]
+    form["host_listings_count"] = "many"
+    form["room_type"] = "Castle"
+    response = client.post("/add", data=form)
+
+    assert response.status_code == 400
+    with webapp.app.app_context():
+        assert webapp.db.session.query(Listings).count() == 0
+
+
+def test_predict_batch_other_model(client, listings_input, model_artifacts):
+    """Test `city` and `version` select a model from the model pool and unknown models are rejected"""
+
+    webapp.model_pool.configs[("austin", "2019-11-15")] = model_artifacts
+    listings = listings_input.dropna().head(2).to_dict("records")
+
+    response = client.post("/predict/batch?city=austin", json=listings)
+    assert response.status_code == 200
+    assert len(response.get_json()["predictions"]) == 2
+    stats = client.get("/models/stats").get_json()
+    assert {"city": "austin", "version": "2019-11-15"}.items() <= stats["resident"][0].items()
+
+    response = client.post(
+        "/predict/batch", json={"city": "boston", "listings": listings}
+    )
+    assert response.status_code == 404
+
+
+def test_model_load_error(client, listings_input, tmp_path):
+    """Test a model whose artifacts cannot be loaded is answered with 503 on both routes"""
+
+    webapp.model_pool.configs[("denver", "2019-11-15")] = str(tmp_path / "missing.yml")
+    listing = listings_input.dropna().head(1).to_dict("records")[0]
+
+    response = client.post("/predict/batch?city=denver", json=[listing])
+    assert response.status_code == 503
+    response = client.post("/add", data=dict(_form(listing), city="denver"))
+    assert response.status_code == 503
+
+
+def test_add_shadow(client, listings_input, model_artifacts, monkeypatch):
+    """Test /add submits the listing and the served prediction to the shadow scorer"""
+
+    assert client.get("/shadow/stats").status_code == 404
+
+    scorer = ShadowScorer(lambda: model_registry.get_artifacts(model_artifacts))
+    monkeypatch.setattr(webapp, "shadow_scorer", scorer)
+    webapp.prediction_cache.clear()
+    listing = listings_input.dropna().head(1).to_dict("records")[0]
+    response = client.post("/add", data=_form(listing))
+    client.post("/add", data=_form(listing))
+    scorer.flush()
+    stats = client.get("/shadow/stats").get_json()
+    scorer.stop()
+
+    assert response.status_code == 200
+    assert stats["scored"] == 2
+    # The second prediction was served from the prediction cache, so only the first one's latency is compared
+    assert stats["cached"] == 1
+    assert stats["max_abs_diff"] == 0.0
@@ -0,0 +1,76 @@
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append("./")
+sys.path.append("./src")
+
+import src.predict as predict
+import src.model_registry as model_registry
+from src.compiled_transform import CompiledTransform, compile_transform
+
+
+def test_transform_row_matches_transform_input(model_artifacts, listings_input):
+    """Test the compiled transform reproduces the dataframe transform exactly, column for column"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    transform = compile_transform(artifacts)
+
+    for _, row in listings_input.dropna().iterrows():
+        X = row.to_frame().T.reset_index(drop=True).infer_objects()
+        expected = predict.prepare_input(X, artifacts)
+
+        assert transform.columns == expected.columns.tolist()
+        assert np.array_equal(
+            transform.transform_row(row.to_dict()), expected.values[0].astype(float)
+        )
+
+
+def test_transform_row_out(model_artifacts, listings_input):
+    """Test the compiled transform fills a caller-provided vector"""
+
+    transform = model_registry.get_artifacts(model_artifacts)["transform"]
+    out = np.empty(transform.n_features)
+
+    assert transform.transform_row(listings_input.iloc[0].to_dict(), out) is out
+
+
+def test_transform_row_bad(model_artifacts, listings_input):
+    """Test an unknown category is rejected instead of silently encoded as the dropped category"""
+
+    transform = model_registry.get_artifacts(model_artifacts)["transform"]
+    row = listings_input.iloc[0].to_dict()
+    row["room_type"] = "Treehouse"
+
+    with pytest.raises(ValueError):
+        transform.transform_row(row)
+
+
+def test_run_predict_compiled(model_artifacts, listings_input):
+    """Test prediction through the compiled transform matches the dataframe path"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    dataframe_only = dict(artifacts, transform=None)
+    X = listings_input.dropna().head(1).reset_index(drop=True)
+
+    assert predict.run_predict(X.copy(), artifacts=artifacts) == predict.run_predict(
+        X.copy(), artifacts=dataframe_only
+    )
+
+
+def test_transform_for(model_artifacts, listings_input):
+    """Test the flat engine is handed the feature vector, and any other model a dataframe"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    transform = artifacts["transform"]
+    X = listings_input.dropna().head(1).reset_index(drop=True)
+
+    vector = transform.transform_for(X, artifacts["flat_model"])
+    frame = transform.transform_for(X, artifacts["model"])
+
+    assert isinstance(vector, np.ndarray)
+    assert isinstance(frame, pd.DataFrame)
+    assert artifacts["flat_model"].predict(vector) == artifacts["flat_model"].predict(
+        frame
+    )
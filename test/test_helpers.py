@@ -0,0 +1,185 @@
+import io
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+import sys
+
+sys.path.append("./")
+sys.path.append("./src")
+
+import src.helpers as helpers
+import src.clean_data as clean_data
+import src.model_registry as model_registry
+import src.predict as predict
+from src.tree_engine import FlatTreeEnsemble
+
+
+def test_get_s3_client_reused(s3_server):
+    """Test the S3 client is created once per process and endpoint and reused by every transfer"""
+
+    client = helpers.get_s3_client()
+
+    assert helpers.get_s3_client() is client
+    assert client.meta.endpoint_url == os.environ["S3_ENDPOINT_URL"]
+
+
+def test_get_transfer_config(monkeypatch):
+    """Test the multipart chunk size and concurrency are read from the environment"""
+
+    monkeypatch.setenv("S3_MULTIPART_CHUNKSIZE", str(5 * 1024**2))
+    monkeypatch.setenv("S3_MAX_CONCURRENCY", "4")
+    config = helpers.get_transfer_config()
+
+    assert config.multipart_chunksize == 5 * 1024**2
+    assert config.max_request_concurrency == 4
+
+
+def test_upload_and_read_multipart(s3_server, monkeypatch, tmp_path):
+    """Test files above the multipart threshold are uploaded and downloaded in parts and arrive intact"""
+
+    monkeypatch.setenv("S3_MULTIPART_THRESHOLD", str(5 * 1024**2))
+    monkeypatch.setenv("S3_MULTIPART_CHUNKSIZE", str(5 * 1024**2))
+    content = os.urandom(12 * 1024**2)
+    (tmp_path / "upload.bin").write_bytes(content)
+
+    assert helpers.upload_to_s3(str(tmp_path / "upload.bin"), "bucket", "data/file.bin")
+    assert helpers.read_from_s3(
+        "data/file.bin", "bucket", str(tmp_path / "download.bin")
+    )
+
+    assert s3_server.objects[("bucket", "data/file.bin")] == content
+    assert (tmp_path / "download.bin").read_bytes() == content
+    parts = [r for r in s3_server.requests if r[0] == "PUT" and "partNumber" in r[2]]
+    ranged = [r for r in s3_server.requests if r[0] == "GET"]
+    assert len(parts) == 3
+    assert len(ranged) == 3
+
+
+def test_fileobj_round_trip(s3_server):
+    """Test in-memory buffers are uploaded and downloaded without going through a local file"""
+
+    assert helpers.upload_fileobj_to_s3(
+        io.BytesIO(b"id,price\n1,100\n"), "bucket", "a.csv"
+    )
+
+    assert helpers.read_bytes_from_s3("a.csv", "bucket").read() == b"id,price\n1,100\n"
+    with helpers.open_from_s3("a.csv", "bucket") as body:
+        assert body.read() == b"id,price\n1,100\n"
+
+
+def test_read_missing_object(s3_server, tmp_path):
+    """Test a missing object is reported as a failed download rather than raised"""
+
+    assert not helpers.read_from_s3(
+        "missing.csv", "bucket", str(tmp_path / "missing.csv")
+    )
+    assert helpers.read_bytes_from_s3("missing.csv", "bucket") is None
+    assert helpers.open_from_s3("missing.csv", "bucket") is None
+
+
+def test_run_clean_data_streamed(s3_server, tmp_path):
+    """Test the raw data is parsed as it streams from S3 without writing the raw data file"""
+
+    with open("config/modelconfig.yml", "r") as f:
+        modelconfig = yaml.load(f, Loader=yaml.FullLoader)
+    del modelconfig["storage"]["CACHE_DIR"]
+    config_file = str(tmp_path / "modelconfig.yml")
+    with open(config_file, "w") as f:
+        yaml.dump(modelconfig, f)
+    config = model_registry.load_config(config_file)
+    with open("test/test_listings-raw.csv", "rb") as f:
+        s3_server.objects[("bucket", config.s3_objects["S3_OBJECT_DATA_RAW"])] = (
+            f.read()
+        )
+
+    args = argparse.Namespace(
+        config=config_file,
+        s3_bucket_name="bucket",
+        input=None,
+        output=str(tmp_path / "clean.csv"),
+        keep_raw=False,
+    )
+    clean_data.run_clean_data(args)
+
+    expected = str(tmp_path / "expected.csv")
+    clean_data.run_clean_data(
+        argparse.Namespace(
+            config="config/modelconfig.yml",
+            s3_bucket_name=None,
+            input="test/test_listings-raw.csv",
+            output=expected,
+            keep_raw=True,
+        )
+    )
+    pd.testing.assert_frame_equal(
+        pd.read_csv(str(tmp_path / "clean.csv")), pd.read_csv(expected)
+    )
+    assert not os.path.exists(config.data_files["DATA_FILENAME_RAW"])
+
+
+def test_load_artifacts_from_s3(s3_server, model_artifacts, listings_input):
+    """Test the artifacts downloaded from S3 match the ones they were uploaded from"""
+
+    config = model_registry.load_config(model_artifacts)
+    local = model_registry.load_artifacts(model_artifacts)
+    for name in ("TMO", "ENCODER", "SCALERS", "PERCENTILES", "FLAT"):
+        with open(config.model_files["MODEL_FILENAME_" + name], "rb") as f:
+            s3_server.objects[
+                ("bucket", config.s3_objects["S3_OBJECT_MODEL_" + name])
+            ] = f.read()
+
+    artifacts = model_registry.load_artifacts(model_artifacts, s3_bucket_name="bucket")
+    X = predict.prepare_input(listings_input.dropna().reset_index(drop=True), local)
+
+    assert (artifacts["model"].predict(X) == local["model"].predict(X)).all()
+    assert ("GET", config.s3_objects["S3_OBJECT_MODEL_TMO"], []) in s3_server.requests
+
+
+def test_load_artifacts_missing_arrays_in_s3(s3_server, model_artifacts, tmp_path):
+    """Test array artifacts missing from S3 are rebuilt rather than read from files left by another model"""
+
+    config = model_registry.load_config(model_artifacts)
+    for name in ("TMO", "ENCODER", "SCALERS"):
+        with open(config.model_files["MODEL_FILENAME_" + name], "rb") as f:
+            s3_server.objects[
+                ("bucket", config.s3_objects["S3_OBJECT_MODEL_" + name])
+            ] = f.read()
+    with open(model_artifacts, "r") as f:
+        modelconfig = yaml.load(f, Loader=yaml.FullLoader)
+    for name in ("PERCENTILES", "FLAT"):
+        modelconfig["model_files"]["MODEL_FILENAME_" + name] = str(
+            tmp_path / os.path.basename(config.model_files["MODEL_FILENAME_" + name])
+        )
+    config_file = str(tmp_path / "modelconfig.yml")
+    with open(config_file, "w") as f:
+        yaml.dump(modelconfig, f)
+    np.save(str(tmp_path / "percentiles.npy"), np.array([0.0]))
+    local = model_registry.load_artifacts(model_artifacts)
+    other = local["model"].estimators_[0]
+    FlatTreeEnsemble.from_model(other).save(str(tmp_path / "model-flat.npz"))
+
+    artifacts = model_registry.load_artifacts(config_file, s3_bucket_name="bucket")
+
+    assert np.array_equal(artifacts["percentiles"], local["percentiles"])
+    assert artifacts["flat_model"].source_sha256 is None
+    assert artifacts["flat_model"].n_trees == local["flat_model"].n_trees
+
+
+def test_load_artifacts_missing_pickle_in_s3(s3_server, model_artifacts):
+    """Test a pickle missing from S3 fails the load instead of being read from a local file of another model"""
+
+    config = model_registry.load_config(model_artifacts)
+    for name in ("TMO", "SCALERS", "PERCENTILES", "FLAT"):
+        with open(config.model_files["MODEL_FILENAME_" + name], "rb") as f:
+            s3_server.objects[
+                ("bucket", config.s3_objects["S3_OBJECT_MODEL_" + name])
+            ] = f.read()
+
+    with pytest.raises(model_registry.ArtifactError):
+        model_registry.read_artifacts(model_artifacts, s3_bucket_name="bucket")
+    with pytest.raises(SystemExit):
+        model_registry.load_artifacts(model_artifacts, s3_bucket_name="bucket")
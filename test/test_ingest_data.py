@@ -1,4 +1,9 @@
 import os
+import gzip
+import json
+import time
+import threading
+import http.server
 import pathlib
 import requests
 import logging
@@ -11,6 +16,7 @@ sys.path.append("./")
 sys.path.append("./src")
 
 import src.ingest_data as ingest_data
+import src.storage as storage
 
 
 def test_import_data_from_source():
@@ -45,3 +51,300 @@ def test_import_data_from_source_bad():
             os.path.isfile(pathlib.Path("./test/test_listings_raw_ingested.csv"))
             == False
         )
+
+
+class _Response:
+    """Stands in for a streamed `requests.Response` of the given bytes"""
+
+    def __init__(self, content):
+        self.content = content
+        self.status_code = 200
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start : start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_data_from_source(monkeypatch, tmp_path):
+    """Test the streamed CSV file has the exact bytes of the source, including concatenated gzip members"""
+
+    with open("test/test_listings-raw.csv", "rb") as f:
+        raw = f.read()
+    half = len(raw) // 2
+    content = gzip.compress(raw[:half]) + gzip.compress(raw[half:])
+    monkeypatch.setattr(
+        ingest_data.requests, "get", lambda url, **kwargs: _Response(content)
+    )
+    output = str(tmp_path / "listings-raw.csv")
+
+    nbytes = ingest_data.stream_data_from_source("http://source", output, 4096)
+
+    assert nbytes == len(raw)
+    with open(output, "rb") as f:
+        assert f.read() == raw
+
+
+def test_stream_data_from_source_truncated(monkeypatch, tmp_path):
+    """Test a download that ends mid-file exits without leaving a partial CSV file behind"""
+
+    with open("test/test_listings-raw.csv", "rb") as f:
+        content = gzip.compress(f.read())
+    monkeypatch.setattr(
+        ingest_data.requests,
+        "get",
+        lambda url, **kwargs: _Response(content[: len(content) // 2]),
+    )
+    output = tmp_path / "listings-raw.csv"
+
+    with pytest.raises(SystemExit):
+        ingest_data.stream_data_from_source("http://source", str(output), 4096)
+    assert list(tmp_path.iterdir()) == []
+
+
+class _Source(http.server.BaseHTTPRequestHandler):
+    """Local stand-in for the data source, serving `server.content` with `server.etag` and answering conditional requests"""
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = gzip.compress(self.server.content)
+        self.send_response(200)
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Last-Modified", "Thu, 21 Nov 2019 00:00:00 GMT")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def source():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Source)
+    server.content = b"id,price\n1,100\n2,200\n"
+    server.etag = '"v1"'
+    server.requests = []
+    server.url = "http://127.0.0.1:{}/listings.csv.gz".format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    """Content of every file uploaded to S3 through `upload_to_s3`, in order"""
+
+    uploaded = []
+
+    def upload_to_s3(file_name, bucket, object_name=None):
+        with open(file_name, "rb") as f:
+            uploaded.append((bucket, object_name, f.read()))
+        return True
+
+    monkeypatch.setattr(ingest_data, "upload_to_s3", upload_to_s3)
+    return uploaded
+
+
+def test_ingest_if_changed(source, uploads, tmp_path):
+    """Test an unchanged snapshot is answered with 304 and neither downloaded nor uploaded again"""
+
+    manifest_file = str(tmp_path / "manifest.json")
+
+    assert ingest_data.ingest_if_changed(source.url, "bucket", "raw.csv", manifest_file)
+    assert not ingest_data.ingest_if_changed(
+        source.url, "bucket", "raw.csv", manifest_file
+    )
+
+    assert uploads == [("bucket", "raw.csv", source.content)]
+    assert "If-None-Match" not in source.requests[0]
+    assert source.requests[1]["If-None-Match"] == '"v1"'
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    assert manifest["sources"][source.url]["etag"] == '"v1"'
+    assert manifest["sources"][source.url]["bytes"] == len(source.content)
+    assert manifest["objects"]["s3://bucket/raw.csv"]["source"] == source.url
+
+
+def test_ingest_if_changed_same_content(source, uploads, tmp_path):
+    """Test a snapshot with a new ETag but the same content is downloaded and not uploaded"""
+
+    manifest_file = str(tmp_path / "manifest.json")
+    ingest_data.ingest_if_changed(source.url, "bucket", "raw.csv", manifest_file)
+    source.etag = '"v2"'
+
+    assert not ingest_data.ingest_if_changed(
+        source.url, "bucket", "raw.csv", manifest_file
+    )
+    assert len(uploads) == 1
+
+    source.content += b"3,300\n"
+    source.etag = '"v3"'
+
+    assert ingest_data.ingest_if_changed(source.url, "bucket", "raw.csv", manifest_file)
+    assert uploads[-1][2] == source.content
+
+
+def test_ingest_if_changed_object_replaced(source, uploads, tmp_path):
+    """Test validators are not sent once the S3 object holds content ingested from another snapshot"""
+
+    manifest_file = str(tmp_path / "manifest.json")
+    ingest_data.ingest_if_changed(source.url, "bucket", "raw.csv", manifest_file)
+    other_url = source.url.replace("listings", "other-listings")
+    source.content = b"id,price\n9,900\n"
+    ingest_data.ingest_if_changed(other_url, "bucket", "raw.csv", manifest_file)
+    source.content = b"id,price\n1,100\n2,200\n"
+
+    assert ingest_data.ingest_if_changed(source.url, "bucket", "raw.csv", manifest_file)
+    assert "If-None-Match" not in source.requests[-1]
+    assert [u[2] for u in uploads][-1] == source.content
+
+
+def test_ingest_if_changed_storage_location(source, tmp_path):
+    """Test objects are recorded by their location in the storage backend, so a store without the snapshot gets it"""
+
+    manifest_file = str(tmp_path / "manifest.json")
+    stores = [
+        storage.LocalStorage(str(tmp_path / "a")),
+        storage.LocalStorage(str(tmp_path / "b")),
+        storage.MemoryStorage(),
+        storage.MemoryStorage(),
+    ]
+
+    for store in stores:
+        assert ingest_data.ingest_if_changed(
+            source.url, "bucket", "raw.csv", manifest_file, storage=store
+        )
+        assert store.read_bytes("raw.csv").read() == source.content
+
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    assert set(manifest["objects"]) == {
+        str(tmp_path / "a" / "raw.csv"),
+        str(tmp_path / "b" / "raw.csv"),
+    }
+
+
+class _Sources(http.server.BaseHTTPRequestHandler):
+    """Local stand-in for several sources: serves `server.files` by path, after failing `server.flaky` paths once"""
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(
+                self.server.max_in_flight, self.server.in_flight
+            )
+        try:
+            time.sleep(0.2)
+            if self.path in self.server.flaky:
+                self.server.flaky.remove(self.path)
+                self.send_error(503)
+            elif self.path not in self.server.files:
+                self.send_error(404)
+            else:
+                body = gzip.compress(self.server.files[self.path])
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sources_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Sources)
+    server.files = {}
+    server.flaky = set()
+    server.lock = threading.Lock()
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.url = "http://127.0.0.1:{}".format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_load_sources(tmp_path):
+    """Test source URLs are built from the state, city, and pull date unless given"""
+
+    sources_file = tmp_path / "sources.yml"
+    sources_file.write_text(
+        "- {city: chicago, state: il, pull_date: 2019-11-21}\n"
+        "- {city: boston, pull_date: 2019-11-21, url: 'http://host/boston.csv.gz'}\n"
+    )
+
+    sources = ingest_data.load_sources(
+        str(sources_file), "http://host/{state}/{city}/{pull_date}"
+    )
+
+    assert sources == [
+        {
+            "city": "chicago",
+            "pull_date": "2019-11-21",
+            "url": "http://host/il/chicago/2019-11-21",
+        },
+        {
+            "city": "boston",
+            "pull_date": "2019-11-21",
+            "url": "http://host/boston.csv.gz",
+        },
+    ]
+
+    sources_file.write_text("- {city: chicago, pull_date: 2019-11-21}\n")
+    with pytest.raises(ValueError):
+        ingest_data.load_sources(
+            str(sources_file), "http://host/{state}/{city}/{pull_date}"
+        )
+
+
+def test_ingest_sources(sources_server, tmp_path):
+    """Test sources are fetched concurrently into their own partitions, retrying server errors but not a 404"""
+
+    sources = []
+    for i, city in enumerate(["chicago", "austin", "boston", "denver"]):
+        path = "/{}/2019-11-21.csv.gz".format(city)
+        sources_server.files[path] = "id,city\n{},{}\n".format(i, city).encode()
+        sources.append(
+            {"city": city, "pull_date": "2019-11-21", "url": sources_server.url + path}
+        )
+    sources_server.flaky.add("/austin/2019-11-21.csv.gz")
+    sources.append(
+        {
+            "city": "nowhere",
+            "pull_date": "2019-11-21",
+            "url": sources_server.url + "/nowhere",
+        }
+    )
+    template = str(
+        tmp_path / "raw" / "city={city}" / "pull_date={pull_date}" / "listings-raw.csv"
+    )
+
+    results = ingest_data.ingest_sources(
+        sources, None, template, workers=4, retries=2, backoff_seconds=0.01
+    )
+
+    assert [r["status"] for r in results] == ["stored"] * 4 + ["failed"]
+    assert [r["attempts"] for r in results] == [1, 2, 1, 1, 1]
+    assert sources_server.max_in_flight > 1
+    with open(
+        tmp_path / "raw" / "city=austin" / "pull_date=2019-11-21" / "listings-raw.csv",
+        "rb",
+    ) as f:
+        assert f.read() == b"id,city\n1,austin\n"
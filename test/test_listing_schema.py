@@ -0,0 +1,74 @@
+import sys
+import pytest
+
+sys.path.append("./")
+sys.path.append("./src")
+
+from src.model_registry import get_artifacts
+from src.listing_schema import ListingError
+
+
+@pytest.fixture
+def schema(model_artifacts):
+    return get_artifacts(model_artifacts)["schema"]
+
+
+def test_decode(schema, listings_input):
+    """Test form fields are decoded to the types of the Listings columns and assembled in model input order"""
+
+    listing = schema.decode(listings_input.dropna().head(1).to_dict("records")[0])
+    form = {name: str(value) for name, value in listing.items()}
+    form["room_type"] = " {} ".format(listing["room_type"])
+    row = schema.decode(form)
+
+    assert row == listing
+    assert isinstance(row["host_listings_count"], int)
+    assert row["host_is_superhost"] in (0, 1)
+    assert list(schema.frame([row]).columns) == schema.features
+
+
+def test_decode_invalid(schema, listings_input):
+    """Test every missing or invalid field is reported at once"""
+
+    listing = listings_input.dropna().head(1).to_dict("records")[0]
+    del listing["price"]
+    listing["host_is_superhost"] = 2
+    listing["cleaning_fee"] = float("nan")
+    listing["room_type"] = "Castle"
+
+    with pytest.raises(ListingError) as e:
+        schema.decode(listing)
+    assert set(e.value.errors) == {
+        "price",
+        "host_is_superhost",
+        "cleaning_fee",
+        "room_type",
+    }
+
+    with pytest.raises(ListingError):
+        schema.decode(["not", "a", "listing"])
+
+
+@pytest.mark.parametrize(
+    "value, expected", [(3, 3), ("3", 3), (" 3 ", 3), ("3.0", 3), (3.0, 3)]
+)
+def test_decode_int(schema, listings_input, value, expected):
+    """Test integer fields accept whole numbers given as numbers or strings"""
+
+    listing = listings_input.dropna().head(1).to_dict("records")[0]
+    listing["host_listings_count"] = value
+
+    assert schema.decode(listing)["host_listings_count"] == expected
+
+
+@pytest.mark.parametrize("value", [2.7, "2.7", "1e400", "three", 0.5])
+def test_decode_int_invalid(schema, listings_input, value):
+    """Test integer fields reject fractional and non-numeric values instead of truncating them"""
+
+    listing = listings_input.dropna().head(1).to_dict("records")[0]
+    listing["host_listings_count"] = value
+    listing["host_is_superhost"] = value
+
+    with pytest.raises(ListingError) as e:
+        schema.decode(listing)
+    assert set(e.value.errors) == {"host_listings_count", "host_is_superhost"}
@@ -0,0 +1,53 @@
+import sys
+import pytest
+
+sys.path.append("./")
+sys.path.append("./src")
+
+from src import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_summary_render():
+    """Test a summary is rendered with its quantiles, sum, and count"""
+
+    for value in range(1, 101):
+        metrics.observe("stage_seconds", value / 1000, stage="predict")
+    text = metrics.render()
+
+    assert "# TYPE airbnbchi_stage_seconds summary" in text
+    assert 'airbnbchi_stage_seconds{stage="predict",quantile="0.5"} 0.0505' in text
+    assert 'airbnbchi_stage_seconds{stage="predict",quantile="0.99"}' in text
+    assert 'airbnbchi_stage_seconds_count{stage="predict"} 100' in text
+    assert 'airbnbchi_stage_seconds_sum{stage="predict"} 5.05' in text
+
+
+def test_counter_render():
+    """Test counters are summed per label set and label values are escaped"""
+
+    metrics.inc("requests_total", endpoint="/add", status=200)
+    metrics.inc("requests_total", endpoint="/add", status=200)
+    metrics.inc("errors_total", stage='bad "stage"')
+    text = metrics.render()
+
+    assert "# TYPE airbnbchi_requests_total counter" in text
+    assert 'airbnbchi_requests_total{endpoint="/add",status="200"} 2' in text
+    assert 'airbnbchi_errors_total{stage="bad \\"stage\\""} 1' in text
+
+
+def test_timer_records_on_error():
+    """Test a timed stage is recorded even when it raises"""
+
+    timings = {}
+    with pytest.raises(ValueError):
+        with metrics.timer("transform", timings):
+            raise ValueError("bad input")
+
+    assert 'airbnbchi_stage_seconds_count{stage="transform"} 1' in metrics.render()
+    assert timings["transform"] >= 0
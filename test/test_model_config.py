@@ -0,0 +1,82 @@
+import sys
+import pandas as pd
+import pytest
+import yaml
+
+sys.path.append("./")
+sys.path.append("./src")
+
+from src.model_config import ModelConfig, ConfigError, load_config
+
+
+@pytest.fixture
+def raw_config():
+    with open("config/modelconfig.yml", "r") as f:
+        return yaml.load(f, Loader=yaml.FullLoader)
+
+
+def test_load_config_cached(raw_config, tmp_path):
+    """Test the config file is only parsed again once it changes"""
+
+    config_file = tmp_path / "modelconfig.yml"
+    with open(config_file, "w") as f:
+        yaml.dump(raw_config, f)
+    config = load_config(config_file)
+
+    assert load_config(str(config_file)) is config
+
+    raw_config["seed"] = 4230
+    with open(config_file, "w") as f:
+        yaml.dump(raw_config, f)
+    reloaded = load_config(config_file)
+
+    assert reloaded is not config
+    assert reloaded.seed == 4230
+
+
+def test_derived_structures(raw_config):
+    """Test the column index maps and inverted host response map match the configured lists"""
+
+    config = ModelConfig(raw_config)
+    train_model = raw_config["train_model"]
+
+    assert config.cols_cat == train_model["COLS_CAT"]
+    for col, i in config.std_index.items():
+        assert train_model["COLS_NUM_STD"][i] == col
+    for col, i in config.feature_index.items():
+        assert config.select_features[i] == col
+    for category, code in train_model["HOST_RESPONSE_MAP"].items():
+        assert config.host_response_inverse[code] == category
+    # Sections read by key are copies, so that a stage changing its settings does not change the shared config
+    assert config["train_model"] == train_model
+    assert config["train_model"] is not train_model
+
+
+def test_valid_cols(raw_config):
+    """Test only the configured columns present in the data are returned, in configured order"""
+
+    config = ModelConfig(raw_config)
+    df = pd.read_csv("test/test_features.csv").drop(columns="price")
+
+    cols = config.valid_cols("cols_num_std", df.columns)
+
+    assert cols == [c for c in raw_config["train_model"]["COLS_NUM_STD"] if c != "price"]
+    assert config.valid_cols("cols_num_std", df.columns) is cols
+
+
+def test_config_missing_key(raw_config):
+    """Test a config without a required section is rejected"""
+
+    del raw_config["train_model"]["COLS_CAT"]
+
+    with pytest.raises(ConfigError):
+        ModelConfig(raw_config)
+
+
+def test_config_bad_column(raw_config):
+    """Test a transformed column that is not a selected feature is rejected"""
+
+    raw_config["train_model"]["COLS_NUM_STD"].append("not_a_feature")
+
+    with pytest.raises(ConfigError):
+        ModelConfig(raw_config)
@@ -0,0 +1,122 @@
+import sys
+import pytest
+
+sys.path.append("./")
+sys.path.append("./src")
+
+from src import metrics
+from src.model_pool import ModelPool, artifacts_nbytes
+from src.model_registry import ArtifactError
+
+
+def test_get_cached(model_artifacts):
+    """Test a model is loaded on first use, reused after, and the latest version is served by default"""
+
+    pool = ModelPool(
+        {
+            ("chicago", "2019-10-21"): model_artifacts,
+            ("chicago", "2019-11-21"): model_artifacts,
+        }
+    )
+    artifacts = pool.get("chicago", "2019-11-21")
+
+    assert pool.get("chicago") is artifacts
+    assert pool.loads == 1
+    assert pool.stats()["resident_bytes"] == artifacts_nbytes(artifacts) > 0
+
+
+def test_get_unknown(model_artifacts):
+    """Test requesting a city or version without a model raises a KeyError"""
+
+    pool = ModelPool({("chicago", "2019-11-21"): model_artifacts})
+
+    with pytest.raises(KeyError):
+        pool.get("boston")
+    with pytest.raises(KeyError):
+        pool.get("chicago", "2018-01-01")
+
+
+def test_config_dir(model_artifacts, tmp_path):
+    """Test modelconfig files found as `<city>/<version>.yml` in the config directory are served"""
+
+    (tmp_path / "austin").mkdir()
+    with open(model_artifacts, "r") as f:
+        (tmp_path / "austin" / "2019-11-15.yml").write_text(f.read())
+    pool = ModelPool(config_dir=str(tmp_path))
+
+    assert set(pool.available()) == {("austin", "2019-11-15")}
+    assert pool.get("austin")["model"] is not None
+
+
+def test_evict_lru(model_artifacts):
+    """Test the least recently used model is evicted once the resident models exceed the memory budget"""
+
+    metrics.reset()
+    keys = [("chicago", "2019-09-21"), ("chicago", "2019-10-21"), ("chicago", "2019-11-21")]
+    pool = ModelPool({key: model_artifacts for key in keys})
+    nbytes = artifacts_nbytes(pool.get(*keys[0]))
+    pool.max_bytes = 2 * nbytes
+
+    pool.get(*keys[1])
+    pool.get(*keys[0])
+    pool.get(*keys[2])
+    stats = pool.stats()
+
+    assert [(m["city"], m["version"]) for m in stats["resident"]] == [keys[0], keys[2]]
+    assert stats["evictions"] == 1
+    assert stats["resident_bytes"] == 2 * nbytes
+    text = metrics.render()
+    assert 'airbnbchi_model_evictions_total{city="chicago",version="2019-10-21"} 1' in text
+    assert "airbnbchi_model_pool_resident_models 2" in text
+
+
+def test_evict_keeps_requested(model_artifacts):
+    """Test a model larger than the memory budget is still served, after evicting every other model"""
+
+    pool = ModelPool(
+        {
+            ("chicago", "2019-10-21"): model_artifacts,
+            ("chicago", "2019-11-21"): model_artifacts,
+        },
+        max_bytes=1,
+    )
+    pool.get("chicago", "2019-10-21")
+    artifacts = pool.get("chicago", "2019-11-21")
+
+    assert [m["version"] for m in pool.stats()["resident"]] == ["2019-11-21"]
+    assert pool.get("chicago", "2019-11-21") is artifacts
+    assert pool.evict("chicago", "2019-11-21")
+    assert pool.stats()["resident"] == []
+
+
+def test_get_load_error(model_artifacts, tmp_path):
+    """Test a model whose artifacts cannot be loaded raises an ArtifactError, and other models keep being served"""
+
+    pool = ModelPool(
+        {
+            ("chicago", "2019-11-21"): model_artifacts,
+            ("boston", "2019-11-21"): str(tmp_path / "missing.yml"),
+        }
+    )
+
+    with pytest.raises(ArtifactError):
+        pool.get("boston")
+    assert pool.get("chicago")["model"] is not None
+    assert pool.loads == 1
+    assert pool._loading == {}
+
+
+def test_config_dir_scan_cached(model_artifacts, tmp_path):
+    """Test the config directory is listed once per `scan_seconds` rather than on every request"""
+
+    (tmp_path / "austin").mkdir()
+    with open(model_artifacts, "r") as f:
+        text = f.read()
+    (tmp_path / "austin" / "2019-11-15.yml").write_text(text)
+    pool = ModelPool(config_dir=str(tmp_path), scan_seconds=3600)
+    assert pool.resolve("austin")[0] == ("austin", "2019-11-15")
+
+    (tmp_path / "austin" / "2019-12-15.yml").write_text(text)
+    assert pool.resolve("austin")[0] == ("austin", "2019-11-15")
+    pool.refresh()
+    assert pool.resolve("austin")[0] == ("austin", "2019-12-15")
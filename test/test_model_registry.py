@@ -0,0 +1,117 @@
+import sys
+import pandas as pd
+import numpy as np
+import pytest
+import yaml
+
+sys.path.append("./")
+sys.path.append("./src")
+
+import src.model_registry as model_registry
+import src.predict as predict
+
+
+def test_get_artifacts_cached(model_artifacts):
+    """Test artifacts are only loaded once per process and the cached objects are reused"""
+
+    model_registry.invalidate_artifacts()
+    artifacts = model_registry.get_artifacts(model_artifacts)
+
+    assert model_registry.get_artifacts(model_artifacts) is artifacts
+    assert set(artifacts.keys()) == {
+        "config",
+        "model",
+        "encoder",
+        "scalers",
+        "percentiles",
+        "transform",
+        "schema",
+        "flat_model",
+        "generation",
+    }
+
+
+def test_load_percentiles(model_artifacts):
+    """Test the percentile index written at training time is loaded sorted"""
+
+    percentiles = model_registry.get_artifacts(model_artifacts)["percentiles"]
+
+    assert percentiles.shape[0] == pd.read_csv("test/test_features.csv").shape[0]
+    assert (percentiles[1:] >= percentiles[:-1]).all()
+
+
+def test_load_percentiles_fallback():
+    """Test the percentile index is built from the features data if the artifact is missing"""
+
+    config = {
+        "model_files": {"MODEL_FILENAME_PERCENTILES": "test/non_existant.npy"},
+        "data_files": {"DATA_FILENAME_FEATURES": "test/test_features.csv"},
+        "TARGET_COL": "reviews_per_month",
+    }
+    percentiles = model_registry.load_percentiles(config)
+
+    assert percentiles.shape[0] == pd.read_csv("test/test_features.csv").shape[0]
+
+
+def test_reload_artifacts(model_artifacts):
+    """Test reloading replaces the cached artifacts with freshly loaded objects"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    reloaded = model_registry.reload_artifacts(model_artifacts)
+
+    assert reloaded["model"] is not artifacts["model"]
+    assert model_registry.get_artifacts(model_artifacts) is reloaded
+
+
+def test_invalidate_artifacts(model_artifacts):
+    """Test invalidating forces the next lookup to load the artifacts again"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    model_registry.invalidate_artifacts(model_artifacts)
+
+    assert model_registry.get_artifacts(model_artifacts) is not artifacts
+
+
+def test_load_artifacts_bad():
+    """Test that system exits if the configurations file does not exist"""
+
+    with pytest.raises(SystemExit):
+        model_registry.load_artifacts("config/non_existant_config.yml")
+
+
+def test_run_predict_with_artifacts(model_artifacts, listings_input):
+    """Test prediction from preloaded artifacts matches loading them through the registry"""
+
+    X = listings_input.dropna().iloc[[0]].reset_index(drop=True)
+    artifacts = model_registry.load_artifacts(model_artifacts)
+
+    pred, perc = predict.run_predict(X.copy(), artifacts=artifacts)
+
+    assert pred == predict.run_predict(X.copy(), modelconfig=model_artifacts)[0]
+    assert 0 <= perc <= 100
+
+
+def test_serve_student_model(model_artifacts, listings_input, tmp_path):
+    """Test `serving.MODEL: student` makes the registry and run_predict serve the distilled student"""
+
+    with open(model_artifacts, "r") as f:
+        modelconfig = yaml.load(f, Loader=yaml.FullLoader)
+    modelconfig["serving"]["MODEL"] = "student"
+    config_file = str(tmp_path / "modelconfig.yml")
+    with open(config_file, "w") as f:
+        yaml.dump(modelconfig, f)
+
+    artifacts = model_registry.load_artifacts(config_file)
+    X = listings_input.dropna().reset_index(drop=True)
+    X_transformed = predict.prepare_input(X.copy(), artifacts)
+    pred, perc = predict.run_predict(X.iloc[[0]].copy(), artifacts=artifacts)
+
+    assert type(artifacts["model"]).__name__ == "GradientBoostingRegressor"
+    np.testing.assert_allclose(
+        artifacts["flat_model"].predict(X_transformed),
+        artifacts["model"].predict(X_transformed),
+        rtol=1e-5,
+        atol=1e-5,
+    )
+    assert pred is not None
+    assert 0 <= perc <= 100
@@ -8,6 +8,8 @@ import logging
 import logging.config
 import pytest
 
+from scipy import stats
+
 sys.path.append("./")
 sys.path.append("./src")
 
@@ -120,6 +122,20 @@ def test_get_percentile():
     assert predict.generate_percentile(val, arr) == 90
 
 
+def test_get_percentile_vector():
+    """Test percentile ranks for a vector of predictions match scipy, ties included"""
+
+    arr = np.array([3, 1, 2, 2, 5, 4, 2, 9, 7, 7])
+    vals = np.array([0, 2, 2.5, 7, 9, 10])
+    expected = [np.round(stats.percentileofscore(arr, val), 2) for val in vals]
+
+    assert predict.generate_percentile(vals, arr).tolist() == expected
+    assert (
+        predict.generate_percentile(vals, np.sort(arr), presorted=True).tolist()
+        == expected
+    )
+
+
 def test_get_percentile_bad():
     """Test percentile is None if input data is invalid type"""
 
@@ -127,3 +143,17 @@ def test_get_percentile_bad():
     val = "9"
 
     assert predict.generate_percentile(val, arr) is None
+
+
+def test_run_predict_batch(model_artifacts, listings_input):
+    """Test batch predictions keep input order and match scoring each listing on its own"""
+
+    X = listings_input.dropna().head(5)
+    preds, percs = predict.run_predict_batch(X.copy(), modelconfig=model_artifacts)
+
+    expected = [
+        predict.run_predict(X.iloc[[i]].reset_index(drop=True), modelconfig=model_artifacts)
+        for i in range(X.shape[0])
+    ]
+    assert preds.tolist() == [pred for pred, _ in expected]
+    assert percs.tolist() == [perc for _, perc in expected]
@@ -0,0 +1,73 @@
+import sys
+import pytest
+
+sys.path.append("./")
+sys.path.append("./src")
+
+import src.predict as predict
+import src.model_registry as model_registry
+from src.prediction_cache import PredictionCache, listing_key, run_predict_cached
+
+
+def test_prediction_cache_lru():
+    """Test the least recently used entry is evicted once the cache is full"""
+
+    cache = PredictionCache(2)
+    cache.put("a", 1, (1.0, 10.0))
+    cache.put("b", 1, (2.0, 20.0))
+    assert cache.get("a", 1) == (1.0, 10.0)
+    cache.put("c", 1, (3.0, 30.0))
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == (1.0, 10.0)
+    assert cache.get("c", 1) == (3.0, 30.0)
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 1
+
+
+def test_prediction_cache_generation():
+    """Test a lookup with artifacts from a new model generation empties the cache"""
+
+    cache = PredictionCache(10)
+    cache.put("a", 1, (1.0, 10.0))
+
+    assert cache.get("a", 2) is None
+    assert cache.stats()["size"] == 0
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_listing_key(model_artifacts, listings_input):
+    """Test equivalent inputs share a key and a changed field does not"""
+
+    features = model_registry.get_artifacts(model_artifacts)["config"][
+        "generate_features"
+    ]["SELECT_FEATURES"]
+    X = listings_input.head(1).reset_index(drop=True)
+    X_equivalent = X.copy()
+    X_equivalent["host_listings_count"] = X_equivalent["host_listings_count"].astype(float)
+    X_equivalent["room_type"] = X_equivalent["room_type"] + " "
+    X_changed = X.copy()
+    X_changed["price"] = X_changed["price"] + 1
+
+    assert listing_key(X, features) == listing_key(X_equivalent, features)
+    assert listing_key(X, features) != listing_key(X_changed, features)
+
+
+def test_run_predict_cached(model_artifacts, listings_input):
+    """Test a repeated listing is served from the cache with the same result, and a reload invalidates it"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    cache = PredictionCache(10)
+    X = listings_input.dropna().head(1).reset_index(drop=True)
+
+    expected = predict.run_predict(X.copy(), artifacts=artifacts)
+    assert run_predict_cached(X.copy(), artifacts, cache) == expected
+    assert run_predict_cached(X.copy(), artifacts, cache) == expected
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    reloaded = model_registry.reload_artifacts(model_artifacts)
+    assert run_predict_cached(X.copy(), reloaded, cache) == expected
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["invalidations"] == 1
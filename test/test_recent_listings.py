@@ -0,0 +1,67 @@
+import sys
+import datetime
+import sqlalchemy as sql
+
+sys.path.append("./")
+sys.path.append("./src")
+
+from src.create_db import create_db, Listings
+from src.recent_listings import RecentListings, query_recent_listings
+
+
+def _engine_with_listings(tmp_path, n):
+    engine_string = "sqlite:///{}".format(tmp_path / "test.db")
+    create_db(engine_string)
+    engine = sql.create_engine(engine_string)
+    start = datetime.datetime(2020, 1, 1)
+    rows = [
+        {"price": float(i), "created_at": start + datetime.timedelta(minutes=i)}
+        for i in range(n)
+    ]
+    with engine.begin() as conn:
+        conn.execute(Listings.__table__.insert().values(rows))
+    return engine
+
+
+def test_query_recent_listings(tmp_path):
+    """Test the newest listings are returned first, not the oldest"""
+
+    engine = _engine_with_listings(tmp_path, 15)
+    rows = query_recent_listings(engine, Listings.__table__, 10)
+
+    assert [float(row["price"]) for row in rows] == [float(i) for i in range(14, 4, -1)]
+
+
+def test_recent_listings_seed(tmp_path):
+    """Test the buffer is seeded from the database on first use and keeps only the newest `maxlen` listings"""
+
+    engine = _engine_with_listings(tmp_path, 15)
+    recent = RecentListings(lambda: engine, Listings.__table__, 5)
+
+    assert [float(row["price"]) for row in recent.rows()] == [
+        14.0,
+        13.0,
+        12.0,
+        11.0,
+        10.0,
+    ]
+
+    recent.append({"price": 100.0, "created_at": datetime.datetime(2021, 1, 1)})
+    assert [float(row["price"]) for row in recent.rows()] == [
+        100.0,
+        14.0,
+        13.0,
+        12.0,
+        11.0,
+    ]
+
+
+def test_recent_listings_seed_after_append(tmp_path):
+    """Test listings appended before seeding are not duplicated by the rows already written for them"""
+
+    engine = _engine_with_listings(tmp_path, 3)
+    recent = RecentListings(lambda: engine, Listings.__table__, 5)
+    newest = {"price": 2.0, "created_at": datetime.datetime(2020, 1, 1, 0, 2)}
+    recent.append(newest)
+
+    assert [float(row["price"]) for row in recent.rows()] == [2.0, 1.0, 0.0]
@@ -0,0 +1,36 @@
+import sys
+import pytest
+
+sys.path.append("./")
+sys.path.append("./src")
+
+import run
+from benchmarks.bench_import_time import import_profile
+
+# Packages each subcommand must not import before it starts working
+UNNEEDED_PACKAGES = {
+    "create_db": ["pandas", "sklearn", "scipy", "xgboost"],
+    "ingest": ["sklearn", "scipy", "xgboost"],
+    "clean": ["sklearn", "scipy", "xgboost"],
+    "features": ["sklearn", "scipy", "xgboost"],
+    "score": ["sklearn", "scipy", "xgboost"],
+}
+
+
+@pytest.mark.parametrize("subcommand", sorted(UNNEEDED_PACKAGES))
+def test_subcommand_imports(subcommand):
+    """Test a subcommand only imports the packages it needs"""
+
+    _, packages = import_profile(subcommand)
+
+    assert "src" in packages
+    for package in UNNEEDED_PACKAGES[subcommand]:
+        assert package not in packages
+
+
+def test_load_subcommand():
+    """Test every subcommand resolves to the function that runs it"""
+
+    for subcommand, target in run.SUBCOMMANDS.items():
+        func = run.load_subcommand(subcommand)
+        assert "{}:{}".format(func.__module__, func.__name__) == target
@@ -0,0 +1,46 @@
+import sys
+import pandas as pd
+import pytest
+
+sys.path.append("./")
+sys.path.append("./src")
+
+import src.score as score
+import src.predict as predict
+
+
+def test_score_chunks(model_artifacts, listings_input, tmp_path):
+    """Test chunked scoring writes every listing once, in input order, matching batch predictions"""
+
+    X = listings_input.dropna().reset_index(drop=True)
+    output = str(tmp_path / "scored.csv")
+    chunks = [X.iloc[i : i + 7] for i in range(0, X.shape[0], 7)]
+
+    n_rows = score.score_chunks(chunks, model_artifacts, output, n_jobs=2)
+
+    scored = pd.read_csv(output)
+    preds, _ = predict.run_predict_batch(X.copy(), modelconfig=model_artifacts)
+    assert n_rows == X.shape[0]
+    assert scored["price"].tolist() == X["price"].tolist()
+    assert scored["predicted_reviews_per_month"].tolist() == pytest.approx(preds.tolist())
+
+
+def test_score_chunk_drops_target(model_artifacts):
+    """Test the target column of already-labelled listings is not used as a model input"""
+
+    chunk = pd.read_csv("test/test_features.csv").dropna().head(3)
+    scored = score.score_chunk(chunk, model_artifacts)
+
+    assert scored["reviews_per_month"].tolist() == chunk["reviews_per_month"].tolist()
+    assert scored["predicted_reviews_per_month"].notna().all()
+
+
+def test_score_chunk_missing_inputs(model_artifacts, listings_input):
+    """Test listings with missing inputs are left unscored without failing the rest of the chunk"""
+
+    chunk = listings_input.head(20)
+    scored = score.score_chunk(chunk, model_artifacts)
+
+    complete = chunk.notna().all(axis=1).values
+    assert scored["predicted_reviews_per_month"][complete].notna().all()
+    assert scored["predicted_reviews_per_month"][~complete].isna().all()
@@ -0,0 +1,91 @@
+import sys
+import threading
+import pytest
+
+sys.path.append("./")
+sys.path.append("./src")
+
+from src.model_registry import get_artifacts
+from src.predict import run_predict
+from src.shadow import ShadowScorer, score_candidate
+
+
+@pytest.fixture
+def listings(model_artifacts, listings_input):
+    """Decoded single-listing input frames from the test features data"""
+
+    schema = get_artifacts(model_artifacts)["schema"]
+    rows = listings_input.dropna().head(5).to_dict("records")
+    return [schema.frame([schema.decode(row)]) for row in rows]
+
+
+def test_score_candidate(model_artifacts, listings):
+    """Test the candidate prediction matches scoring the listing through run_predict"""
+
+    artifacts = get_artifacts(model_artifacts)
+
+    assert score_candidate(listings[0], artifacts) == run_predict(
+        listings[0].copy(), percentile=False, artifacts=artifacts
+    )[0]
+
+
+def test_shadow_stats(model_artifacts, listings):
+    """Test every submitted listing is compared and the same model as candidate does not diverge"""
+
+    artifacts = get_artifacts(model_artifacts)
+    scorer = ShadowScorer(lambda: artifacts, workers=2, max_records=3)
+    for X in listings:
+        primary = run_predict(X.copy(), percentile=False, artifacts=artifacts)[0]
+        assert scorer.submit(X, primary, 0.001)
+    scorer.flush()
+    stats = scorer.stats()
+    scorer.stop()
+
+    assert stats["submitted"] == stats["scored"] == len(listings)
+    assert stats["records"] == len(scorer.records()) == 3
+    assert stats["max_abs_diff"] == 0.0
+    assert stats["abs_diff"]["0.5"] == 0.0
+    assert stats["mean_latency_diff_ms"] is not None
+
+
+def test_shadow_bounded(listings):
+    """Test submitting never waits: listings beyond `max_pending` are dropped while the worker is busy"""
+
+    release = threading.Event()
+
+    def get_candidate():
+        release.wait(10)
+        raise ValueError("no candidate")
+
+    scorer = ShadowScorer(get_candidate, max_pending=1)
+    queued = [scorer.submit(listings[0], 1.0, 0.001) for _ in range(5)]
+    release.set()
+    scorer.flush()
+    stats = scorer.stats()
+    scorer.stop()
+
+    assert not all(queued)
+    assert stats["dropped"] == queued.count(False)
+    assert stats["errors"] == queued.count(True)
+    assert stats["scored"] == 0
+    assert stats["mean_diff"] is None
+
+
+def test_shadow_cached_latency(model_artifacts, listings):
+    """Test predictions served from the prediction cache are compared without a latency difference"""
+
+    artifacts = get_artifacts(model_artifacts)
+    scorer = ShadowScorer(lambda: artifacts)
+    primary = run_predict(listings[0].copy(), percentile=False, artifacts=artifacts)[0]
+    scorer.submit(listings[0], primary, 0.001)
+    scorer.submit(listings[0], primary)
+    scorer.flush()
+    stats = scorer.stats()
+    records = scorer.records()
+    scorer.stop()
+
+    assert stats["scored"] == 2
+    assert stats["cached"] == 1
+    assert records[1]["primary_ms"] is None and records[1]["latency_diff_ms"] is None
+    assert records[1]["candidate_ms"] > 0
+    assert stats["mean_latency_diff_ms"] == records[0]["latency_diff_ms"]
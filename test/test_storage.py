@@ -0,0 +1,174 @@
+import io
+import gzip
+import argparse
+import functools
+import threading
+import http.server
+import pandas as pd
+import pytest
+import yaml
+
+import sys
+
+sys.path.append("./")
+sys.path.append("./src")
+
+import src.storage as storage
+import src.clean_data as clean_data
+import src.ingest_data as ingest_data
+from src.model_config import ConfigError, load_config
+
+
+@pytest.fixture(params=["local", "memory", "s3", "cached"])
+def store(request, tmp_path):
+    """Each storage backend, with S3 served by the local S3 stand-in"""
+
+    if request.param == "local":
+        return storage.LocalStorage(str(tmp_path / "store"))
+    if request.param == "memory":
+        return storage.MemoryStorage()
+    request.getfixturevalue("s3_server")
+    if request.param == "s3":
+        return storage.S3Storage("bucket")
+    return storage.CachedStorage(storage.S3Storage("bucket"), str(tmp_path / "cache"))
+
+
+def test_round_trip(store, tmp_path):
+    """Test objects stored from files and streams read back intact, and the bytes moved are counted"""
+
+    (tmp_path / "a.csv").write_bytes(b"id,price\n1,100\n")
+
+    assert store.put_file(str(tmp_path / "a.csv"), "data/a.csv") == 15
+    assert store.put_fileobj(io.BytesIO(b"id\n2\n"), "data/b.csv") == 5
+    assert store.get_file("data/a.csv", str(tmp_path / "out" / "a.csv")) == 15
+    with store.open("data/b.csv") as f:
+        assert f.read() == b"id\n2\n"
+
+    assert (tmp_path / "out" / "a.csv").read_bytes() == b"id,price\n1,100\n"
+    assert store.read_bytes("data/a.csv").read() == b"id,price\n1,100\n"
+    assert store.exists("data/a.csv")
+    store.delete("data/a.csv")
+    assert not store.exists("data/a.csv")
+    with pytest.raises(IOError):
+        store.open("data/a.csv")
+
+    stats = store.stats()
+    assert stats["bytes_written"] == 20
+    assert stats["writes"] == 2
+    # Reads through the cache tier are served from the local copies written with the objects
+    assert stats["bytes_read"] + stats.get("bytes_cached", 0) > 0
+
+
+def test_version_changes(store):
+    """Test the version of an object changes when it is replaced"""
+
+    assert store.version("a.csv") is None
+    store.put_fileobj(io.BytesIO(b"1"), "a.csv")
+    first = store.version("a.csv")
+    store.put_fileobj(io.BytesIO(b"22"), "a.csv")
+
+    assert first is not None
+    assert store.version("a.csv") != first
+
+
+def test_cached_reuses_local_copy(s3_server, tmp_path):
+    """Test an object written through the cache is read back from the local copy until it is replaced in S3"""
+
+    cached = storage.CachedStorage(storage.S3Storage("bucket"), str(tmp_path / "cache"))
+    cached.put_fileobj(io.BytesIO(b"id\n1\n"), "raw.csv")
+
+    with cached.open("raw.csv") as f:
+        assert f.read() == b"id\n1\n"
+    assert not [r for r in s3_server.requests if r[0] == "GET"]
+
+    # Replaced by another machine, so the stale local copy is downloaded again
+    s3_server.objects[("bucket", "raw.csv")] = b"id\n2\n"
+    with cached.open("raw.csv") as f:
+        assert f.read() == b"id\n2\n"
+    with cached.open("raw.csv") as f:
+        assert f.read() == b"id\n2\n"
+
+    stats = cached.stats()
+    assert (stats["cache_hits"], stats["cache_misses"]) == (2, 1)
+    assert stats["bytes_read"] == 5
+    assert len([r for r in s3_server.requests if r[0] == "GET"]) == 1
+
+
+def test_incomplete_backend():
+    """Test a backend that does not implement every storage method cannot be created"""
+
+    class ReadOnlyStorage(storage.Storage):
+        def open(self, key):
+            return io.BytesIO(b"")
+
+    with pytest.raises(TypeError):
+        ReadOnlyStorage()
+
+
+def test_open_storage(tmp_path):
+    """Test the configured backend is opened, behind the cache tier for S3"""
+
+    config = {"storage": {"BACKEND": "s3", "CACHE_DIR": str(tmp_path)}}
+    cached = storage.open_storage(config, "bucket")
+    local = storage.open_storage({"storage": {"BACKEND": "local"}})
+
+    assert isinstance(cached, storage.CachedStorage)
+    assert cached.store.bucket == "bucket"
+    assert isinstance(local, storage.LocalStorage)
+    assert storage.open_storage({"storage": {"BACKEND": "memory"}}) is storage._MEMORY
+    with pytest.raises(ConfigError):
+        storage.open_storage({"storage": {"BACKEND": "ftp"}})
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def test_ingest_then_clean_skips_download(s3_server, tmp_path):
+    """Test the clean stage reads the raw data the ingest stage stored on this machine without downloading it"""
+
+    with open("test/test_listings-raw.csv", "rb") as f:
+        (tmp_path / "listings.csv.gz").write_bytes(gzip.compress(f.read()))
+    handler = functools.partial(_QuietHandler, directory=str(tmp_path))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with open("config/modelconfig.yml", "r") as f:
+        modelconfig = yaml.load(f, Loader=yaml.FullLoader)
+    modelconfig["storage"]["CACHE_DIR"] = str(tmp_path / "cache")
+    modelconfig["data_files"]["DATA_FILENAME_INGEST_MANIFEST"] = str(
+        tmp_path / "manifest.json"
+    )
+    config_file = str(tmp_path / "modelconfig.yml")
+    with open(config_file, "w") as f:
+        yaml.dump(modelconfig, f)
+    raw_key = load_config(config_file).s3_objects["S3_OBJECT_DATA_RAW"]
+
+    try:
+        ingest_data.run_ingest_data(
+            argparse.Namespace(
+                config=config_file,
+                url="http://127.0.0.1:{}/listings.csv.gz".format(
+                    server.server_address[1]
+                ),
+                s3_bucket_name="bucket",
+                data_path=str(tmp_path),
+            )
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+    clean_data.run_clean_data(
+        argparse.Namespace(
+            config=config_file,
+            s3_bucket_name="bucket",
+            input=None,
+            output=str(tmp_path / "clean.csv"),
+            keep_raw=False,
+        )
+    )
+
+    assert ("bucket", raw_key) in s3_server.objects
+    assert not [r for r in s3_server.requests if r[0] == "GET"]
+    assert pd.read_csv(str(tmp_path / "clean.csv")).shape[0] > 0
@@ -1,9 +1,11 @@
 import os
 import sys
 import pathlib
+import argparse
 import pandas as pd
 import numpy as np
 import math
+import pickle as pkl
 import logging
 import logging.config
 import pytest
@@ -18,6 +20,8 @@ sys.path.append("./src")
 sys.path.append("./data")
 
 import src.train_model as train_model
+from src.model_config import load_config
+from src.tree_engine import FlatTreeEnsemble
 
 
 def test_get_imputed_values():
@@ -204,3 +208,103 @@ def test_evaluate_model_bad():
     metrics = train_model.evaluate_model(model, X_train, X_test, y_train, y_test)
 
     assert metrics is None
+
+
+def test_get_percentile_index():
+    """Test the percentile index is the sorted target values without missing values"""
+
+    y = pd.Series([2.5, np.nan, 0.1, 1.0])
+
+    assert train_model.get_percentile_index(y).tolist() == [0.1, 1.0, 2.5]
+
+
+def test_lite_model(model_artifacts):
+    """Test training writes the lite model and compares it with the full model in the metrics file"""
+
+    config = load_config(model_artifacts)
+    settings = config["train_model"]["lite_model_settings"]
+    lite = FlatTreeEnsemble.load(config.model_files["MODEL_FILENAME_LITE"])
+    flat = FlatTreeEnsemble.load(config.model_files["MODEL_FILENAME_FLAT"])
+    metrics = pd.read_csv(config.model_files["MODEL_FILENAME_METRICS"])
+
+    assert lite.threshold.dtype == np.float32
+    assert lite.value.dtype == np.float32
+    assert lite.max_depth <= settings["max_depth"]
+    assert lite.nbytes < flat.nbytes
+    assert metrics["Model"].tolist() == ["tmo", "flat", "lite", "student"]
+    assert metrics["Test R2 Delta"][0] == 0
+    assert (metrics["Model Bytes"] > 0).all()
+    assert (metrics["Predict ms"] > 0).all()
+
+
+def test_synthetic_samples():
+    """Test synthetic rows keep a valid one-hot encoding and only take values seen in each column"""
+
+    X = pd.DataFrame(
+        {
+            "price": [1.0, 2.0, 3.0, 4.0],
+            "room_type_a": [1.0, 0.0, 0.0, 0.0],
+            "room_type_b": [0.0, 1.0, 0.0, 1.0],
+        }
+    )
+    samples = train_model.synthetic_samples(
+        X, 500, groups=[["room_type_a", "room_type_b"]], seed=423
+    )
+
+    assert samples.shape == (500, 3)
+    assert samples["price"].isin(X["price"]).all()
+    assert (samples["room_type_a"] + samples["room_type_b"] <= 1).all()
+
+
+def test_onehot_groups():
+    """Test the one-hot columns of each feature are taken from the encoder, even when one name prefixes another"""
+
+    df = pd.DataFrame(
+        {
+            "room": ["a", "b", "c", "a"],
+            "room_type": ["x", "y", "x", "y"],
+        }
+    )
+    df_enc, enc = train_model.encode_variables(df, ["room", "room_type"])
+
+    groups = train_model.onehot_groups(enc, ["room", "room_type"])
+
+    assert groups == [["room_b", "room_c"], ["room_type_y"]]
+    assert sorted(c for group in groups for c in group) == sorted(df_enc.columns)
+
+
+def test_student_model(model_artifacts):
+    """Test training distills a student model and records its fidelity and latency in the metrics file"""
+
+    config = load_config(model_artifacts)
+    with open(config.model_files["MODEL_FILENAME_STUDENT"], "rb") as f:
+        student = pkl.load(f)
+    metrics = pd.read_csv(config.model_files["MODEL_FILENAME_METRICS"])
+    row = metrics[metrics["Model"] == "student"].iloc[0]
+
+    assert type(student).__name__ == "GradientBoostingRegressor"
+    assert student.n_estimators == 20
+    assert row["Fidelity R2"] > 0
+    assert row["Model Bytes"] > 0
+    assert row["Predict ms"] > 0
+
+
+def test_train_twice(model_artifacts, tmp_path):
+    """Test training again in the same process starts from the configured settings, not the ones changed by the first run"""
+
+    args = argparse.Namespace(
+        config=model_artifacts,
+        input="test/test_features.csv",
+        output=str(tmp_path),
+        use_existing_params=True,
+        upload=False,
+        s3_bucket_name=None,
+    )
+    train_model.run_train_model(args)
+    with open(str(tmp_path / "model.pkl"), "rb") as f:
+        model = pkl.load(f)
+
+    assert [name for name, _ in model.estimators] == ["rf", "gb", "xgb"]
+    assert load_config(model_artifacts)["train_model"]["voting_model_settings"][
+        "estimators"
+    ] == ["rf", "gb", "xgb"]
@@ -0,0 +1,207 @@
+import os
+import sys
+import pickle as pkl
+import numpy as np
+import pytest
+import yaml
+
+sys.path.append("./")
+sys.path.append("./src")
+
+import src.predict as predict
+import src.model_registry as model_registry
+from src.tree_engine import FlatTreeEnsemble
+
+
+def _transformed_input(artifacts, listings_input):
+    return predict.prepare_input(
+        listings_input.dropna().reset_index(drop=True), artifacts
+    )
+
+
+def test_flat_model_matches_predict(model_artifacts, listings_input):
+    """Test the flattened voting ensemble reproduces `model.predict`"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    X = _transformed_input(artifacts, listings_input)
+    flat = FlatTreeEnsemble.from_model(artifacts["model"])
+
+    np.testing.assert_allclose(
+        flat.predict(X), artifacts["model"].predict(X), rtol=1e-5, atol=1e-5
+    )
+
+
+def test_flat_estimators_match_predict(model_artifacts, listings_input):
+    """Test each member of the ensemble flattens on its own, including blocks of rows and missing values"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    X = _transformed_input(artifacts, listings_input).values
+    for estimator in artifacts["model"].estimators_:
+        flat = FlatTreeEnsemble.from_model(estimator)
+        flat.BLOCK_SIZE = 7
+
+        np.testing.assert_allclose(
+            flat.predict(X), estimator.predict(X), rtol=1e-5, atol=1e-5
+        )
+
+    # XGBoost sends missing values down each split's default branch
+    xgb = artifacts["model"].estimators_[-1]
+    X_missing = X.copy()
+    X_missing[::2, :3] = np.nan
+    np.testing.assert_allclose(
+        FlatTreeEnsemble.from_model(xgb).predict(X_missing),
+        xgb.predict(X_missing),
+        rtol=1e-5,
+        atol=1e-5,
+    )
+
+
+def test_flat_model_save_load(model_artifacts, listings_input, tmp_path):
+    """Test the flattened model exported by `run_train_model` loads and predicts like the in-memory one"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    X = _transformed_input(artifacts, listings_input)
+    loaded = FlatTreeEnsemble.load(
+        artifacts["config"]["model_files"]["MODEL_FILENAME_FLAT"]
+    )
+
+    flat = FlatTreeEnsemble.from_model(artifacts["model"])
+    flat.save(str(tmp_path / "model-flat.npz"))
+    reloaded = FlatTreeEnsemble.load(str(tmp_path / "model-flat.npz"))
+
+    assert loaded.n_trees == flat.n_trees
+    assert reloaded.feature_names == X.columns.tolist()
+    assert np.array_equal(loaded.predict(X), flat.predict(X))
+    assert np.array_equal(reloaded.predict(X), flat.predict(X))
+
+
+def test_flat_model_bad():
+    """Test a model without trees cannot be flattened"""
+
+    with pytest.raises(ValueError):
+        FlatTreeEnsemble.from_model(object())
+
+
+def test_select_model(model_artifacts):
+    """Test the flat engine serves small batches and sklearn serves large ones or when disabled"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    max_rows = artifacts["config"]["serving"]["FLAT_MAX_ROWS"]
+
+    assert isinstance(artifacts["flat_model"], FlatTreeEnsemble)
+    assert predict.select_model(artifacts, 1) is artifacts["flat_model"]
+    assert predict.select_model(artifacts, max_rows + 1) is artifacts["model"]
+    assert (
+        predict.select_model(dict(artifacts, flat_model=None), 1) is artifacts["model"]
+    )
+
+
+def test_flat_engine_disabled(model_artifacts, tmp_path):
+    """Test the registry does not build the flattened model when the sklearn engine is configured"""
+
+    with open(model_artifacts, "r") as f:
+        modelconfig = yaml.load(f, Loader=yaml.FullLoader)
+    modelconfig["serving"]["ENGINE"] = "sklearn"
+    config_file = str(tmp_path / "modelconfig.yml")
+    with open(config_file, "w") as f:
+        yaml.dump(modelconfig, f)
+
+    assert model_registry.load_artifacts(config_file)["flat_model"] is None
+
+
+def test_flat_model_fingerprint(model_artifacts, listings_input, tmp_path):
+    """Test the flattened model artifact is only served with the pickle it was flattened from"""
+
+    artifacts = model_registry.load_artifacts(model_artifacts)
+    X = _transformed_input(artifacts, listings_input)
+    other = artifacts["model"].estimators_[0]
+    other_file = str(tmp_path / "model.pkl")
+    with open(other_file, "wb") as f:
+        pkl.dump(other, f)
+
+    overridden = model_registry.load_artifacts(model_artifacts, model_file=other_file)
+    # Written from another model object into the configured flattened model file
+    flat_file = artifacts["config"].model_files["MODEL_FILENAME_FLAT"]
+    exported = str(tmp_path / "model-flat.npz")
+    os.replace(flat_file, exported)
+    try:
+        FlatTreeEnsemble.from_model(other).save(flat_file)
+        stale = model_registry.load_artifacts(model_artifacts)
+    finally:
+        os.replace(exported, flat_file)
+
+    assert artifacts["flat_model"].source_sha256 is not None
+    assert isinstance(artifacts["flat_model"].threshold, np.memmap)
+    np.testing.assert_allclose(
+        overridden["flat_model"].predict(X), other.predict(X), rtol=1e-5, atol=1e-5
+    )
+    np.testing.assert_allclose(
+        stale["flat_model"].predict(X),
+        artifacts["model"].predict(X),
+        rtol=1e-5,
+        atol=1e-5,
+    )
+
+
+def test_flat_model_mmap(model_artifacts, listings_input, tmp_path):
+    """Test the flattened model memory-mapped from its `.npz` file predicts like the one read into memory"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    X = _transformed_input(artifacts, listings_input)
+    flat_file = str(tmp_path / "model-flat.npz")
+    FlatTreeEnsemble.from_model(artifacts["model"]).save(flat_file)
+
+    loaded = FlatTreeEnsemble.load(flat_file)
+    mapped = FlatTreeEnsemble.load(flat_file, mmap_mode="r")
+
+    assert isinstance(mapped.threshold, np.memmap)
+    assert isinstance(mapped._children, np.memmap)
+    assert mapped.feature_names == loaded.feature_names
+    assert np.array_equal(mapped.predict(X), loaded.predict(X))
+
+
+def test_flat_model_compressed(model_artifacts, listings_input):
+    """Test dropping boosting rounds and cutting trees predicts like the truncated models"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    X = _transformed_input(artifacts, listings_input)
+    rf, gb, xgb = artifacts["model"].estimators_
+
+    # The first rounds of a boosted model predict like the model after that many rounds
+    staged = list(gb.staged_predict(X))[4]
+    np.testing.assert_allclose(
+        FlatTreeEnsemble.from_model(gb, max_rounds=5).predict(X), staged, atol=1e-5
+    )
+    np.testing.assert_allclose(
+        FlatTreeEnsemble.from_model(xgb, max_rounds=5).predict(X),
+        xgb.predict(X, iteration_range=(0, 5)),
+        rtol=1e-5,
+        atol=1e-5,
+    )
+
+    # A tree cut at its root predicts the mean of the training targets
+    stump = FlatTreeEnsemble.from_model(rf.estimators_[0], max_depth=0)
+    assert stump.max_depth == 0
+    np.testing.assert_allclose(
+        stump.predict(X), rf.estimators_[0].tree_.value[0, 0, 0], atol=1e-5
+    )
+
+    lite = FlatTreeEnsemble.from_model(
+        artifacts["model"], max_rounds=10, max_depth=3, dtype="float32"
+    )
+    flat = FlatTreeEnsemble.from_model(artifacts["model"])
+    assert lite.max_depth <= 3
+    assert lite.threshold.dtype == np.float32
+    assert lite.nbytes < flat.nbytes
+    assert np.all(np.isfinite(lite.predict(X)))
+
+
+def test_flat_model_float32(model_artifacts, listings_input):
+    """Test float32 thresholds split float32 inputs exactly like the float64 ones"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    X = _transformed_input(artifacts, listings_input)
+    flat = FlatTreeEnsemble.from_model(artifacts["model"])
+    flat32 = FlatTreeEnsemble.from_model(artifacts["model"], dtype="float32")
+
+    np.testing.assert_allclose(flat32.predict(X), flat.predict(X), rtol=1e-5, atol=1e-5)
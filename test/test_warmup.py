@@ -0,0 +1,32 @@
+import sys
+import numpy as np
+import pytest
+
+sys.path.append("./")
+sys.path.append("./src")
+
+import src.model_registry as model_registry
+from src.warmup import synthetic_listings, warm_up_model
+
+
+def test_synthetic_listings(model_artifacts):
+    """Test the synthetic listings have every input feature and cover every category of the encoder"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+    config = artifacts["config"]
+    X = synthetic_listings(artifacts)
+
+    assert X.columns.tolist() == config["generate_features"]["SELECT_FEATURES"]
+    for col, categories in zip(
+        config["train_model"]["COLS_CAT"], artifacts["encoder"].categories_
+    ):
+        assert set(X[col]) == set(categories)
+    assert artifacts["transform"].transform_frame(X.iloc[[0]]).notnull().all().all()
+
+
+def test_warm_up_model(model_artifacts):
+    """Test warm-up scores every synthetic listing"""
+
+    artifacts = model_registry.get_artifacts(model_artifacts)
+
+    assert warm_up_model(artifacts) == synthetic_listings(artifacts).shape[0]
@@ -0,0 +1,120 @@
+import sys
+import time
+import sqlalchemy as sql
+
+sys.path.append("./")
+sys.path.append("./src")
+
+from src.create_db import create_db, Listings
+from src.write_behind import WriteBehindQueue
+
+
+def _listing(listings_input, i):
+    listing = listings_input.iloc[i % listings_input.shape[0]].to_dict()
+    listing["reviews_per_month"] = 1.5
+    return listing
+
+
+def _count(engine):
+    with engine.connect() as conn:
+        return conn.execute(
+            sql.select([sql.func.count()]).select_from(Listings.__table__)
+        ).scalar()
+
+
+def _engine(tmp_path):
+    engine_string = "sqlite:///{}".format(tmp_path / "test.db")
+    create_db(engine_string)
+    return sql.create_engine(engine_string)
+
+
+def test_write_behind_batches(tmp_path, listings_input):
+    """Test queued rows are written in batched inserts of at most `batch_size` rows"""
+
+    engine = _engine(tmp_path)
+    writer = WriteBehindQueue(
+        lambda: engine, Listings.__table__, batch_size=4, flush_seconds=0.2
+    )
+    for i in range(10):
+        assert writer.put(_listing(listings_input, i))
+    writer.flush()
+
+    assert _count(engine) == 10
+    assert writer.stats()["rows_written"] == 10
+    assert writer.stats()["batches_written"] == 3
+    writer.stop()
+
+
+def test_write_behind_parameters(tmp_path, listings_input):
+    """Test each row of a batch is bound separately, so no statement exceeds SQLite's 999 parameter limit"""
+
+    engine = _engine(tmp_path)
+    params = []
+
+    @sql.event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        rows = parameters if executemany else [parameters]
+        params.append(max(len(row) for row in rows))
+
+    writer = WriteBehindQueue(
+        lambda: engine, Listings.__table__, batch_size=500, flush_seconds=0.2
+    )
+    for i in range(500):
+        assert writer.put(_listing(listings_input, i))
+    writer.flush()
+    writer.stop()
+
+    assert _count(engine) == 500
+    assert max(params) < 999
+
+
+def test_write_behind_flush_interval(tmp_path, listings_input):
+    """Test a partial batch is written once it has waited `flush_seconds`"""
+
+    engine = _engine(tmp_path)
+    writer = WriteBehindQueue(
+        lambda: engine, Listings.__table__, batch_size=100, flush_seconds=0.05
+    )
+    writer.put(_listing(listings_input, 0))
+
+    deadline = time.monotonic() + 5
+    while _count(engine) == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert _count(engine) == 1
+    writer.stop()
+
+
+def test_write_behind_stop_drains(tmp_path, listings_input):
+    """Test stopping the queue writes every pending row"""
+
+    engine = _engine(tmp_path)
+    writer = WriteBehindQueue(
+        lambda: engine, Listings.__table__, batch_size=100, flush_seconds=60
+    )
+    for i in range(25):
+        writer.put(_listing(listings_input, i))
+    writer.stop()
+
+    assert _count(engine) == 25
+    assert writer.stats()["queued"] == 0
+
+
+def test_write_behind_full(tmp_path, listings_input):
+    """Test a full queue refuses rows instead of blocking the request, and failed inserts are counted"""
+
+    def broken_engine():
+        raise RuntimeError("database unavailable")
+
+    writer = WriteBehindQueue(
+        broken_engine,
+        Listings.__table__,
+        batch_size=1,
+        flush_seconds=60,
+        max_queue=1,
+        retries=0,
+    )
+    accepted = [writer.put(_listing(listings_input, i)) for i in range(5)]
+    writer.stop()
+
+    assert not all(accepted)
+    assert writer.stats()["rows_dropped"] == sum(accepted)
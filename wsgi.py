@@ -0,0 +1,10 @@
+"""WSGI entry point for serving the Flask app with a pre-forking server, e.g.
+
+    gunicorn -c config/gunicorn.conf.py wsgi:application
+
+The model artifacts are loaded when this module is imported. With `preload_app = True` that happens once in
+the server's master process, before the workers are forked.
+"""
+from app import create_app
+
+application = create_app(preload=True)